@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import inspect
+import json
+import platform
+import sys
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+from benchmarks import bench_api, bench_pipeline
+from benchmarks.harness import Metric
+
+BASELINE = Path(__file__).with_name("baseline.json")
+MODULES = {"pipeline": bench_pipeline, "api": bench_api}
+
+# A bench_ function, sync or async, returning its metrics by name
+Benchmark = Callable[[], dict[str, Metric] | Awaitable[dict[str, Metric]]]
+
+
+def collect(keyword: str) -> dict[str, Benchmark]:
+    benchmarks = {}
+    for prefix, module in MODULES.items():
+        for name, fn in inspect.getmembers(module, inspect.isfunction):
+            full_name = f"{prefix}.{name.removeprefix('bench_')}"
+            if name.startswith("bench_") and keyword in full_name:
+                benchmarks[full_name] = fn
+    return benchmarks
+
+
+def run(benchmarks: dict[str, Benchmark]) -> dict[str, Metric]:
+    results = {}
+    for name, fn in benchmarks.items():
+        metrics = asyncio.run(fn()) if inspect.iscoroutinefunction(fn) else fn()
+        for metric_name, metric in metrics.items():
+            full_name = f"{name}.{metric_name}"
+            results[full_name] = metric
+            print(f"{full_name:<36} {_format(metric)}", flush=True)
+    return results
+
+
+def compare(results: dict[str, Metric], baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, metric in results.items():
+        if not metric.compare or name not in baseline:
+            continue
+        previous = baseline[name]["value"]
+        change = (metric.value - previous) / previous if previous else 0.0
+        worse = -change if metric.higher_is_better else change
+        if worse > tolerance:
+            regressions.append((name, previous, metric, worse))
+    return regressions
+
+
+def _format(metric: Metric) -> str:
+    if metric.unit == "s":
+        return f"{metric.value * 1_000_000:12.1f} us"
+    return f"{metric.value:12.1f} {metric.unit}"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the API and the measurement pipeline",
+    )
+    parser.add_argument("-k", "--keyword", default="", help="only run matching")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="relative slowdown reported as a regression (default 0.3)",
+    )
+    args = parser.parse_args()
+
+    results = run(collect(args.keyword))
+
+    if args.save_baseline:
+        stored = {}
+        if args.baseline.exists():
+            stored = json.loads(args.baseline.read_text())["benchmarks"]
+        stored.update(
+            {
+                name: {
+                    "value": metric.value,
+                    "unit": metric.unit,
+                    "higher_is_better": metric.higher_is_better,
+                }
+                for name, metric in results.items()
+            }
+        )
+        args.baseline.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "benchmarks": dict(sorted(stored.items())),
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}, run with --save-baseline")
+        return 0
+    baseline = json.loads(args.baseline.read_text())["benchmarks"]
+    regressions = compare(results, baseline, args.tolerance)
+    for name, previous, metric, worse in regressions:
+        print(
+            f"REGRESSION {name}: {_format(Metric(previous, metric.unit)).strip()}"
+            f" -> {_format(metric).strip()} ({worse:+.0%} worse)"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+from pathlib import Path
+
+import httpx
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from benchmarks.bench_pipeline import FAKE_CLI, serving_standin
+from benchmarks.harness import (
+    Metric,
+    drive,
+    load_metrics,
+    summarize,
+    time_async_calls,
+    time_calls,
+)
+from src.models.history import HistoryResponse
+from src.models.speedresponse import SpeedMeasurement
+from src.repositories.history import METRICS, HistoryRepository
+from src.responses import ModelResponse
+from src.services.admission import AdmissionController, RateLimitedError
+from src.services.history import to_history_response
+from src.sketch import DDSketch
+
+CONCURRENCY = 32
+
+# A week of one-minute buckets is about the most /speed/history returns
+HISTORY_BUCKETS = 10_000
+
+
+@asynccontextmanager
+async def running_api(**environ: str):
+    # The API runs in its own process so the load driver does not compete
+    # with it for the GIL
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "src.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        env={**os.environ, "NETSPEED_SPEEDTEST_CLI_PATH": FAKE_CLI, **environ},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(
+            base_url=base_url,
+            timeout=60,
+            limits=httpx.Limits(max_connections=CONCURRENCY),
+        ) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            yield client
+    finally:
+        process.terminate()
+        process.wait()
+
+
+async def root_during_speedtest(executor: str) -> dict[str, Metric]:
+    # GET / latency while the native engine moves data as fast as loopback
+    # allows, measured on the API's loop or in an executor
+    with serving_standin() as url:
+        async with running_api(
+            NETSPEED_ENGINE="native",
+            NETSPEED_NATIVE_SERVER_URL=url,
+            NETSPEED_NATIVE_WARMUP="0.2",
+            NETSPEED_NATIVE_DURATION="2",
+            NETSPEED_EXECUTOR=executor,
+        ) as client:
+            speedtest = asyncio.create_task(client.get("/speed?max_age=0"))
+            samples = []
+            while not speedtest.done():
+                started = time.perf_counter()
+                await client.get("/")
+                samples.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+            (await speedtest).raise_for_status()
+            return summarize(samples)
+
+
+async def bench_root_during_speedtest_inline() -> dict[str, Metric]:
+    return await root_during_speedtest("inline")
+
+
+async def bench_root_during_speedtest_process() -> dict[str, Metric]:
+    return await root_during_speedtest("process")
+
+
+async def bench_speed_cached() -> dict[str, Metric]:
+    # GET /speed answered from the result cache
+    async with running_api() as client:
+        await client.get("/speed")
+        return load_metrics(
+            *await drive(lambda: client.get("/speed"), CONCURRENCY, 3000)
+        )
+
+
+async def bench_speed_uncached() -> dict[str, Metric]:
+    # GET /speed?max_age=0 with a 200ms speedtest: concurrent callers coalesce
+    # onto one subprocess at a time
+    async with running_api(FAKE_SPEEDTEST_DELAY="0.2") as client:
+        return load_metrics(
+            *await drive(lambda: client.get("/speed?max_age=0"), CONCURRENCY, 320)
+        )
+
+
+def _history() -> HistoryResponse:
+    buckets = []
+    for index in range(HISTORY_BUCKETS):
+        sketches = {metric: DDSketch() for metric in METRICS}
+        for sketch in sketches.values():
+            for value in (90.0, 95.0, 100.0):
+                sketch.add(value)
+        buckets.append((index * 60, sketches))
+    start = datetime.fromtimestamp(0, UTC)
+    end = datetime.fromtimestamp(HISTORY_BUCKETS * 60, UTC)
+    return to_history_response(start, end, 60, buckets)
+
+
+async def bench_history_encode_default() -> dict[str, Metric]:
+    # FastAPI's handling of a returned model: revalidation, conversion to
+    # Python objects and json.dumps
+    field = create_model_field("Response", HistoryResponse, mode="serialization")
+    history = _history()
+
+    async def encode():
+        content = await serialize_response(field=field, response_content=history)
+        return JSONResponse(content).body
+
+    return summarize(await time_async_calls(encode, 20, 2))
+
+
+def bench_history_encode_model() -> dict[str, Metric]:
+    # The same response encoded by ModelResponse, as /speed/history does
+    history = _history()
+    return summarize(time_calls(lambda: ModelResponse(history).body, 20, 2))
+
+
+async def bench_history() -> dict[str, Metric]:
+    # GET /speed/history returning a week of one-minute buckets, read from
+    # the rollups of an on-disk history
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "history.db")
+        repository = HistoryRepository(path)
+        for index in range(HISTORY_BUCKETS):
+            repository.append(
+                SpeedMeasurement(
+                    download_speed=95.0,
+                    upload_speed=75.0,
+                    ping=18.0,
+                    server_name="Riga",
+                    server_location="Latvia",
+                    timestamp=datetime.fromtimestamp(index * 60, UTC),
+                )
+            )
+        params = {"from": 0, "to": HISTORY_BUCKETS * 60, "step": 60}
+        async with running_api(NETSPEED_HISTORY_PATH=path) as client:
+
+            async def fetch():
+                (await client.get("/speed/history", params=params)).raise_for_status()
+
+            return summarize(await time_async_calls(fetch, 20, 2))
+
+
+def bench_admission() -> dict[str, Metric]:
+    # 1000 admission checks from clients spread over ten times more addresses
+    # than are tracked, so most of them evict one
+    admission = AdmissionController(client_rate=6, client_burst=2)
+    clients = [f"192.0.{i // 256}.{i % 256}" for i in range(100_000)]
+    position = 0
+
+    def admit_batch() -> None:
+        nonlocal position
+        for _ in range(1000):
+            try:
+                admission.admit_client(clients[position])
+            except RateLimitedError:
+                pass
+            position = (position + 7919) % len(clients)
+
+    return summarize(time_calls(admit_batch, 50, 20))
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from benchmarks.fake_speedtest_cli import OUTPUT
+from benchmarks.harness import Metric, summarize, time_async_calls, time_calls
+from benchmarks.standin import SpeedtestStandin
+from src.repositories.library import LibrarySpeedRepository
+from src.repositories.native import NativeSpeedRepository
+from src.repositories.requester import RequestRepository, parse_output
+from src.services.get_speed import SpeedService
+
+FAKE_CLI = str(Path(__file__).with_name("fake_speedtest_cli.py"))
+RAW_OUTPUT = json.dumps(OUTPUT).encode()
+
+
+@contextmanager
+def serving_standin():
+    # The stand-in runs in its own process, so its share of the work is not
+    # counted against (or slowed down by) the process being measured
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_serve_standin, args=(sender,), daemon=True)
+    process.start()
+    try:
+        yield receiver.recv()
+    finally:
+        process.terminate()
+        process.join()
+
+
+def _serve_standin(connection) -> None:
+    async def serve():
+        server = await SpeedtestStandin().start()
+        connection.send(server.url)
+        await server.server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def bench_json_parse() -> dict[str, Metric]:
+    # Decoding speedtest-cli's output the way RequestRepository does
+    return summarize(time_calls(lambda: parse_output(RAW_OUTPUT), 20_000, 1000))
+
+
+async def bench_validate() -> dict[str, Metric]:
+    # Bits/s to Mbps conversion and SpeedMeasurement validation
+    service = SpeedService(request_repository=None)
+    return summarize(
+        await time_async_calls(lambda: service._record(OUTPUT), 20_000, 1000)
+    )
+
+
+async def bench_subprocess() -> dict[str, Metric]:
+    # A full cli engine run against the fake executable: process spawn,
+    # interpreter start-up and output collection
+    os.environ.pop("FAKE_SPEEDTEST_DELAY", None)
+    repository = RequestRepository(cli_path=FAKE_CLI)
+    return summarize(await time_async_calls(repository.get_speedtest_results, 30, 3))
+
+
+class _FakeResults:
+    def __init__(self, **kwargs):
+        pass
+
+    def dict(self) -> dict:
+        return OUTPUT
+
+
+class _FakeSpeedtest:
+    # speedtest.Speedtest without the network: every step returns at once
+    def __init__(self, **kwargs):
+        self.config = {"client": OUTPUT["client"]}
+        self.best = OUTPUT["server"]
+        self._opener = None
+        self._secure = False
+
+    def get_servers(self, servers):
+        pass
+
+    def get_best_server(self, servers=None):
+        pass
+
+    def download(self):
+        pass
+
+    def upload(self):
+        pass
+
+
+async def bench_library() -> dict[str, Metric]:
+    # What a library engine test costs on top of the measurement itself: the
+    # hand-off to a worker thread and result extraction, with no process or
+    # interpreter start-up. Compare with pipeline.subprocess.
+    module = SimpleNamespace(Speedtest=_FakeSpeedtest, SpeedtestResults=_FakeResults)
+    repository = LibrarySpeedRepository(fallback=None)
+    with patch("src.repositories.library.speedtest", module):
+        return summarize(
+            await time_async_calls(repository.get_speedtest_results, 1000, 10)
+        )
+
+
+async def bench_batch() -> dict[str, Metric]:
+    # POST /speed/batch's work around five library engine tests on one warm
+    # session: recording each run and computing the spreads
+    module = SimpleNamespace(Speedtest=_FakeSpeedtest, SpeedtestResults=_FakeResults)
+    service = SpeedService(LibrarySpeedRepository(fallback=None))
+    with patch("src.repositories.library.speedtest", module):
+        return summarize(await time_async_calls(lambda: service.run_batch(5), 200, 5))
+
+
+async def bench_native_engine() -> dict[str, Metric]:
+    # Loopback throughput the native engine reaches against the stand-in; a
+    # drop means more CPU spent per byte moved
+    server = await SpeedtestStandin().start()
+    repository = NativeSpeedRepository(
+        server.url, duration=1.0, warmup=0.25, latency_samples=3
+    )
+    try:
+        results = await repository.get_speedtest_results()
+    finally:
+        await repository.aclose()
+        await server.close()
+    return {
+        "download": Metric(results["download"] / 1_000_000, "Mbps", True),
+        "upload": Metric(results["upload"] / 1_000_000, "Mbps", True),
+    }
+
+
+async def native_transfer(transfer: str) -> dict[str, Metric]:
+    # Throughput against a stand-in in another process, and the CPU time this
+    # process spends per gigabyte moved
+    with serving_standin() as url:
+        repository = NativeSpeedRepository(
+            url, duration=2.0, warmup=0.5, latency_samples=3, transfer=transfer
+        )
+        started = time.process_time()
+        try:
+            results = await repository.get_speedtest_results()
+        finally:
+            await repository.aclose()
+        cpu = time.process_time() - started
+    moved = (results["bytes_sent"] + results["bytes_received"]) / 1e9
+    return {
+        "download": Metric(results["download"] / 1_000_000, "Mbps", True),
+        "upload": Metric(results["upload"] / 1_000_000, "Mbps", True),
+        "cpu_per_gb": Metric(cpu * 1000 / moved, "ms/GB"),
+    }
+
+
+async def bench_native_adaptive() -> dict[str, Metric]:
+    # Length of an adaptive run whose phases may each last up to 1s of
+    # warm-up plus 10s, and the data it moves; a fixed run takes 22s
+    with serving_standin() as url:
+        repository = NativeSpeedRepository(
+            url, duration=10.0, warmup=1.0, latency_samples=3, adaptive=True
+        )
+        started = time.perf_counter()
+        try:
+            results = await repository.get_speedtest_results()
+        finally:
+            await repository.aclose()
+        elapsed = time.perf_counter() - started
+    moved = (results["bytes_sent"] + results["bytes_received"]) / 1e9
+    return {
+        "duration": Metric(elapsed, "s"),
+        "moved": Metric(moved, "GB", compare=False),
+    }
+
+
+async def bench_native_transfer_httpx() -> dict[str, Metric]:
+    return await native_transfer("httpx")
+
+
+async def bench_native_transfer_socket() -> dict[str, Metric]:
+    return await native_transfer("socket")
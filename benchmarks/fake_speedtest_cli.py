@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# Stand-in for speedtest-cli: prints a fixed --json result after an optional
+# FAKE_SPEEDTEST_DELAY, so benchmarks measure the service and not the network
+import json
+import os
+import sys
+import time
+
+OUTPUT = {
+    "download": 99478925.14088322,
+    "upload": 78648744.10145727,
+    "ping": 18.482,
+    "server": {
+        "url": "http://speedtest.example.net:8080/speedtest/upload.php",
+        "lat": "56.9496",
+        "lon": "24.1040",
+        "name": "Riga",
+        "country": "Latvia",
+        "cc": "LV",
+        "sponsor": "Example",
+        "id": "28935",
+        "host": "speedtest.example.net:8080",
+        "d": 2.3,
+        "latency": 18.482,
+    },
+    "timestamp": "2025-07-15T17:49:51.959712Z",
+    "bytes_sent": 99090432,
+    "bytes_received": 124735600,
+    "share": None,
+    "client": {
+        "ip": "192.0.2.10",
+        "lat": "56.9496",
+        "lon": "24.1040",
+        "isp": "Example ISP",
+        "isprating": "3.7",
+        "rating": "0",
+        "ispdlavg": "0",
+        "ispulavg": "0",
+        "loggedin": "0",
+        "country": "LV",
+    },
+}
+
+if __name__ == "__main__":
+    time.sleep(float(os.environ.get("FAKE_SPEEDTEST_DELAY", "0")))
+    json.dump(OUTPUT, sys.stdout)
@@ -0,0 +1,80 @@
+import asyncio
+import math
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+
+@dataclass
+class Metric:
+    value: float
+    unit: str
+    higher_is_better: bool = False
+    # Tail latencies are too noisy to fail a run on, they are only reported
+    compare: bool = True
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(samples: list[float], unit: str = "s") -> dict[str, Metric]:
+    return {
+        "p50": Metric(percentile(samples, 0.50), unit),
+        "p99": Metric(percentile(samples, 0.99), unit, compare=False),
+        "mean": Metric(statistics.fmean(samples), unit, compare=False),
+    }
+
+
+def time_calls(fn: Callable[[], object], rounds: int, warmup: int = 0) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def time_async_calls(
+    fn: Callable[[], Awaitable[object]], rounds: int, warmup: int = 0
+) -> list[float]:
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def drive(
+    request: Callable[[], Awaitable[object]], concurrency: int, total: int
+) -> tuple[list[float], float]:
+    # Closed-loop load: each worker sends its next request as soon as the
+    # previous one is answered, until total requests have been sent
+    latencies: list[float] = []
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+def load_metrics(latencies: list[float], elapsed: float) -> dict[str, Metric]:
+    return {
+        "rps": Metric(len(latencies) / elapsed, "req/s", higher_is_better=True),
+        **summarize(latencies),
+    }
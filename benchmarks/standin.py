@@ -0,0 +1,160 @@
+import asyncio
+import json
+import re
+
+DOWNLOAD_PATH = re.compile(r"/random(\d+)x(\d+)\.jpg$")
+WRITE_CHUNK_SIZE = 256 * 1024
+# Buffered upload bytes before the stand-in stops reading from a client
+READ_LIMIT = 4 * 1024 * 1024
+
+
+class SpeedtestStandin:
+    """Local stand-in for a speedtest.net HTTP server
+
+    Serves latency.txt, random<N>x<N>.jpg downloads and accepts upload.php
+    POSTs under /speedtest/, counting the bytes it moves.
+    """
+
+    def __init__(self):
+        self.server = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.requests = 0
+        self._payload = memoryview(bytes(WRITE_CHUNK_SIZE))
+
+    @property
+    def port(self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/speedtest/upload.php"
+
+    async def start(self) -> "SpeedtestStandin":
+        self.server = await asyncio.start_server(
+            self._handle, "127.0.0.1", 0, limit=READ_LIMIT
+        )
+        return self
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while request_line := await reader.readline():
+                method, path, _ = request_line.decode().split()
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                remaining = int(headers.get("content-length", 0))
+                while remaining:
+                    chunk = await reader.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                    self.bytes_received += len(chunk)
+
+                self.requests += 1
+                status, size = self._route(method, path, headers)
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Length: {size}\r\n\r\n".encode()
+                )
+                if method == "HEAD":
+                    size = 0
+                while size:
+                    chunk = self._payload[: min(size, WRITE_CHUNK_SIZE)]
+                    writer.write(chunk)
+                    await writer.drain()
+                    size -= len(chunk)
+                    self.bytes_sent += len(chunk)
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _route(method: str, path: str, headers: dict) -> tuple[str, int]:
+        path = path.split("?", 1)[0]
+        if method in ("GET", "HEAD") and path == "/speedtest/latency.txt":
+            return "200 OK", 10
+        if method == "GET" and (match := DOWNLOAD_PATH.search(path)):
+            width, height = int(match[1]), int(match[2])
+            return "200 OK", width * height * 2
+        if method == "POST" and path == "/speedtest/upload.php":
+            return "200 OK", len(f"size={headers.get('content-length', 0)}")
+        return "404 Not Found", 0
+
+
+class UdpEchoStandin(asyncio.DatagramProtocol):
+    """Local UDP echo server
+
+    Sends every datagram back unless told to drop the next few of them.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.received = 0
+        self.drop = 0
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.transport.get_extra_info('sockname')[1]}"
+
+    async def start(self) -> "UdpEchoStandin":
+        await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, local_addr=("127.0.0.1", 0)
+        )
+        return self
+
+    def close(self) -> None:
+        self.transport.close()
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.received += 1
+        if self.drop:
+            self.drop -= 1
+            return
+        self.transport.sendto(data, addr)
+
+
+class WebhookReceiver:
+    """Local HTTP server collecting the JSON bodies POSTed to it"""
+
+    def __init__(self):
+        self.server = None
+        self.received: asyncio.Queue[dict] = asyncio.Queue()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/hook"
+
+    async def start(self) -> "WebhookReceiver":
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while await reader.readline():
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, value = line.decode().split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.received.put_nowait(json.loads(body))
+                writer.write(b"HTTP/1.1 204 No Content\r\n\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
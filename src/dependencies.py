@@ -1,16 +1,320 @@
+import socket
+from collections.abc import Sequence
+from functools import lru_cache
 from typing import Annotated
 
 from fastapi import Depends
 
+from src.executor import MeasurementExecutor, create_executor
+from src.models.fleet import FleetTarget
+from src.repositories.base import SpeedtestRepository
+from src.repositories.coordinator import CoordinatorRepository
+from src.repositories.history import HistoryRepository
+from src.repositories.library import LibrarySpeedRepository
+from src.repositories.native import NativeSpeedRepository
+from src.repositories.probe import ProbeRepository
 from src.repositories.requester import RequestRepository
-from src.services.get_speed import SpeedService
+from src.repositories.servers import ServerCatalogRepository
+from src.repositories.shared import SharedResultStore
+from src.repositories.sites import SiteRepository
+from src.repositories.spool import SpoolRepository
+from src.repositories.webhook import WebhookRepository
+from src.services.admission import AdmissionController
+from src.services.agent import AgentService
+from src.services.fleet import FleetService
+from src.services.get_speed import MeasurementSink, SpeedService
+from src.services.health import HealthMonitor
+from src.services.history import HistoryService
+from src.services.jobs import JobManager
+from src.services.link_lock import LinkLock
+from src.services.loop_monitor import LoopLagMonitor
+from src.services.probe import LatencyProbe
+from src.services.result_cache import ResultCache
+from src.services.scheduler import SpeedtestScheduler
+from src.services.single_flight import SingleFlight
+from src.services.sites import SiteService
+from src.services.stats import SpeedStats
+from src.settings import Settings
 
 
-def get_request_repository() -> RequestRepository:
-    return RequestRepository()
+@lru_cache
+def get_settings() -> Settings:
+    return Settings.from_env()
+
+
+@lru_cache
+def get_executor() -> MeasurementExecutor | None:
+    settings = get_settings()
+    return create_executor(settings.executor, settings.executor_workers)
+
+
+@lru_cache
+def get_server_catalog() -> ServerCatalogRepository:
+    settings = get_settings()
+    return ServerCatalogRepository(
+        settings.server_cache_path, ttl=settings.server_cache_ttl
+    )
+
+
+@lru_cache
+def get_native_repository() -> NativeSpeedRepository:
+    # Shared so its pooled HTTP connections are reused between speedtests
+    settings = get_settings()
+    return NativeSpeedRepository(
+        settings.native_server_url,
+        server_name=settings.native_server_name,
+        server_location=settings.native_server_location,
+        streams=settings.native_streams,
+        duration=settings.native_duration,
+        warmup=settings.native_warmup,
+        transfer=settings.native_transfer,
+        adaptive=settings.native_adaptive,
+        tolerance=settings.native_tolerance,
+        server_catalog=get_server_catalog(),
+        executor=get_executor(),
+    )
+
+
+@lru_cache
+def get_library_repository() -> LibrarySpeedRepository:
+    # Shared so its Speedtest session is reused between speedtests
+    settings = get_settings()
+    return LibrarySpeedRepository(
+        _create_cli_repository(),
+        server_catalog=get_server_catalog(),
+        session_ttl=settings.server_cache_ttl,
+    )
+
+
+def get_request_repository() -> SpeedtestRepository:
+    settings = get_settings()
+    if settings.engine == "native":
+        return get_native_repository()
+    if settings.engine == "library":
+        return get_library_repository()
+    return _create_cli_repository()
+
+
+def _create_cli_repository() -> RequestRepository:
+    return RequestRepository(
+        server_catalog=get_server_catalog(),
+        cli_path=get_settings().speedtest_cli_path,
+        executor=get_executor(),
+    )
+
+
+@lru_cache
+def get_speed_stats() -> SpeedStats:
+    return SpeedStats()
+
+
+@lru_cache
+def get_health_monitor() -> HealthMonitor:
+    settings = get_settings()
+    webhook = (
+        WebhookRepository(settings.health_webhook_url)
+        if settings.health_webhook_url
+        else None
+    )
+    return HealthMonitor(
+        alpha=settings.health_alpha,
+        slack=settings.health_slack,
+        threshold=settings.health_threshold,
+        warmup=settings.health_warmup,
+        min_deviation=settings.health_min_deviation,
+        webhook=webhook,
+        cooldown=settings.health_webhook_cooldown,
+    )
+
+
+@lru_cache
+def get_history_repository() -> HistoryRepository:
+    return HistoryRepository(get_settings().history_path)
+
+
+@lru_cache
+def get_single_flight() -> SingleFlight:
+    return SingleFlight()
+
+
+@lru_cache
+def get_shared_store() -> SharedResultStore | None:
+    path = get_settings().shared_state_path
+    return SharedResultStore(path) if path else None
+
+
+@lru_cache
+def get_link_lock() -> LinkLock:
+    return LinkLock(get_shared_store())
+
+
+@lru_cache
+def get_result_cache() -> ResultCache:
+    settings = get_settings()
+    return ResultCache(
+        ttl=settings.cache_ttl,
+        stale_ttl=settings.cache_stale_ttl,
+        shared=get_shared_store(),
+    )
+
+
+@lru_cache
+def get_admission_controller() -> AdmissionController:
+    settings = get_settings()
+    return AdmissionController(
+        client_rate=settings.rate_limit_client_per_hour,
+        client_burst=settings.rate_limit_client_burst,
+        global_limit=settings.rate_limit_global_per_hour,
+        reserved=settings.rate_limit_reserved,
+        max_clients=settings.rate_limit_max_clients,
+    )
+
+
+@lru_cache
+def get_job_manager() -> JobManager:
+    return JobManager(
+        max_retained=get_settings().job_retention, shared=get_shared_store()
+    )
+
+
+@lru_cache
+def get_fleet_service() -> FleetService:
+    settings = get_settings()
+
+    def create_repository(target: FleetTarget) -> RequestRepository:
+        return RequestRepository(
+            timeout=settings.fleet_timeout,
+            cli_path=settings.speedtest_cli_path,
+            server_id=target.server_id,
+            source_address=target.source_address,
+            netns=target.netns,
+            executor=get_executor(),
+        )
+
+    return FleetService(
+        settings.fleet_targets,
+        create_repository,
+        concurrency=settings.fleet_concurrency,
+        timeout=settings.fleet_timeout,
+        interval=settings.fleet_interval,
+        jitter=settings.fleet_jitter,
+        link_lock=get_link_lock(),
+        shared=get_shared_store(),
+    )
+
+
+@lru_cache
+def get_site_repository() -> SiteRepository:
+    return SiteRepository(get_settings().sites_path)
+
+
+def get_site_service(
+    site_repository: Annotated[SiteRepository, Depends(get_site_repository)],
+) -> SiteService:
+    return SiteService(site_repository)
+
+
+@lru_cache
+def get_agent_service() -> AgentService | None:
+    settings = get_settings()
+    if not settings.coordinator_url:
+        return None
+    return AgentService(
+        settings.site or socket.gethostname(),
+        CoordinatorRepository(
+            settings.coordinator_url, token=settings.coordinator_token
+        ),
+        SpoolRepository(settings.agent_spool_path),
+        batch_size=settings.agent_batch_size,
+        flush_interval=settings.agent_flush_interval,
+        max_spooled=settings.agent_max_spooled,
+    )
+
+
+@lru_cache
+def get_latency_probe() -> LatencyProbe | None:
+    settings = get_settings()
+    if not settings.probe_target:
+        return None
+    return LatencyProbe(
+        ProbeRepository(
+            settings.probe_target,
+            method=settings.probe_method,
+            timeout=settings.probe_timeout,
+        ),
+        interval=settings.probe_interval,
+        window=settings.probe_window,
+    )
+
+
+def get_history_service(
+    history_repository: Annotated[HistoryRepository, Depends(get_history_repository)],
+) -> HistoryService:
+    return HistoryService(history_repository)
+
+
+def get_measurement_sinks(
+    history_service: Annotated[HistoryService, Depends(get_history_service)],
+    agent_service: Annotated[AgentService | None, Depends(get_agent_service)] = None,
+    speed_stats: Annotated[SpeedStats | None, Depends(get_speed_stats)] = None,
+    health_monitor: Annotated[HealthMonitor | None, Depends(get_health_monitor)] = None,
+) -> list[MeasurementSink]:
+    sinks: list[MeasurementSink] = [history_service]
+    if speed_stats is not None:
+        sinks.append(speed_stats)
+    if health_monitor is not None:
+        sinks.append(health_monitor)
+    if agent_service is not None:
+        sinks.append(agent_service)
+    return sinks
 
 
 def get_speed_service(
-    request_repository: Annotated[RequestRepository, Depends(get_request_repository)],
+    request_repository: Annotated[SpeedtestRepository, Depends(get_request_repository)],
+    single_flight: Annotated[SingleFlight | None, Depends(get_single_flight)] = None,
+    result_cache: Annotated[ResultCache | None, Depends(get_result_cache)] = None,
+    sinks: Annotated[Sequence[MeasurementSink], Depends(get_measurement_sinks)] = (),
+    admission: Annotated[
+        AdmissionController | None, Depends(get_admission_controller)
+    ] = None,
+    link_lock: Annotated[LinkLock | None, Depends(get_link_lock)] = None,
 ) -> SpeedService:
-    return SpeedService(request_repository)
+    return SpeedService(
+        request_repository, single_flight, result_cache, sinks, admission, link_lock
+    )
+
+
+def build_speed_service() -> SpeedService:
+    # Resolves the same dependencies as a request, for work started outside one
+    return get_speed_service(
+        get_request_repository(),
+        get_single_flight(),
+        get_result_cache(),
+        get_measurement_sinks(
+            get_history_service(get_history_repository()),
+            get_agent_service(),
+            get_speed_stats(),
+            get_health_monitor(),
+        ),
+        get_admission_controller(),
+        get_link_lock(),
+    )
+
+
+def create_scheduler() -> SpeedtestScheduler | None:
+    settings = get_settings()
+    if settings.scheduler_interval <= 0:
+        return None
+    return SpeedtestScheduler(
+        build_speed_service,
+        interval=settings.scheduler_interval,
+        jitter=settings.scheduler_jitter,
+        shared=get_shared_store(),
+    )
+
+
+def create_loop_monitor() -> LoopLagMonitor | None:
+    interval = get_settings().loop_monitor_interval
+    if interval <= 0:
+        return None
+    return LoopLagMonitor(interval)
@@ -0,0 +1,79 @@
+import asyncio
+import functools
+import multiprocessing
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Literal
+
+ExecutorKind = Literal["inline", "thread", "process"]
+
+
+class MeasurementExecutor:
+    def __init__(self, pool: Executor):
+        self.pool = pool
+
+    async def run[T](self, fn: Callable[..., T], *args) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    async def stream(self, fn: Callable[..., object], *args) -> AsyncIterator:
+        # Yields what fn passes to its extra last argument, send, while it runs
+        # on a worker, then raises whatever fn raised
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        pipe = None
+        if isinstance(self.pool, ProcessPoolExecutor):
+            # A pipe end can be handed to a worker process, unlike the loop
+            pipe = receiver, sender = multiprocessing.Pipe(duplex=False)
+            loop.add_reader(receiver.fileno(), _receive, receiver, items)
+            send = sender.send
+        else:
+            send = functools.partial(loop.call_soon_threadsafe, items.put_nowait)
+        future = loop.run_in_executor(self.pool, fn, *args, send)
+        try:
+            while True:
+                next_item = asyncio.ensure_future(items.get())
+                await asyncio.wait(
+                    {future, next_item}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not next_item.done():
+                    next_item.cancel()
+                    break
+                yield next_item.result()
+            # Items sent just before fn returned may still be on their way
+            if pipe is not None:
+                _receive(receiver, items)
+            while not items.empty():
+                yield items.get_nowait()
+            future.result()
+        finally:
+            # A consumer that stops early leaves fn to finish on its own
+            if pipe is not None:
+                loop.remove_reader(receiver.fileno())
+                receiver.close()
+                sender.close()
+
+    def shutdown(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _receive(receiver, items: asyncio.Queue) -> None:
+    while receiver.poll():
+        items.put_nowait(receiver.recv())
+
+
+def create_executor(kind: ExecutorKind, workers: int = 1) -> MeasurementExecutor | None:
+    # "inline" runs on the event loop, which is cheapest for the small
+    # speedtest-cli output; the pools move the work off the loop
+    if kind == "thread":
+        return MeasurementExecutor(
+            ThreadPoolExecutor(workers, thread_name_prefix="measurement")
+        )
+    if kind == "process":
+        # Workers are spawned rather than forked from the running server, so
+        # they do not inherit its event loop and threads
+        return MeasurementExecutor(
+            ProcessPoolExecutor(
+                workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        )
+    return None
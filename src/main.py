@@ -1,7 +1,83 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+from src.dependencies import (
+    create_loop_monitor,
+    create_scheduler,
+    get_agent_service,
+    get_executor,
+    get_fleet_service,
+    get_health_monitor,
+    get_job_manager,
+    get_latency_probe,
+    get_library_repository,
+    get_native_repository,
+    get_result_cache,
+    get_settings,
+    get_shared_store,
+)
+from src.routers import metrics, root, speed
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor = create_loop_monitor()
+    if loop_monitor is not None:
+        loop_monitor.start()
+    scheduler = create_scheduler()
+    if scheduler is not None:
+        scheduler.start()
+    job_manager = get_job_manager()
+    job_manager.start()
+    fleet_service = get_fleet_service()
+    fleet_service.start()
+    agent_service = get_agent_service()
+    if agent_service is not None:
+        await agent_service.start()
+    latency_probe = get_latency_probe()
+    if latency_probe is not None:
+        latency_probe.start()
+    warm_up = None
+    if get_settings().engine == "library":
+        warm_up = asyncio.create_task(get_library_repository().warm_up())
+    yield
+    if warm_up is not None:
+        warm_up.cancel()
+        get_library_repository.cache_clear()
+    if latency_probe is not None:
+        await latency_probe.stop()
+        await latency_probe.repository.aclose()
+        get_latency_probe.cache_clear()
+    if agent_service is not None:
+        await agent_service.stop()
+        await agent_service.coordinator.aclose()
+        get_agent_service.cache_clear()
+    await fleet_service.stop()
+    await get_health_monitor().aclose()
+    get_health_monitor.cache_clear()
+    await job_manager.stop()
+    if scheduler is not None:
+        await scheduler.stop()
+    if get_settings().engine == "native":
+        await get_native_repository().aclose()
+        get_native_repository.cache_clear()
+    executor = get_executor()
+    if executor is not None:
+        executor.shutdown()
+        get_executor.cache_clear()
+    if loop_monitor is not None:
+        await loop_monitor.stop()
+    shared_store = get_shared_store()
+    if shared_store is not None:
+        shared_store.close()
+        get_shared_store.cache_clear()
+        get_result_cache.cache_clear()
 
-from src.routers import root, speed
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 app.include_router(root.router)
 app.include_router(speed.router)
+app.include_router(metrics.router)
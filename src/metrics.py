@@ -0,0 +1,235 @@
+import math
+from bisect import bisect_left
+from collections.abc import Callable
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, registry: Registry | None = REGISTRY):
+        self.name = name
+        self.help = help
+        if registry is not None:
+            registry.register(self)
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, registry: Registry | None = REGISTRY):
+        super().__init__(name, help, registry)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name} {_format(self.value)}"]
+
+
+class LabeledCounter(_Metric):
+    # Children are bound once with labels() and kept by callers, so the hot
+    # path increments a plain Counter without building label dicts
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label: str,
+        registry: Registry | None = REGISTRY,
+    ):
+        super().__init__(name, help, registry)
+        self.label = label
+        self._children: dict[str, Counter] = {}
+
+    def labels(self, value: str) -> Counter:
+        if value not in self._children:
+            self._children[value] = Counter(self.name, self.help, registry=None)
+        return self._children[value]
+
+    def samples(self) -> list[str]:
+        return [
+            f'{self.name}{{{self.label}="{value}"}} {_format(child.value)}'
+            for value, child in self._children.items()
+        ]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, registry: Registry | None = REGISTRY):
+        super().__init__(name, help, registry)
+        self.value = math.nan
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self) -> list[str]:
+        return [f"{self.name} {_format(self.value)}"]
+
+
+class CallbackMetric(_Metric):
+    # Reads its value when scraped, for state that is already counted elsewhere
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        type: str,
+        callback: Callable[[], float],
+        registry: Registry | None = REGISTRY,
+    ):
+        self.type = type
+        self.callback = callback
+        super().__init__(name, help, registry)
+
+    def samples(self) -> list[str]:
+        return [f"{self.name} {_format(self.callback())}"]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: tuple[float, ...],
+        registry: Registry | None = REGISTRY,
+    ):
+        super().__init__(name, help, registry)
+        self.buckets = tuple(sorted(buckets))
+        # Per-bucket (non-cumulative) counts, the last slot is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts, strict=False):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format(bound)}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {_format(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+def _format(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+SPAWN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+RUN_BUCKETS = (1.0, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0)
+SETUP_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+SPAWN_SECONDS = Histogram(
+    "netspeed_speedtest_spawn_seconds",
+    "Time to start the speedtest-cli subprocess",
+    SPAWN_BUCKETS,
+)
+RUN_SECONDS = Histogram(
+    "netspeed_speedtest_run_seconds",
+    "Time from start of a speedtest until its output is available",
+    RUN_BUCKETS,
+)
+SESSION_SETUP_SECONDS = Histogram(
+    "netspeed_speedtest_session_setup_seconds",
+    "Time the library engine spent fetching configuration and picking a server",
+    SETUP_BUCKETS,
+)
+DECODE_SECONDS = Histogram(
+    "netspeed_speedtest_decode_seconds",
+    "Time to decode speedtest JSON output",
+    FAST_BUCKETS,
+)
+VALIDATE_SECONDS = Histogram(
+    "netspeed_speedtest_validate_seconds",
+    "Time to convert and validate results into a SpeedMeasurement",
+    FAST_BUCKETS,
+)
+
+LOOP_LAG_SECONDS = Histogram(
+    "netspeed_event_loop_lag_seconds",
+    "How late the event loop woke up a timer, sampled periodically",
+    FAST_BUCKETS + (0.25, 0.5, 1.0),
+)
+
+FAILURES = LabeledCounter(
+    "netspeed_speedtest_failures_total", "Failed speedtests by reason", "reason"
+)
+TIMEOUT_FAILURES = FAILURES.labels("timeout")
+JSON_DECODE_FAILURES = FAILURES.labels("json_decode")
+EXIT_CODE_FAILURES = FAILURES.labels("exit_code")
+REQUEST_FAILURES = FAILURES.labels("request")
+OTHER_FAILURES = FAILURES.labels("other")
+LIBRARY_FALLBACKS = Counter(
+    "netspeed_library_fallbacks_total",
+    "In-process speedtests that failed and were rerun with speedtest-cli",
+)
+REJECTIONS = LabeledCounter(
+    "netspeed_admission_rejections_total",
+    "Speedtests refused with 429 by the admission controller",
+    "limit",
+)
+CLIENT_REJECTIONS = REJECTIONS.labels("client")
+GLOBAL_REJECTIONS = REJECTIONS.labels("global")
+
+LAST_DOWNLOAD = Gauge(
+    "netspeed_last_download_mbps", "Download speed of the last speedtest in Mbps"
+)
+LAST_UPLOAD = Gauge(
+    "netspeed_last_upload_mbps", "Upload speed of the last speedtest in Mbps"
+)
+LAST_PING = Gauge("netspeed_last_ping_ms", "Ping of the last speedtest in ms")
+LAST_TIMESTAMP = Gauge(
+    "netspeed_last_timestamp_seconds", "Unix time the last speedtest finished"
+)
+
+PROBES = Counter("netspeed_probes_total", "Latency probes sent")
+PROBES_LOST = Counter(
+    "netspeed_probes_lost_total", "Latency probes that failed or timed out"
+)
+PROBE_LATENCY = Gauge(
+    "netspeed_probe_latency_ms", "Mean probe round-trip time over the window in ms"
+)
+PROBE_JITTER = Gauge(
+    "netspeed_probe_jitter_ms",
+    "Mean difference between consecutive probe round trips over the window in ms",
+)
+PROBE_LOSS = Gauge("netspeed_probe_loss_ratio", "Share of probes lost over the window")
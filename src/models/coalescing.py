@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class CoalescingStats(BaseModel):
+    executions: int
+    coalesced: int
+    in_flight: int
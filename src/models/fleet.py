@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel
+
+from src.models.speedresponse import SpeedMeasurement
+
+# The uplink /speed and the scheduler measure on
+DEFAULT_LINK = "default"
+
+
+class FleetTarget(BaseModel):
+    name: str
+    # speedtest.net server id, picked by speedtest-cli when empty
+    server_id: str | None = None
+    # Local address to bind to, selecting the uplink
+    source_address: str | None = None
+    # Network namespace to run speedtest-cli in
+    netns: str | None = None
+
+    @property
+    def link(self) -> str:
+        # Targets on the same link never measure at the same time
+        return self.netns or self.source_address or DEFAULT_LINK
+
+
+class FleetTargetStatus(BaseModel):
+    name: str
+    link: str
+    status: Literal["pending", "running", "succeeded", "failed"] = "pending"
+    # Latest successful result, kept when a later run fails
+    result: SpeedMeasurement | None = None
+    error: str | None = None
+    last_run: datetime | None = None
@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel
+
+# "learning" until enough results for a baseline have been seen
+HealthState = Literal["learning", "ok", "degraded"]
+
+
+class MetricHealth(BaseModel):
+    state: HealthState
+    samples: int
+    value: float | None = None
+    # Smoothed mean and standard deviation the latest value is compared with
+    baseline: float | None = None
+    deviation: float | None = None
+    # Accumulated shift in the degrading direction, in standard deviations;
+    # degraded once above the threshold
+    cusum: float = 0.0
+    # When the metric entered its current state
+    since: datetime | None = None
+
+
+class HealthResponse(BaseModel):
+    state: HealthState
+    threshold: float
+    download_speed: MetricHealth
+    upload_speed: MetricHealth
+    ping: MetricHealth
+
+
+class HealthEvent(BaseModel):
+    event: Literal["degraded", "recovered"]
+    metric: str
+    value: float
+    baseline: float
+    deviation: float
+    cusum: float
+    timestamp: datetime
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class MetricSummary(BaseModel):
+    min: float
+    avg: float
+    max: float
+    p50: float
+    p95: float
+    p99: float
+
+
+class HistoryBucket(BaseModel):
+    start: datetime
+    count: int
+    download_speed: MetricSummary
+    upload_speed: MetricSummary
+    ping: MetricSummary
+
+
+class HistoryResponse(BaseModel):
+    start: datetime
+    end: datetime
+    step: int
+    buckets: list[HistoryBucket]
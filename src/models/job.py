@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import Literal
+
+from pydantic import BaseModel
+
+from src.models.speedresponse import SpeedMeasurement
+
+
+class SpeedJob(BaseModel):
+    id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    result: SpeedMeasurement | None = None
+    error: str | None = None
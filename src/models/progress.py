@@ -0,0 +1,15 @@
+from typing import Literal
+
+from pydantic import BaseModel
+
+from src.models.speedresponse import SpeedMeasurement
+
+
+class SpeedProgress(BaseModel):
+    event: Literal["phase", "progress", "phase_complete", "result", "error"]
+    phase: str | None = None
+    # Throughput in Mbps for download and upload progress
+    speed: float | None = None
+    elapsed: float | None = None
+    result: SpeedMeasurement | None = None
+    detail: str | None = None
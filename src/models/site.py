@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from src.models.speedresponse import SpeedMeasurement
+
+
+class SiteBatch(BaseModel):
+    site: str
+    measurements: list[SpeedMeasurement]
+
+
+class SiteIngestResponse(BaseModel):
+    # Measurements stored; retried batches are not stored twice
+    accepted: int
+
+
+class SiteSummary(BaseModel):
+    site: str
+    count: int
+    first_seen: datetime
+    latest: SpeedMeasurement
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 from pydantic import BaseModel
 
 
@@ -5,5 +7,50 @@ class SpeedResponse(BaseModel):
     download_speed: float
     upload_speed: float
     ping: float
+    # Mean difference between consecutive ping samples in milliseconds, when
+    # the engine reports it (the native engine does)
+    jitter: float | None = None
     server_name: str
     server_location: str
+    # Relative half-width of the 95% confidence interval of each speed, when
+    # the engine samples throughput (the native engine does)
+    download_margin: float | None = None
+    upload_margin: float | None = None
+
+
+class SpeedMeasurement(SpeedResponse):
+    timestamp: datetime
+
+
+class MetricSpread(BaseModel):
+    median: float
+    q1: float
+    q3: float
+    iqr: float
+    # Indices into runs of values more than 1.5 IQR outside the quartiles,
+    # left out of the figures above
+    outliers: list[int] = []
+
+
+class BatchSpeedResponse(SpeedResponse):
+    # download_speed, upload_speed and ping are medians of the runs that were
+    # not outliers for that metric; the server is the last run's
+    download_spread: MetricSpread
+    upload_spread: MetricSpread
+    ping_spread: MetricSpread
+    runs: list[SpeedMeasurement]
+    # Runs that failed and are not part of the figures
+    failed: int = 0
+
+
+class LatencyResponse(BaseModel):
+    target: str
+    method: str
+    # Over the last `window` probes; ping and jitter count answered ones only
+    ping: float | None = None
+    jitter: float | None = None
+    packet_loss: float | None = None
+    window: int
+    sent: int = 0
+    lost: int = 0
+    timestamp: datetime | None = None
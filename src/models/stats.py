@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from src.models.history import MetricSummary
+
+
+class StatsResponse(BaseModel):
+    window: int
+    start: datetime
+    end: datetime
+    # Bucket size in seconds the window was assembled from
+    resolution: int
+    count: int
+    download_speed: MetricSummary | None = None
+    upload_speed: MetricSummary | None = None
+    ping: MetricSummary | None = None
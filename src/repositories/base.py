@@ -0,0 +1,15 @@
+from collections.abc import AsyncIterator
+from typing import Protocol, runtime_checkable
+
+
+class SpeedtestRepository(Protocol):
+    # Results use the speedtest-cli --json layout: speeds in bits per second,
+    # ping in milliseconds and the server under "server"
+    async def get_speedtest_results(self) -> dict: ...
+
+
+@runtime_checkable
+class StreamingSpeedtestRepository(SpeedtestRepository, Protocol):
+    # Yields {"event": "phase" | "progress" | "phase_complete", ...} while the
+    # test runs and finally {"event": "result", "results": <results dict>}
+    def stream_speedtest_results(self) -> AsyncIterator[dict]: ...
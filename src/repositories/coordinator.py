@@ -0,0 +1,38 @@
+import gzip
+from collections.abc import Sequence
+
+import httpx
+
+from src.models.site import SiteBatch
+from src.models.speedresponse import SpeedMeasurement
+
+INGEST_PATH = "/speed/sites/ingest"
+
+
+class CoordinatorRepository:
+    def __init__(
+        self,
+        url: str,
+        token: str = "",
+        timeout: float = 30.0,
+        client: httpx.AsyncClient | None = None,
+    ):
+        self.url = url.rstrip("/") + INGEST_PATH
+        self.token = token
+        self.client = client or httpx.AsyncClient(timeout=timeout)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def push(self, site: str, measurements: Sequence[SpeedMeasurement]) -> int:
+        batch = SiteBatch(site=site, measurements=list(measurements))
+        headers = {"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        response = await self.client.post(
+            self.url,
+            content=gzip.compress(batch.model_dump_json().encode()),
+            headers=headers,
+        )
+        response.raise_for_status()
+        return response.json()["accepted"]
@@ -0,0 +1,192 @@
+import math
+import sqlite3
+import threading
+from collections.abc import Iterable, Iterator
+
+import orjson
+
+from src.models.speedresponse import SpeedMeasurement
+from src.sketch import DDSketch
+
+METRICS = ("download_speed", "upload_speed", "ping")
+
+# Columns a history export can project; "timestamp" is stored as ts
+EXPORT_COLUMNS = (
+    "timestamp",
+    "download_speed",
+    "upload_speed",
+    "ping",
+    "server_name",
+    "server_location",
+)
+
+# Rollup resolutions in seconds: 1 minute, 1 hour, 1 day
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    ts REAL NOT NULL,
+    download_speed REAL NOT NULL,
+    upload_speed REAL NOT NULL,
+    ping REAL NOT NULL,
+    server_name TEXT NOT NULL,
+    server_location TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS measurements_ts ON measurements (ts);
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    download_speed TEXT NOT NULL,
+    upload_speed TEXT NOT NULL,
+    ping TEXT NOT NULL,
+    PRIMARY KEY (resolution, bucket)
+) WITHOUT ROWID;
+"""
+
+
+class HistoryRepository:
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def append(self, measurement: SpeedMeasurement) -> None:
+        ts = measurement.timestamp.timestamp()
+        values = {metric: getattr(measurement, metric) for metric in METRICS}
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO measurements VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    ts,
+                    measurement.download_speed,
+                    measurement.upload_speed,
+                    measurement.ping,
+                    measurement.server_name,
+                    measurement.server_location,
+                ),
+            )
+            for resolution in ROLLUP_RESOLUTIONS:
+                self._add_to_rollup(
+                    resolution, int(ts // resolution) * resolution, values
+                )
+
+    def query(
+        self, start: float, end: float, step: int
+    ) -> list[tuple[int, dict[str, DDSketch]]]:
+        # Buckets are aligned to multiples of step, which lets any rollup whose
+        # resolution divides step answer the query without touching raw rows
+        start = math.floor(start / step) * step
+        end = math.ceil(end / step) * step
+        resolution = self._rollup_resolution(step)
+        if resolution is None:
+            return self._query_raw(start, end, step)
+        return self._query_rollups(start, end, step, resolution)
+
+    def _query_raw(
+        self, start: float, end: float, step: int
+    ) -> list[tuple[int, dict[str, DDSketch]]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT ts, download_speed, upload_speed, ping FROM measurements "
+                "WHERE ts >= ? AND ts < ? ORDER BY ts",
+                (start, end),
+            ).fetchall()
+        return group_samples(
+            (int(ts // step) * step, dict(zip(METRICS, values, strict=True)))
+            for ts, *values in rows
+        )
+
+    def _query_rollups(
+        self, start: float, end: float, step: int, resolution: int
+    ) -> list[tuple[int, dict[str, DDSketch]]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT bucket, download_speed, upload_speed, ping FROM rollups "
+                "WHERE resolution = ? AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (resolution, start, end),
+            ).fetchall()
+
+        buckets: dict[int, dict[str, DDSketch]] = {}
+        for bucket, *sketches in rows:
+            merged = buckets.setdefault(bucket // step * step, {})
+            for metric, data in zip(METRICS, sketches, strict=True):
+                sketch = DDSketch.from_dict(orjson.loads(data))
+                if metric in merged:
+                    merged[metric].merge(sketch)
+                else:
+                    merged[metric] = sketch
+        return sorted(buckets.items())
+
+    def _add_to_rollup(
+        self, resolution: int, bucket: int, values: dict[str, float]
+    ) -> None:
+        row = self._connection.execute(
+            "SELECT download_speed, upload_speed, ping FROM rollups "
+            "WHERE resolution = ? AND bucket = ?",
+            (resolution, bucket),
+        ).fetchone()
+        sketches = []
+        for index, metric in enumerate(METRICS):
+            sketch = DDSketch.from_dict(orjson.loads(row[index])) if row else DDSketch()
+            sketch.add(values[metric])
+            sketches.append(orjson.dumps(sketch.to_dict()).decode())
+        self._connection.execute(
+            "INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?)",
+            (resolution, bucket, *sketches),
+        )
+
+    def iter_rows(
+        self,
+        start: float = -math.inf,
+        end: float = math.inf,
+        columns: tuple[str, ...] = EXPORT_COLUMNS,
+        batch_size: int = 10_000,
+    ) -> Iterator[list[tuple]]:
+        # Yields raw rows of the requested columns in batches, ordered by time.
+        # Each batch is its own query continuing after the last (ts, rowid)
+        # seen, so the lock is only held per batch and memory stays constant
+        # however much history is exported.
+        unknown = set(columns) - set(EXPORT_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        projection = ", ".join("ts" if c == "timestamp" else c for c in columns)
+        sql = (
+            f"SELECT rowid, ts, {projection} FROM measurements "
+            "WHERE (ts, rowid) > (?, ?) AND ts < ? ORDER BY ts, rowid LIMIT ?"
+        )
+        # Every rowid is positive, so the first batch starts at ts >= start
+        after = (start, 0)
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    sql, (*after, end, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [row[2:] for row in rows]
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1][1], rows[-1][0])
+
+    @staticmethod
+    def _rollup_resolution(step: int) -> int | None:
+        for resolution in reversed(ROLLUP_RESOLUTIONS):
+            if step % resolution == 0:
+                return resolution
+        return None
+
+
+def group_samples(
+    samples: Iterable[tuple[int, dict[str, float]]],
+) -> list[tuple[int, dict[str, DDSketch]]]:
+    buckets: dict[int, dict[str, DDSketch]] = {}
+    for bucket, values in samples:
+        sketches = buckets.setdefault(
+            bucket, {metric: DDSketch() for metric in METRICS}
+        )
+        for metric, value in values.items():
+            sketches[metric].add(value)
+    return sorted(buckets.items())
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import threading
+import time
+
+from src import metrics
+from src.repositories.requester import OUTPUT_FIELDS, RequestRepository
+from src.repositories.servers import ServerCatalogRepository
+
+try:
+    import speedtest
+except ImportError:  # optional, without it every test runs speedtest-cli
+    speedtest = None
+
+logger = logging.getLogger(__name__)
+
+
+class _ShutdownEvent(threading.Event):
+    # speedtest polls the pre-3.10 spelling, which now warns
+    def isSet(self) -> bool:
+        return self.is_set()
+
+
+class LibrarySpeedRepository:
+    def __init__(
+        self,
+        fallback: RequestRepository,
+        timeout: float = 120,
+        server_catalog: ServerCatalogRepository | None = None,
+        server_id: str | None = None,
+        source_address: str | None = None,
+        session_ttl: float = 86400.0,
+    ):
+        # fallback runs the speedtest-cli subprocess whenever the in-process
+        # test fails or the speedtest module is not installed
+        self.fallback = fallback
+        self.timeout = timeout
+        self.server_catalog = server_catalog
+        self.server_id = server_id
+        self.source_address = source_address
+        # Seconds a session keeps its configuration and server
+        self.session_ttl = session_ttl
+        self._session = None
+        self._session_created = 0.0
+        # One test at a time per session; speedtest runs its own transfer
+        # threads inside each test
+        self._lock = threading.Lock()
+
+    async def warm_up(self) -> None:
+        # Fetches the configuration and picks the server ahead of the first
+        # test, so it only measures
+        if speedtest is None:
+            return
+        try:
+            await asyncio.to_thread(self._warm_up)
+        except Exception as e:
+            logger.warning("Failed to prepare the speedtest session: %s", e)
+
+    async def get_speedtest_results(self) -> dict:
+        if speedtest is None:
+            return await self.fallback.get_speedtest_results()
+        shutdown = _ShutdownEvent()
+        started = time.perf_counter()
+        try:
+            results = await asyncio.wait_for(
+                asyncio.to_thread(self._run, shutdown), timeout=self.timeout
+            )
+        except TimeoutError as err:
+            metrics.TIMEOUT_FAILURES.inc()
+            self._forget_server()
+            raise Exception("Speedtest timed out") from err
+        except Exception as e:
+            metrics.LIBRARY_FALLBACKS.inc()
+            self._forget_server()
+            logger.warning("In-process speedtest failed, running speedtest-cli: %s", e)
+            return await self.fallback.get_speedtest_results()
+        finally:
+            # A worker that is still running after a timeout or cancellation
+            # stops its transfer threads instead of loading the link
+            shutdown.set()
+        metrics.RUN_SECONDS.observe(time.perf_counter() - started)
+        return results
+
+    def _forget_server(self) -> None:
+        # The failed session is dropped in _run; a catalogue pin would only
+        # bring the same server back
+        if self.server_catalog is not None and self.server_id is None:
+            self.server_catalog.forget_best_server()
+
+    def _warm_up(self) -> None:
+        with self._lock:
+            self._get_session()
+
+    def _run(self, shutdown: _ShutdownEvent) -> dict:
+        with self._lock:
+            session = self._get_session()
+            try:
+                # Speedtest only takes these in its constructor, which would
+                # fetch the configuration again
+                session._shutdown_event = shutdown
+                session.results = speedtest.SpeedtestResults(
+                    client=session.config["client"],
+                    opener=session._opener,
+                    secure=session._secure,
+                )
+                # Latency to the kept server is measured again, the server
+                # itself is not re-selected
+                session.get_best_server([session.best])
+                session.download()
+                session.upload()
+            except Exception:
+                self._session = None
+                raise
+            if shutdown.is_set():
+                self._session = None
+                raise Exception("Speedtest was cancelled")
+            results = session.results.dict()
+        return {field: results[field] for field in OUTPUT_FIELDS}
+
+    def _get_session(self):
+        if (
+            self._session is not None
+            and time.monotonic() - self._session_created < self.session_ttl
+        ):
+            return self._session
+        started = time.perf_counter()
+        session = speedtest.Speedtest(source_address=self.source_address)
+        server_id = self.server_id
+        if server_id is None and self.server_catalog is not None:
+            best_server = self.server_catalog.best_server()
+            server_id = best_server["id"] if best_server is not None else None
+        if server_id:
+            session.get_servers([server_id])
+        session.get_best_server()
+        if self.server_catalog is not None and server_id is None:
+            self.server_catalog.remember_best_server(session.best)
+        metrics.SESSION_SETUP_SECONDS.observe(time.perf_counter() - started)
+        self._session = session
+        self._session_created = time.monotonic()
+        return session
@@ -0,0 +1,450 @@
+import asyncio
+import os
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import UTC, datetime
+
+import httpx
+
+from src import metrics
+from src.executor import MeasurementExecutor
+from src.repositories.servers import ServerCatalogRepository
+from src.repositories.transfer import RawHttpConnection, TransferError, TransferKind
+from src.running_stats import RunningStats
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Nearest servers whose latency is compared when picking one to measure
+SELECTION_CANDIDATES = 5
+
+# Throughput samples an adaptive phase takes before it may stop early
+MIN_ADAPTIVE_SAMPLES = 5
+
+
+class _ByteCounter:
+    def __init__(self):
+        self.bytes = 0
+
+    def add(self, count: int) -> None:
+        self.bytes += count
+
+
+class NativeSpeedRepository:
+    def __init__(
+        self,
+        server_url: str,
+        server_name: str = "",
+        server_location: str = "",
+        streams: int = 4,
+        duration: float = 10.0,
+        warmup: float = 2.0,
+        latency_samples: int = 5,
+        download_size: int = 4000,
+        upload_size: int = 4 * 1024 * 1024,
+        timeout: int = 120,
+        sample_interval: float = 0.5,
+        adaptive: bool = False,
+        tolerance: float = 0.05,
+        client: httpx.AsyncClient | None = None,
+        server_catalog: ServerCatalogRepository | None = None,
+        executor: MeasurementExecutor | None = None,
+        transfer: TransferKind = "httpx",
+    ):
+        # server_url is a speedtest.net style upload URL such as
+        # http://host:8080/speedtest/upload.php; the latency and download
+        # files live next to it. Without one a server is picked from the
+        # catalogue.
+        self.server_url = server_url
+        self.server_name = server_name
+        self.server_location = server_location
+        self.streams = streams
+        self.duration = duration
+        self.warmup = warmup
+        self.latency_samples = latency_samples
+        self.download_size = download_size
+        self.upload_size = upload_size
+        self.timeout = timeout
+        self.sample_interval = sample_interval
+        # In adaptive mode a phase ends once the 95% confidence interval of
+        # its throughput is within +/- tolerance; duration is then the limit
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.server_catalog = server_catalog
+        self.executor = executor
+        self.transfer = transfer
+        self.client = client or httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=streams, max_keepalive_connections=streams
+            ),
+        )
+        # One random payload is shared by every upload request
+        self._payload = memoryview(os.urandom(upload_size))
+        # Raw connections between transfers of the current phase
+        self._idle_connections: list[RawHttpConnection] = []
+
+    async def aclose(self) -> None:
+        self._close_idle_connections()
+        await self.client.aclose()
+
+    async def get_speedtest_results(self) -> dict:
+        if self.executor is not None:
+            try:
+                return await self._measure_in_executor()
+            except Exception:
+                self._forget_server()
+                raise
+        return await _result_of(self.stream_speedtest_results())
+
+    async def stream_speedtest_results(self) -> AsyncIterator[dict]:
+        started = time.perf_counter()
+        events = self._stream() if self.executor is None else self._stream_in_executor()
+        try:
+            async for event in events:
+                if event["event"] == "result":
+                    metrics.RUN_SECONDS.observe(time.perf_counter() - started)
+                yield event
+        except Exception:
+            self._forget_server()
+            raise
+
+    def _forget_server(self) -> None:
+        # Only a server picked from the catalogue is re-selected; a
+        # configured server_url stays what it is
+        if self.server_catalog is not None and not self.server_url:
+            self.server_catalog.forget_best_server()
+
+    async def _measure_in_executor(self) -> dict:
+        # Only server selection runs on this loop; the transfers, which
+        # handle every byte, run on the executor worker's own loop
+        try:
+            server = await self._select_server()
+        except httpx.HTTPError as e:
+            raise Exception(f"Speedtest request failed: {e}") from e
+        started = time.perf_counter()
+        results = await self.executor.run(
+            measure_in_worker, self._worker_options(), server
+        )
+        metrics.RUN_SECONDS.observe(time.perf_counter() - started)
+        return results
+
+    async def _stream_in_executor(self) -> AsyncIterator[dict]:
+        # As _measure_in_executor, with the worker sending each event back
+        yield {"event": "phase", "phase": "server_selection"}
+        try:
+            server = await self._select_server()
+        except httpx.HTTPError as e:
+            raise Exception(f"Speedtest request failed: {e}") from e
+        async for event in self.executor.stream(
+            measure_in_worker, self._worker_options(), server
+        ):
+            yield event
+
+    def _worker_options(self) -> dict:
+        return {
+            "streams": self.streams,
+            "duration": self.duration,
+            "warmup": self.warmup,
+            "latency_samples": self.latency_samples,
+            "download_size": self.download_size,
+            "upload_size": self.upload_size,
+            "timeout": self.timeout,
+            "sample_interval": self.sample_interval,
+            "adaptive": self.adaptive,
+            "tolerance": self.tolerance,
+            "transfer": self.transfer,
+        }
+
+    async def _stream(self, server: dict | None = None) -> AsyncIterator[dict]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        events = self._events(server)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        anext(events), timeout=deadline - loop.time()
+                    )
+                except StopAsyncIteration:
+                    return
+                except TimeoutError as err:
+                    metrics.TIMEOUT_FAILURES.inc()
+                    raise Exception("Speedtest timed out") from err
+                except (httpx.HTTPError, TransferError) as e:
+                    metrics.REQUEST_FAILURES.inc()
+                    raise Exception(f"Speedtest request failed: {e}") from e
+                except Exception as e:
+                    metrics.OTHER_FAILURES.inc()
+                    raise Exception(f"An error occurred: {e}") from e
+                yield event
+        finally:
+            await events.aclose()
+
+    async def _events(self, server: dict | None = None) -> AsyncIterator[dict]:
+        if server is None:
+            yield {"event": "phase", "phase": "server_selection"}
+            server = await self._select_server()
+
+        yield {"event": "phase", "phase": "latency"}
+        ping, jitter = await self._measure_latency(server["url"])
+
+        throughput, margins = {}, {}
+        received, sent = _ByteCounter(), _ByteCounter()
+        transfers = {
+            "download": (lambda: self._download(server["url"], received), received),
+            "upload": (lambda: self._upload(server["url"], sent), sent),
+        }
+        for phase, (transfer, counter) in transfers.items():
+            yield {"event": "phase", "phase": phase}
+            async for event in self._measure_throughput(phase, transfer, counter):
+                if event["event"] == "phase_complete":
+                    throughput[phase] = event["bits_per_second"]
+                    margins[phase] = event["margin"]
+                yield event
+
+        yield {
+            "event": "result",
+            "results": {
+                "download": throughput["download"],
+                "upload": throughput["upload"],
+                "download_margin": margins["download"],
+                "upload_margin": margins["upload"],
+                "ping": ping,
+                "jitter": jitter,
+                "server": {**server, "latency": ping},
+                "timestamp": datetime.now(UTC).isoformat(),
+                "bytes_sent": sent.bytes,
+                "bytes_received": received.bytes,
+            },
+        }
+
+    async def _select_server(self) -> dict:
+        if self.server_url:
+            return {
+                "url": self.server_url,
+                "name": self.server_name,
+                "country": self.server_location,
+            }
+        if self.server_catalog is None:
+            raise Exception("No speedtest server configured")
+
+        best = self.server_catalog.best_server()
+        if best is not None:
+            return best
+
+        # Pick the lowest latency of the nearest servers and remember it, so
+        # later tests skip the selection until the catalogue expires
+        latencies = []
+        for server in await self.server_catalog.nearest_servers(SELECTION_CANDIDATES):
+            try:
+                latency, _ = await self._measure_latency(server["url"])
+            except httpx.HTTPError:
+                continue
+            latencies.append((latency, server))
+        if not latencies:
+            raise Exception("No reachable speedtest server")
+        latency, server = min(latencies, key=lambda candidate: candidate[0])
+        self.server_catalog.remember_best_server({**server, "latency": latency})
+        return server
+
+    async def _measure_latency(self, server_url: str) -> tuple[float, float]:
+        url = f"{_base_url(server_url)}/latency.txt"
+        # The first request also opens the connection, so it is not counted
+        await self._get_latency(url)
+        samples = [await self._get_latency(url) for _ in range(self.latency_samples)]
+        differences = [abs(b - a) for a, b in zip(samples, samples[1:], strict=False)]
+        jitter = sum(differences) / len(differences) if differences else 0.0
+        return round(sum(samples) / len(samples), 3), round(jitter, 3)
+
+    async def _get_latency(self, url: str) -> float:
+        started = time.perf_counter()
+        response = await self.client.get(url)
+        response.raise_for_status()
+        return (time.perf_counter() - started) * 1000
+
+    async def _measure_throughput(
+        self,
+        phase: str,
+        transfer: Callable[[], Awaitable[None]],
+        counter: _ByteCounter,
+    ) -> AsyncIterator[dict]:
+        workers = [
+            asyncio.create_task(self._repeat(transfer)) for _ in range(self.streams)
+        ]
+        started = time.perf_counter()
+        # Bytes moved during warm-up (TCP slow start, connection setup) are
+        # discarded; only the fixed window after it is measured
+        warmup_end = started + self.warmup
+        window_end = warmup_end + self.duration
+        window_start = None
+        # Throughput of each sample taken inside the window
+        samples = RunningStats()
+        last_bytes, last_time = 0, started
+        try:
+            while True:
+                now = time.perf_counter()
+                if window_start is None and now >= warmup_end:
+                    window_start = (counter.bytes, now)
+                if now >= window_end or self._converged(samples):
+                    end_bytes = counter.bytes
+                    break
+                boundary = warmup_end if window_start is None else window_end
+                await self._wait_unless_failed(
+                    workers, min(self.sample_interval, boundary - now)
+                )
+                now = time.perf_counter()
+                bits_per_second = _bits_per_second(
+                    counter.bytes - last_bytes, now - last_time
+                )
+                if window_start is not None:
+                    samples.add(bits_per_second)
+                yield {
+                    "event": "progress",
+                    "phase": phase,
+                    "bits_per_second": bits_per_second,
+                    "elapsed": now - started,
+                }
+                last_bytes, last_time = counter.bytes, now
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Nothing keeps them alive until the next test
+            self._close_idle_connections()
+
+        start_bytes, start_time = window_start
+        yield {
+            "event": "phase_complete",
+            "phase": phase,
+            "bits_per_second": _bits_per_second(
+                end_bytes - start_bytes, now - start_time
+            ),
+            "margin": samples.margin(),
+        }
+
+    def _converged(self, samples: RunningStats) -> bool:
+        # Consecutive samples are not independent, so a minimum count guards
+        # against stopping on a lucky run of similar ones
+        if not self.adaptive or samples.count < MIN_ADAPTIVE_SAMPLES:
+            return False
+        margin = samples.margin()
+        return margin is not None and margin <= self.tolerance
+
+    @staticmethod
+    async def _wait_unless_failed(workers: list[asyncio.Task], delay: float) -> None:
+        # Workers loop until cancelled, so one finishing means it failed
+        done, _ = await asyncio.wait(
+            workers, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+        )
+        for worker in done:
+            worker.result()
+
+    @staticmethod
+    async def _repeat(transfer: Callable[[], Awaitable[None]]) -> None:
+        while True:
+            await transfer()
+
+    async def _download(self, server_url: str, counter: _ByteCounter) -> None:
+        size = self.download_size
+        url = f"{_base_url(server_url)}/random{size}x{size}.jpg"
+        if self.transfer == "socket":
+            await self._on_connection(
+                url, lambda connection: connection.get(url, counter.add)
+            )
+            return
+        async with self.client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_raw():
+                counter.bytes += len(chunk)
+
+    async def _upload(self, server_url: str, counter: _ByteCounter) -> None:
+        if self.transfer == "socket":
+            await self._on_connection(
+                server_url,
+                lambda connection: connection.post(
+                    server_url, self._payload, counter.add
+                ),
+            )
+            return
+        response = await self.client.post(
+            server_url,
+            content=self._upload_body(counter),
+            headers={"Content-Length": str(len(self._payload))},
+        )
+        response.raise_for_status()
+
+    async def _upload_body(self, counter: _ByteCounter):
+        for offset in range(0, len(self._payload), UPLOAD_CHUNK_SIZE):
+            chunk = self._payload[offset : offset + UPLOAD_CHUNK_SIZE]
+            yield chunk
+            # The chunk has been handed to the transport once we resume
+            counter.bytes += len(chunk)
+
+    async def _on_connection(
+        self, url: str, request: Callable[[RawHttpConnection], Awaitable[None]]
+    ) -> None:
+        connection = (
+            self._idle_connections.pop()
+            if self._idle_connections
+            else RawHttpConnection(url)
+        )
+        await request(connection)
+        # A failed or interrupted request closes the connection and raises
+        # before it could be handed to the next transfer
+        self._idle_connections.append(connection)
+
+    def _close_idle_connections(self) -> None:
+        for connection in self._idle_connections:
+            connection.close()
+        self._idle_connections.clear()
+
+
+def measure_in_worker(
+    options: dict, server: dict, send: Callable[[dict], None] | None = None
+) -> dict:
+    # Runs inside an executor worker, on a loop of its own. The repository and
+    # its connections only live for one measurement: a loop that is kept
+    # around between runs would not finalise the cancelled transfer streams,
+    # which then hold on to the pool's connections. With send every event,
+    # the result included, is passed back as it happens.
+    async def measure() -> dict:
+        repository = NativeSpeedRepository("", **options)
+        events = repository._stream(server)
+        if send is not None:
+            events = _sent(events, send)
+        try:
+            return await _result_of(events)
+        finally:
+            await repository.aclose()
+
+    return asyncio.run(measure())
+
+
+async def _sent(
+    events: AsyncIterator[dict], send: Callable[[dict], None]
+) -> AsyncIterator[dict]:
+    try:
+        async for event in events:
+            send(event)
+            yield event
+    finally:
+        await events.aclose()
+
+
+async def _result_of(events: AsyncIterator[dict]) -> dict:
+    try:
+        async for event in events:
+            if event["event"] == "result":
+                return event["results"]
+    finally:
+        await events.aclose()
+    raise Exception("Speedtest ended without a result")
+
+
+def _bits_per_second(count: int, seconds: float) -> float:
+    # A window of no length, such as a duration of 0, moved nothing measurable
+    return count * 8 / seconds if seconds > 0 else 0.0
+
+
+def _base_url(server_url: str) -> str:
+    return server_url.rsplit("/", 1)[0]
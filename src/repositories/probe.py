@@ -0,0 +1,119 @@
+import asyncio
+import socket
+import time
+from typing import Literal
+
+import httpx
+
+# "tcp" times a connection handshake, "http" a HEAD request and "udp" a
+# datagram sent back by an echo service
+ProbeKind = Literal["tcp", "http", "udp"]
+
+
+class ProbeError(Exception):
+    pass
+
+
+class _EchoProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.waiting: dict[bytes, asyncio.Future] = {}
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        # Replies to probes that already timed out find nothing waiting
+        future = self.waiting.pop(data, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def error_received(self, exc: Exception) -> None:
+        # e.g. ICMP port unreachable, which fails whatever is waiting
+        for future in self.waiting.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.waiting.clear()
+
+
+class ProbeRepository:
+    def __init__(
+        self,
+        target: str,
+        method: ProbeKind = "tcp",
+        timeout: float = 1.0,
+        client: httpx.AsyncClient | None = None,
+    ):
+        # target is host:port for tcp and udp probes and a URL for http ones
+        self.target = target
+        self.method = method
+        self.timeout = timeout
+        self.client = client or httpx.AsyncClient(timeout=timeout)
+        self._address: tuple | None = None
+        self._echo: tuple[asyncio.DatagramTransport, _EchoProtocol] | None = None
+        self._sequence = 0
+
+    async def aclose(self) -> None:
+        if self._echo is not None:
+            self._echo[0].close()
+            self._echo = None
+        await self.client.aclose()
+
+    async def probe(self) -> float:
+        # Round-trip time in milliseconds; raises ProbeError when lost
+        try:
+            async with asyncio.timeout(self.timeout):
+                if self.method == "http":
+                    return await self._probe_http()
+                if self.method == "udp":
+                    return await self._probe_udp()
+                return await self._probe_tcp()
+        except TimeoutError as e:
+            raise ProbeError("Probe timed out") from e
+        except (OSError, httpx.HTTPError) as e:
+            raise ProbeError(f"Probe failed: {e!r}") from e
+
+    async def _probe_tcp(self) -> float:
+        family, address = await self._resolve(socket.SOCK_STREAM)
+        loop = asyncio.get_running_loop()
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.setblocking(False)
+            started = time.perf_counter()
+            await loop.sock_connect(sock, address)
+            return (time.perf_counter() - started) * 1000
+
+    async def _probe_http(self) -> float:
+        # Any response proves the round trip; after the first probe the
+        # connection is reused, so only the request itself is timed
+        started = time.perf_counter()
+        await self.client.head(self.target)
+        return (time.perf_counter() - started) * 1000
+
+    async def _probe_udp(self) -> float:
+        if self._echo is None:
+            family, address = await self._resolve(socket.SOCK_DGRAM)
+            self._echo = await asyncio.get_running_loop().create_datagram_endpoint(
+                _EchoProtocol, remote_addr=address, family=family
+            )
+        transport, protocol = self._echo
+        self._sequence += 1
+        payload = f"netspeed-probe {self._sequence}".encode()
+        reply = asyncio.get_running_loop().create_future()
+        protocol.waiting[payload] = reply
+        try:
+            started = time.perf_counter()
+            transport.sendto(payload)
+            await reply
+            return (time.perf_counter() - started) * 1000
+        finally:
+            protocol.waiting.pop(payload, None)
+
+    async def _resolve(self, type: int) -> tuple[int, tuple]:
+        # Resolved once, so name lookups are not counted as latency
+        if self._address is None:
+            host, _, port = self.target.rpartition(":")
+            if not host or not port.isdigit():
+                raise ProbeError(f"Probe target must be host:port: {self.target}")
+            family, _, _, _, address = (
+                await asyncio.get_running_loop().getaddrinfo(
+                    host.strip("[]"), int(port), type=type
+                )
+            )[0]
+            self._address = (family, address)
+        return self._address
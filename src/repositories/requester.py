@@ -1,33 +1,113 @@
 import asyncio
 import json
 import subprocess
+import time
+from contextlib import suppress
+
+import orjson
+
+from src import metrics
+from src.executor import MeasurementExecutor
+from src.repositories.servers import ServerCatalogRepository
+
+# The parts of speedtest-cli's output that are used; client, share and byte
+# counts are dropped right after decoding
+OUTPUT_FIELDS = ("download", "upload", "ping", "server")
 
 
 class RequestRepository:
-    def __init__(self, timeout: int = 120):
+    def __init__(
+        self,
+        timeout: int = 120,
+        server_catalog: ServerCatalogRepository | None = None,
+        cli_path: str = "/usr/bin/speedtest-cli",
+        server_id: str | None = None,
+        source_address: str | None = None,
+        netns: str | None = None,
+        executor: MeasurementExecutor | None = None,
+    ):
         self.timeout = timeout
+        self.server_catalog = server_catalog
+        self.cli_path = cli_path
+        self.server_id = server_id
+        self.source_address = source_address
+        self.netns = netns
+        self.executor = executor
 
     async def get_speedtest_results(self) -> dict:
+        command = [self.cli_path, "--json"]
+        if self.netns:
+            command = ["ip", "netns", "exec", self.netns, *command]
+        if self.source_address:
+            command += ["--source", self.source_address]
+        server_id = self.server_id
+        if server_id is None and self.server_catalog is not None:
+            best_server = self.server_catalog.best_server()
+            server_id = best_server["id"] if best_server is not None else None
+        if server_id:
+            # Pinning the server skips speedtest-cli's latency based selection
+            command += ["--server", server_id]
+        try:
+            results = await self._run(command)
+        except Exception:
+            if server_id and self.server_id is None:
+                self.server_catalog.forget_best_server()
+            raise
+        if self.server_catalog is not None and server_id is None:
+            self.server_catalog.remember_best_server(results.get("server", {}))
+        return results
+
+    async def _run(self, command: list[str]) -> dict:
         try:
+            started = time.perf_counter()
             process = await asyncio.create_subprocess_exec(
-                "/usr/bin/speedtest-cli",
-                "--json",
+                *command,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
             )
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(), timeout=self.timeout
-            )
-            return json.loads(stdout.decode())
+            spawned = time.perf_counter()
+            metrics.SPAWN_SECONDS.observe(spawned - started)
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(), timeout=self.timeout
+                )
+            finally:
+                if process.returncode is None:
+                    # A timed-out or cancelled test must not keep loading the link
+                    with suppress(ProcessLookupError):
+                        process.kill()
+            finished = time.perf_counter()
+            metrics.RUN_SECONDS.observe(finished - started)
+            if process.returncode and not stdout:
+                raise subprocess.CalledProcessError(
+                    process.returncode, "speedtest-cli", stderr=stderr.decode()
+                )
+            if self.executor is None:
+                results = parse_output(stdout)
+            else:
+                results = await self.executor.run(parse_output, stdout)
+            metrics.DECODE_SECONDS.observe(time.perf_counter() - finished)
         except TimeoutError as err:
+            metrics.TIMEOUT_FAILURES.inc()
             raise Exception("Speedtest timed out") from err
         except subprocess.CalledProcessError as e:
+            metrics.EXIT_CODE_FAILURES.inc()
             # Now we can access stderr for better error messages
             error_msg = f"Speedtest failed with exit code {e.returncode}"
             if e.stderr:
                 error_msg += f": {e.stderr.strip()}"
             raise Exception(error_msg) from e
         except json.JSONDecodeError as e:
+            metrics.JSON_DECODE_FAILURES.inc()
             raise Exception(f"Failed to parse speedtest JSON output: {e}") from e
         except Exception as e:
+            metrics.OTHER_FAILURES.inc()
             raise Exception(f"An error occurred: {e}") from e
+        return results
+
+
+def parse_output(stdout: bytes) -> dict:
+    # orjson.JSONDecodeError is a json.JSONDecodeError. Keeping only the used
+    # fields also keeps the result small when it is parsed in a process pool.
+    results = orjson.loads(stdout)
+    return {field: results[field] for field in OUTPUT_FIELDS if field in results}
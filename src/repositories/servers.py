@@ -0,0 +1,112 @@
+import json
+import math
+import os
+import time
+import xml.etree.ElementTree as ET
+
+import httpx
+
+CONFIG_URL = "https://www.speedtest.net/speedtest-config.php"
+SERVERS_URL = "https://www.speedtest.net/speedtest-servers-static.php"
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class ServerCatalogRepository:
+    def __init__(
+        self,
+        path: str = "",
+        ttl: float = 86400,
+        client: httpx.AsyncClient | None = None,
+        config_url: str = CONFIG_URL,
+        servers_url: str = SERVERS_URL,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.client = client
+        self.config_url = config_url
+        self.servers_url = servers_url
+        self._data: dict = {
+            "fetched_at": 0.0,
+            "client": {},
+            "servers": [],
+            "best": None,
+        }
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self._data.update(json.load(f))
+
+    @property
+    def client_config(self) -> dict:
+        return self._data["client"]
+
+    async def nearest_servers(self, count: int = 5) -> list[dict]:
+        if time.time() - self._data["fetched_at"] >= self.ttl:
+            await self.refresh()
+        return self._data["servers"][:count]
+
+    async def refresh(self) -> None:
+        client = self.client or httpx.AsyncClient(timeout=30)
+        try:
+            config = await client.get(self.config_url)
+            config.raise_for_status()
+            servers = await client.get(self.servers_url)
+            servers.raise_for_status()
+        finally:
+            if self.client is None:
+                await client.aclose()
+
+        client_config = ET.fromstring(config.content).find("client").attrib
+        lat, lon = float(client_config["lat"]), float(client_config["lon"])
+        catalog = []
+        for element in ET.fromstring(servers.content).iter("server"):
+            server = dict(element.attrib)
+            server["d"] = _distance_km(
+                lat, lon, float(server["lat"]), float(server["lon"])
+            )
+            catalog.append(server)
+        # Sorted once per refresh so picking the nearest servers is a slice
+        catalog.sort(key=lambda server: server["d"])
+
+        self._data.update(fetched_at=time.time(), client=client_config, servers=catalog)
+        self._save()
+
+    def best_server(self) -> dict | None:
+        best = self._data["best"]
+        if best is None or time.time() - best["selected_at"] >= self.ttl:
+            return None
+        return best
+
+    def remember_best_server(self, server: dict) -> None:
+        if "id" not in server:
+            return
+        self._data["best"] = {**server, "selected_at": time.time()}
+        self._save()
+
+    def forget_best_server(self) -> None:
+        # After a failed test, so the next one selects a server again instead
+        # of retrying an unreachable one until the pin expires
+        if self._data["best"] is None:
+            return
+        self._data["best"] = None
+        self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        # Write-then-rename so a crash never leaves a half written cache
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(self._data, f)
+        os.replace(temporary, self.path)
+
+
+def _distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
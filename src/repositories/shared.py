@@ -0,0 +1,118 @@
+import asyncio
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+# Sequence number and body length, then the body. The sequence is odd while
+# a body is being written, so readers retry instead of seeing half of one.
+HEADER = struct.Struct("<QI")
+HEADER_SIZE = 16
+
+
+class SharedResultStore:
+    # Latest result of every worker process on one host, in a memory-mapped
+    # file (on /dev/shm it stays in memory). Readers only copy the body when
+    # the sequence number changed; a file lock next to it lets one process
+    # at a time measure and publish.
+    def __init__(self, path: str, size: int = 64 * 1024):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        # flock is per open file, so coroutines of this process queue here
+        self._local_lock = asyncio.Lock()
+        # Roles this process holds until it exits, by name
+        self._roles: dict[str, int] = {}
+        # Small named values beside the result, one file each
+        self._entries = f"{path}.d"
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._lock_fd)
+        for fd in self._roles.values():
+            os.close(fd)
+        self._roles.clear()
+
+    def claim(self, role: str) -> bool:
+        # Whether this process holds the role, taking it if it is free. The
+        # kernel drops the lock when the holder exits, so another process
+        # takes over on its next claim.
+        fd = self._roles.get(role)
+        if fd is None:
+            fd = os.open(f"{self.path}.{role}", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._roles[role] = fd
+        return True
+
+    def put(self, name: str, body: bytes) -> None:
+        # Replaced by a rename, so readers see the old or the new body whole
+        os.makedirs(self._entries, mode=0o700, exist_ok=True)
+        temporary = f"{self._entries}/.{name}.{os.getpid()}"
+        with open(temporary, "wb") as file:
+            file.write(body)
+        os.replace(temporary, f"{self._entries}/{name}")
+
+    def get(self, name: str) -> bytes | None:
+        try:
+            with open(f"{self._entries}/{name}", "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, name: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(f"{self._entries}/{name}")
+
+    def read(self, seen: int = 0) -> tuple[int, bytes] | None:
+        # Returns (sequence, body) when something newer than seen is published
+        for _ in range(100):
+            sequence, length = HEADER.unpack_from(self._map)
+            if sequence == seen or sequence == 0:
+                return None
+            if sequence % 2:
+                continue
+            body = self._map[HEADER_SIZE : HEADER_SIZE + length]
+            if HEADER.unpack_from(self._map)[0] == sequence:
+                return sequence, body
+        # A writer died halfway; the next publish repairs the header
+        return None
+
+    def publish(self, body: bytes) -> int:
+        # Only called by the holder of lock(), so there is one writer
+        if HEADER_SIZE + len(body) > len(self._map):
+            raise ValueError(f"Result of {len(body)} bytes does not fit {self.path}")
+        sequence = HEADER.unpack_from(self._map)[0]
+        writing = sequence + 1 if sequence % 2 == 0 else sequence
+        HEADER.pack_into(self._map, 0, writing, 0)
+        self._map[HEADER_SIZE : HEADER_SIZE + len(body)] = body
+        HEADER.pack_into(self._map, 0, writing + 1, len(body))
+        return writing + 1
+
+    @asynccontextmanager
+    async def lock(self, poll_interval: float = 0.05) -> AsyncIterator[None]:
+        # Polls a non-blocking flock, so a cancelled waiter never ends up
+        # holding the lock from a thread it left behind
+        async with self._local_lock:
+            while True:
+                try:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(poll_interval)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
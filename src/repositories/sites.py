@@ -0,0 +1,114 @@
+import math
+import sqlite3
+import threading
+from collections.abc import Sequence
+from datetime import UTC, datetime
+
+from src.models.speedresponse import SpeedMeasurement
+from src.repositories.history import METRICS, group_samples
+from src.sketch import DDSketch
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS site_measurements (
+    site TEXT NOT NULL,
+    ts REAL NOT NULL,
+    download_speed REAL NOT NULL,
+    upload_speed REAL NOT NULL,
+    ping REAL NOT NULL,
+    server_name TEXT NOT NULL,
+    server_location TEXT NOT NULL,
+    PRIMARY KEY (site, ts)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS site_measurements_ts ON site_measurements (ts);
+"""
+
+
+class SiteRepository:
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+
+    def append_batch(self, site: str, measurements: Sequence[SpeedMeasurement]) -> int:
+        # (site, ts) is the key, so a batch an agent retries after a lost
+        # response is not stored twice
+        rows = [
+            (
+                site,
+                measurement.timestamp.timestamp(),
+                measurement.download_speed,
+                measurement.upload_speed,
+                measurement.ping,
+                measurement.server_name,
+                measurement.server_location,
+            )
+            for measurement in measurements
+        ]
+        with self._lock, self._connection:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO site_measurements VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            return self._connection.total_changes - before
+
+    def summaries(self) -> list[tuple[str, int, float, SpeedMeasurement]]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT s.site, s.count, s.first_ts, m.ts, m.download_speed, "
+                "m.upload_speed, m.ping, m.server_name, m.server_location "
+                "FROM (SELECT site, COUNT(*) AS count, MIN(ts) AS first_ts, "
+                "MAX(ts) AS last_ts FROM site_measurements GROUP BY site) AS s "
+                "JOIN site_measurements AS m ON m.site = s.site AND m.ts = s.last_ts "
+                "ORDER BY s.site"
+            ).fetchall()
+        return [
+            (
+                site,
+                count,
+                first_ts,
+                SpeedMeasurement(
+                    timestamp=datetime.fromtimestamp(ts, UTC),
+                    download_speed=download_speed,
+                    upload_speed=upload_speed,
+                    ping=ping,
+                    server_name=server_name,
+                    server_location=server_location,
+                ),
+            )
+            for (
+                site,
+                count,
+                first_ts,
+                ts,
+                download_speed,
+                upload_speed,
+                ping,
+                server_name,
+                server_location,
+            ) in rows
+        ]
+
+    def query(
+        self, start: float, end: float, step: int, site: str | None = None
+    ) -> list[tuple[int, dict[str, DDSketch]]]:
+        # Without a site, every site's measurements are merged per bucket
+        start = math.floor(start / step) * step
+        end = math.ceil(end / step) * step
+        sql = (
+            "SELECT ts, download_speed, upload_speed, ping FROM site_measurements "
+            "WHERE ts >= ? AND ts < ?"
+        )
+        params: tuple = (start, end)
+        if site is not None:
+            sql += " AND site = ?"
+            params += (site,)
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return group_samples(
+            (int(ts // step) * step, dict(zip(METRICS, values, strict=True)))
+            for ts, *values in rows
+        )
@@ -0,0 +1,40 @@
+import os
+import threading
+from collections.abc import Sequence
+
+from src.models.speedresponse import SpeedMeasurement
+
+
+class SpoolRepository:
+    def __init__(self, path: str = ""):
+        # One JSON measurement per line; "" keeps the spool in memory only
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> list[SpeedMeasurement]:
+        if not self.path or not os.path.exists(self.path):
+            return []
+        with self._lock, open(self.path, encoding="utf-8") as file:
+            measurements = []
+            for line in file:
+                # A line cut short by a crash mid-write is dropped
+                try:
+                    measurements.append(SpeedMeasurement.model_validate_json(line))
+                except ValueError:
+                    continue
+            return measurements
+
+    def append(self, measurement: SpeedMeasurement) -> None:
+        if not self.path:
+            return
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(measurement.model_dump_json() + "\n")
+
+    def replace(self, measurements: Sequence[SpeedMeasurement]) -> None:
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp"
+        with self._lock:
+            with open(temporary, "w", encoding="utf-8") as file:
+                file.writelines(m.model_dump_json() + "\n" for m in measurements)
+            os.replace(temporary, self.path)
@@ -0,0 +1,163 @@
+import asyncio
+import socket
+from collections.abc import Callable
+from typing import Literal
+from urllib.parse import urlsplit
+
+# "httpx" moves transfer bodies through the pooled HTTP client, "socket"
+# through RawHttpConnection
+TransferKind = Literal["httpx", "socket"]
+
+RECEIVE_BUFFER_SIZE = 1024 * 1024
+SEND_CHUNK_SIZE = 1024 * 1024
+
+
+class TransferError(Exception):
+    pass
+
+
+class RawHttpConnection:
+    # A keep-alive HTTP/1.1 connection on a plain non-blocking socket, for
+    # throughput measurement only. Request bodies are sent straight from the
+    # caller's memoryview and response bodies are received into one buffer
+    # that is reused and never looked at, so no bytes objects are created
+    # per chunk; only their sizes are reported.
+    def __init__(self, url: str, buffer_size: int = RECEIVE_BUFFER_SIZE):
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise TransferError(f"Unsupported URL for socket transfers: {url}")
+        self.host = parts.hostname or ""
+        self.port = parts.port or 80
+        self._host_header = parts.netloc
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._sock: socket.socket | None = None
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    async def get(self, url: str, on_received: Callable[[int], None]) -> None:
+        await self._request("GET", url, None, on_received, _ignore)
+
+    async def post(
+        self,
+        url: str,
+        body: memoryview,
+        on_sent: Callable[[int], None],
+        chunk_size: int = SEND_CHUNK_SIZE,
+    ) -> None:
+        await self._request("POST", url, body, _ignore, on_sent, chunk_size)
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        body: memoryview | None,
+        on_received: Callable[[int], None],
+        on_sent: Callable[[int], None],
+        chunk_size: int = SEND_CHUNK_SIZE,
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        parts = urlsplit(url)
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+        try:
+            sock = await self._connect()
+            head = f"{method} {target} HTTP/1.1\r\nHost: {self._host_header}\r\n"
+            if body is not None:
+                head += f"Content-Length: {len(body)}\r\n"
+            await loop.sock_sendall(sock, f"{head}\r\n".encode())
+            if body is not None:
+                for offset in range(0, len(body), chunk_size):
+                    chunk = body[offset : offset + chunk_size]
+                    await loop.sock_sendall(sock, chunk)
+                    on_sent(len(chunk))
+            await self._read_response(sock, on_received)
+        except OSError as e:
+            self.close()
+            raise TransferError(f"{method} {url} failed: {e!r}") from e
+        except BaseException:
+            # A request interrupted half way leaves the connection unusable
+            self.close()
+            raise
+
+    async def _connect(self) -> socket.socket:
+        if self._sock is not None:
+            return self._sock
+        loop = asyncio.get_running_loop()
+        family, type_, proto, _, address = (
+            await loop.getaddrinfo(self.host, self.port, type=socket.SOCK_STREAM)
+        )[0]
+        sock = socket.socket(family, type_, proto)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            await loop.sock_connect(sock, address)
+        except BaseException:
+            sock.close()
+            raise
+        self._sock = sock
+        return sock
+
+    async def _read_response(
+        self, sock: socket.socket, on_received: Callable[[int], None]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        view = self._view
+        filled = 0
+        while (end := self._buffer.find(b"\r\n\r\n", 0, filled)) < 0:
+            if filled == len(view):
+                raise TransferError("Response header too large")
+            received = await loop.sock_recv_into(sock, view[filled:])
+            if not received:
+                raise TransferError("Connection closed before a response")
+            filled += received
+
+        status, headers = _parse_head(bytes(view[:end]))
+        if "chunked" in headers.get("transfer-encoding", ""):
+            raise TransferError("Chunked responses are not supported")
+        keep_alive = headers.get("connection", "").lower() != "close"
+        buffered = filled - (end + 4)
+        on_received(buffered)
+        if "content-length" in headers:
+            remaining = int(headers["content-length"]) - buffered
+            if remaining < 0:
+                raise TransferError("Response is longer than its Content-Length")
+            while remaining:
+                received = await loop.sock_recv_into(
+                    sock, view[: min(remaining, len(view))]
+                )
+                if not received:
+                    raise TransferError("Connection closed before the response ended")
+                on_received(received)
+                remaining -= received
+        else:
+            # Without a length the body runs until the server closes
+            keep_alive = False
+            while received := await loop.sock_recv_into(sock, view):
+                on_received(received)
+
+        if not keep_alive:
+            self.close()
+        if status >= 400:
+            raise TransferError(f"Server error '{status}' for {self._host_header}")
+
+
+def _parse_head(head: bytes) -> tuple[int, dict[str, str]]:
+    status_line, *lines = head.decode("latin-1").split("\r\n")
+    try:
+        status = int(status_line.split()[1])
+    except (IndexError, ValueError) as e:
+        raise TransferError(f"Malformed status line: {status_line!r}") from e
+    headers = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+def _ignore(count: int) -> None:
+    pass
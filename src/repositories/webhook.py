@@ -0,0 +1,24 @@
+import httpx
+from pydantic import BaseModel
+
+
+class WebhookRepository:
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 10.0,
+        client: httpx.AsyncClient | None = None,
+    ):
+        self.url = url
+        self.client = client or httpx.AsyncClient(timeout=timeout)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def send(self, payload: BaseModel) -> None:
+        response = await self.client.post(
+            self.url,
+            content=payload.model_dump_json(),
+            headers={"Content-Type": "application/json"},
+        )
+        response.raise_for_status()
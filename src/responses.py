@@ -0,0 +1,47 @@
+from email.utils import parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from src.services.result_cache import EncodedResult
+
+
+class ModelResponse(Response):
+    # Encodes a pydantic model in one pass in pydantic-core. Returning it
+    # skips FastAPI's revalidation of the model and its conversion to plain
+    # Python objects before encoding, which dominates for large responses.
+    media_type = "application/json"
+
+    def render(self, content: BaseModel) -> bytes:
+        return content.__pydantic_serializer__.to_json(content)
+
+
+def conditional_response(
+    request: Request, encoded: EncodedResult, max_age: int
+) -> Response:
+    headers = {
+        "ETag": encoded.etag,
+        "Last-Modified": encoded.last_modified,
+        "Cache-Control": f"max-age={max_age}",
+    }
+    if _not_modified(request, encoded):
+        return Response(status_code=304, headers=headers)
+    return Response(encoded.body, media_type="application/json", headers=headers)
+
+
+def _not_modified(request: Request, encoded: EncodedResult) -> bool:
+    # If-Modified-Since only counts when If-None-Match is absent (RFC 9110)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or encoded.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have whole seconds
+    return int(encoded.modified) <= since.timestamp()
@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src import metrics
+from src.dependencies import get_single_flight
+
+router = APIRouter()
+
+# The single-flight already counts these, so they are read when scraped
+metrics.CallbackMetric(
+    "netspeed_speedtest_executions_total",
+    "Speedtests actually started",
+    "counter",
+    lambda: get_single_flight().executions,
+)
+metrics.CallbackMetric(
+    "netspeed_speedtest_coalesced_total",
+    "Callers that joined an already running speedtest",
+    "counter",
+    lambda: get_single_flight().coalesced,
+)
+metrics.CallbackMetric(
+    "netspeed_speedtest_in_flight",
+    "Speedtests running right now",
+    "gauge",
+    lambda: get_single_flight().in_flight,
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
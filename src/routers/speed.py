@@ -1,18 +1,439 @@
+import math
+import secrets
+import time
+import zlib
+from datetime import UTC, datetime, timedelta
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.requests import HTTPConnection
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import ValidationError
 
-from src.dependencies import get_speed_service
-from src.services.get_speed import SpeedService
+from src.dependencies import (
+    build_speed_service,
+    get_admission_controller,
+    get_fleet_service,
+    get_health_monitor,
+    get_history_service,
+    get_job_manager,
+    get_latency_probe,
+    get_result_cache,
+    get_settings,
+    get_single_flight,
+    get_site_service,
+    get_speed_service,
+    get_speed_stats,
+)
+from src.models.coalescing import CoalescingStats
+from src.models.fleet import FleetTargetStatus
+from src.models.health import HealthResponse
+from src.models.history import HistoryResponse
+from src.models.job import SpeedJob
+from src.models.progress import SpeedProgress
+from src.models.site import SiteBatch, SiteIngestResponse, SiteSummary
+from src.models.speedresponse import (
+    BatchSpeedResponse,
+    LatencyResponse,
+    SpeedMeasurement,
+)
+from src.models.stats import StatsResponse
+from src.repositories.history import EXPORT_COLUMNS
+from src.responses import ModelResponse, conditional_response
+from src.services.admission import AdmissionController, RateLimitedError
+from src.services.export import MEDIA_TYPES, ExportFormat, ExportUnavailableError
+from src.services.fleet import FleetService
+from src.services.get_speed import SPEEDTEST_KEY, SpeedService
+from src.services.health import HealthMonitor
+from src.services.history import HistoryService
+from src.services.jobs import JobManager
+from src.services.probe import LatencyProbe
+from src.services.result_cache import ResultCache
+from src.services.single_flight import SingleFlight
+from src.services.sites import SiteService
+from src.services.stats import MAX_WINDOW, SpeedStats
+from src.settings import Settings
 
 router = APIRouter()
 
+MAX_HISTORY_BUCKETS = 10_000
 
-@router.get("/speed")
-async def get_speed(speed_service: Annotated[SpeedService, Depends(get_speed_service)]):
+# Each run saturates the link for tens of seconds
+MAX_BATCH_RUNS = 10
+
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# Size limit for a batch pushed by an agent, as sent and decompressed
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+
+@router.get("/speed", response_model=SpeedMeasurement)
+async def get_speed(
+    request: Request,
+    speed_service: Annotated[SpeedService, Depends(get_speed_service)],
+    result_cache: Annotated[ResultCache, Depends(get_result_cache)],
+    max_age: Annotated[
+        float | None,
+        Query(ge=0, description="Maximum age in seconds of a cached result"),
+    ] = None,
+) -> Response:
+    try:
+        measurement = await speed_service.get_speedtest_results(
+            max_age=max_age, client=_client(request)
+        )
+    except RateLimitedError as e:
+        raise _too_many_requests(e) from e
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to get speed test results: {str(e)}"
+        ) from e
+    return _measurement_response(request, result_cache, measurement)
+
+
+@router.post("/speed/batch")
+async def run_speed_batch(
+    request: Request,
+    speed_service: Annotated[SpeedService, Depends(get_speed_service)],
+    runs: Annotated[
+        int, Query(ge=1, le=MAX_BATCH_RUNS, description="Speed tests to run")
+    ] = 3,
+) -> BatchSpeedResponse:
     try:
-        return await speed_service.get_speedtest_results()
+        return await speed_service.run_batch(runs, client=_client(request))
+    except RateLimitedError as e:
+        raise _too_many_requests(e) from e
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to get speed test results: {str(e)}"
         ) from e
+
+
+@router.get("/speed/stream")
+async def stream_speed(
+    request: Request,
+    speed_service: Annotated[SpeedService, Depends(get_speed_service)],
+    admission: Annotated[AdmissionController, Depends(get_admission_controller)],
+):
+    try:
+        admission.admit_client(_client(request))
+    except RateLimitedError as e:
+        raise _too_many_requests(e) from e
+
+    async def events():
+        async for progress in _progress_events(speed_service):
+            yield f"event: {progress.event}\ndata: {progress.model_dump_json()}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/speed/ws")
+async def speed_websocket(
+    websocket: WebSocket,
+    speed_service: Annotated[SpeedService, Depends(get_speed_service)],
+    admission: Annotated[AdmissionController, Depends(get_admission_controller)],
+):
+    await websocket.accept()
+    try:
+        admission.admit_client(_client(websocket))
+    except RateLimitedError as e:
+        error = SpeedProgress(event="error", detail=str(e))
+        await websocket.send_json(error.model_dump(mode="json"))
+        # 1013: try again later
+        await websocket.close(code=1013)
+        return
+    try:
+        async for progress in _progress_events(speed_service):
+            await websocket.send_json(progress.model_dump(mode="json"))
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
+
+
+# The job routes are async so the job manager and admission state are only
+# ever touched from the event loop, never from FastAPI's threadpool
+@router.post("/speed/jobs", status_code=202)
+async def create_speed_job(
+    request: Request,
+    job_manager: Annotated[JobManager, Depends(get_job_manager)],
+    admission: Annotated[AdmissionController, Depends(get_admission_controller)],
+) -> SpeedJob:
+    try:
+        admission.admit_client(_client(request))
+    except RateLimitedError as e:
+        raise _too_many_requests(e) from e
+    # Submitting while a speedtest job is queued or running returns it
+    job = job_manager.submit(SPEEDTEST_KEY, lambda: build_speed_service().measure())
+    return ORJSONResponse(
+        job.model_dump(mode="json"),
+        status_code=202,
+        headers={"Location": f"/speed/jobs/{job.id}"},
+    )
+
+
+@router.get("/speed/jobs/{job_id}")
+async def get_speed_job(
+    job_id: str, job_manager: Annotated[JobManager, Depends(get_job_manager)]
+) -> SpeedJob:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# Async like the job routes: reading the cache may adopt another worker's
+# result, which must only happen on the event loop
+@router.get("/speed/latest", response_model=SpeedMeasurement)
+async def get_latest_speed(
+    request: Request,
+    result_cache: Annotated[ResultCache, Depends(get_result_cache)],
+) -> Response:
+    if result_cache.latest is None:
+        raise HTTPException(
+            status_code=404, detail="No speed test results available yet"
+        )
+    return _measurement_response(request, result_cache, result_cache.latest)
+
+
+@router.get("/speed/latency")
+def get_latency(
+    latency_probe: Annotated[LatencyProbe | None, Depends(get_latency_probe)],
+) -> LatencyResponse:
+    if latency_probe is None:
+        raise HTTPException(status_code=404, detail="Latency probe is disabled")
+    return latency_probe.snapshot()
+
+
+@router.get("/speed/health")
+def get_speed_health(
+    health_monitor: Annotated[HealthMonitor, Depends(get_health_monitor)],
+) -> HealthResponse:
+    return health_monitor.snapshot()
+
+
+@router.get("/speed/history", response_model=HistoryResponse)
+async def get_speed_history(
+    history_service: Annotated[HistoryService, Depends(get_history_service)],
+    start: Annotated[
+        datetime | None, Query(alias="from", description="Defaults to 24h before to")
+    ] = None,
+    end: Annotated[
+        datetime | None, Query(alias="to", description="Defaults to now")
+    ] = None,
+    step: Annotated[int, Query(ge=1, description="Bucket size in seconds")] = 3600,
+) -> ModelResponse:
+    start, end = _history_range(start, end, step)
+    return ModelResponse(await history_service.get_history(start, end, step))
+
+
+@router.get("/speed/export")
+def export_speed_history(
+    history_service: Annotated[HistoryService, Depends(get_history_service)],
+    format: ExportFormat = "csv",
+    start: Annotated[
+        datetime | None,
+        Query(alias="from", description="Defaults to the oldest measurement"),
+    ] = None,
+    end: Annotated[
+        datetime | None, Query(alias="to", description="Defaults to the newest")
+    ] = None,
+    columns: Annotated[
+        str | None, Query(description="Comma separated, defaults to all columns")
+    ] = None,
+) -> StreamingResponse:
+    start = _as_utc(start) if start else None
+    end = _as_utc(end) if end else None
+    if start and end and start >= end:
+        raise HTTPException(status_code=422, detail="'from' must be before 'to'")
+    selected = tuple(c.strip() for c in columns.split(",")) if columns else None
+    if selected is not None:
+        unknown = [c for c in selected if c not in EXPORT_COLUMNS]
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Columns must be among {', '.join(EXPORT_COLUMNS)}",
+            )
+    try:
+        chunks = history_service.export(start, end, selected or EXPORT_COLUMNS, format)
+    except ExportUnavailableError as e:
+        raise HTTPException(status_code=501, detail=str(e)) from e
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="history.{format}"'},
+    )
+
+
+@router.get("/speed/stats")
+def get_speed_stats_window(
+    speed_stats: Annotated[SpeedStats, Depends(get_speed_stats)],
+    window: Annotated[
+        str,
+        Query(
+            pattern=r"^\d+[smhd]?$",
+            description="Window ending now, e.g. 3600, 90m, 24h or 30d",
+        ),
+    ] = "1h",
+) -> StatsResponse:
+    seconds = int(window.rstrip("smhd")) * WINDOW_UNITS.get(window[-1], 1)
+    if not 0 < seconds <= MAX_WINDOW:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Window must be between 1 and {MAX_WINDOW} seconds",
+        )
+    return speed_stats.get_stats(seconds)
+
+
+@router.post("/speed/sites/ingest")
+async def ingest_site_batch(
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+    site_service: Annotated[SiteService, Depends(get_site_service)],
+) -> SiteIngestResponse:
+    if not settings.coordinator:
+        raise HTTPException(status_code=404, detail="Coordinator mode is disabled")
+    if settings.coordinator_token and not secrets.compare_digest(
+        request.headers.get("authorization", ""),
+        f"Bearer {settings.coordinator_token}",
+    ):
+        raise HTTPException(status_code=401, detail="Invalid coordinator token")
+
+    body = await _read_body(request)
+    if request.headers.get("content-encoding") == "gzip":
+        body = _gunzip(body)
+    try:
+        batch = SiteBatch.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False)) from e
+    return SiteIngestResponse(accepted=await site_service.ingest(batch))
+
+
+@router.get("/speed/sites")
+async def get_sites(
+    site_service: Annotated[SiteService, Depends(get_site_service)],
+) -> list[SiteSummary]:
+    return await site_service.get_sites()
+
+
+@router.get("/speed/sites/history", response_model=HistoryResponse)
+async def get_sites_history(
+    site_service: Annotated[SiteService, Depends(get_site_service)],
+    site: Annotated[
+        str | None, Query(description="Defaults to all sites merged")
+    ] = None,
+    start: Annotated[
+        datetime | None, Query(alias="from", description="Defaults to 24h before to")
+    ] = None,
+    end: Annotated[
+        datetime | None, Query(alias="to", description="Defaults to now")
+    ] = None,
+    step: Annotated[int, Query(ge=1, description="Bucket size in seconds")] = 3600,
+) -> ModelResponse:
+    start, end = _history_range(start, end, step)
+    return ModelResponse(await site_service.get_history(start, end, step, site))
+
+
+@router.get("/speed/coalescing")
+def get_coalescing_stats(
+    single_flight: Annotated[SingleFlight, Depends(get_single_flight)],
+) -> CoalescingStats:
+    return CoalescingStats(
+        executions=single_flight.executions,
+        coalesced=single_flight.coalesced,
+        in_flight=single_flight.in_flight,
+    )
+
+
+@router.get("/speed/fleet")
+def get_fleet(
+    fleet_service: Annotated[FleetService, Depends(get_fleet_service)],
+) -> list[FleetTargetStatus]:
+    return fleet_service.statuses()
+
+
+async def _progress_events(speed_service: SpeedService):
+    events = speed_service.stream_speedtest_results()
+    try:
+        async for progress in events:
+            yield progress
+    except Exception as e:
+        yield SpeedProgress(
+            event="error", detail=f"Failed to get speed test results: {str(e)}"
+        )
+    finally:
+        await events.aclose()
+
+
+def _client(connection: HTTPConnection) -> str:
+    # The peer address; behind a proxy run uvicorn with --proxy-headers
+    return connection.client.host if connection.client else "unknown"
+
+
+def _too_many_requests(error: RateLimitedError) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))},
+    )
+
+
+def _measurement_response(
+    request: Request, result_cache: ResultCache, measurement: SpeedMeasurement
+) -> Response:
+    # Shared caches may keep the result for as long as this service would
+    age = time.time() - measurement.timestamp.timestamp()
+    max_age = max(0, int(result_cache.ttl - age))
+    return conditional_response(request, result_cache.encode(measurement), max_age)
+
+
+async def _read_body(request: Request) -> bytes:
+    # Read until the limit only, so an oversized push is never buffered whole
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BATCH_BYTES:
+            raise HTTPException(status_code=413, detail="Batch is too large")
+    return bytes(body)
+
+
+def _gunzip(body: bytes) -> bytes:
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_BATCH_BYTES)
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail="Invalid gzip body") from e
+    if decompressor.unconsumed_tail:
+        raise HTTPException(status_code=413, detail="Batch is too large")
+    return data
+
+
+def _history_range(
+    start: datetime | None, end: datetime | None, step: int
+) -> tuple[datetime, datetime]:
+    end = _as_utc(end) if end else datetime.now(UTC)
+    start = _as_utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=422, detail="'from' must be before 'to'")
+    if (end - start).total_seconds() / step > MAX_HISTORY_BUCKETS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Range would return more than {MAX_HISTORY_BUCKETS} buckets",
+        )
+    return start, end
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Timestamps without an explicit offset are taken to be UTC
+    return value if value.tzinfo else value.replace(tzinfo=UTC)
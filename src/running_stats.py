@@ -0,0 +1,56 @@
+import math
+from collections import deque
+from statistics import NormalDist
+
+
+class RunningStats:
+    # Welford's update, which stays stable where the naive sum of squares
+    # cancels out for large, close together values such as bits per second
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def margin(self, confidence: float = 0.95) -> float | None:
+        # Half-width of the confidence interval of the mean relative to the
+        # mean, using the normal approximation
+        if self.count < 2 or self.mean == 0:
+            return None
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        return z * math.sqrt(self.variance / self.count) / abs(self.mean)
+
+
+class RollingMean:
+    # A running sum of the window, recomputed every size updates so floating
+    # point error cannot build up over a long-running probe
+    def __init__(self, size: int):
+        self.values: deque[float] = deque(maxlen=size)
+        self._sum = 0.0
+        self._updates = 0
+
+    def add(self, value: float) -> None:
+        if len(self.values) == self.values.maxlen:
+            self._sum -= self.values[0]
+        self.values.append(value)
+        self._sum += value
+        self._updates += 1
+        if self._updates % self.values.maxlen == 0:
+            self._sum = math.fsum(self.values)
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    @property
+    def mean(self) -> float | None:
+        return self._sum / len(self.values) if self.values else None
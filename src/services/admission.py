@@ -0,0 +1,114 @@
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from typing import Literal
+
+from src import metrics
+
+# Scheduled runs may use the part of the global budget held back from users
+Priority = Literal["scheduled", "user"]
+
+WINDOW = 3600.0
+
+
+class RateLimitedError(Exception):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        # Seconds until the request would be admitted
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    # Holds up to capacity tokens, refilled at rate tokens per second
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        # Takes a token and returns 0, or returns the seconds until one is due
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full_at(self) -> float:
+        return self.updated + (self.capacity - self.tokens) / self.rate
+
+
+class AdmissionController:
+    # Each client has a bucket of client_burst tests refilled at client_rate
+    # per hour, dropped once full again (the same as a new one) or when more
+    # than max_clients are tracked. At most global_limit tests start per
+    # sliding hour, reserved of them for scheduled runs. 0 turns a check off.
+    def __init__(
+        self,
+        client_rate: float = 0.0,
+        client_burst: int = 1,
+        global_limit: int = 0,
+        reserved: int = 0,
+        max_clients: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+        self.global_limit = global_limit
+        self.reserved = reserved
+        self.max_clients = max_clients
+        self.clock = clock
+        self._clients: OrderedDict[str, TokenBucket] = OrderedDict()
+        # Start times of the tests in the last hour, oldest first
+        self._started: deque[float] = deque()
+
+    @property
+    def tracked_clients(self) -> int:
+        return len(self._clients)
+
+    def admit_client(self, client: str) -> None:
+        if self.client_rate <= 0:
+            return
+        now = self.clock()
+        bucket = self._clients.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.client_burst, self.client_rate / WINDOW, now)
+            self._clients[client] = bucket
+        else:
+            self._clients.move_to_end(client)
+        retry_after = bucket.take(now)
+        self._evict(now)
+        if retry_after:
+            metrics.CLIENT_REJECTIONS.inc()
+            raise RateLimitedError("Too many speedtests from this client", retry_after)
+
+    def admit_measurement(self, priority: Priority = "user") -> None:
+        if self.global_limit <= 0:
+            return
+        now = self.clock()
+        while self._started and self._started[0] <= now - WINDOW:
+            self._started.popleft()
+        limit = self.global_limit
+        if priority == "user":
+            limit -= self.reserved
+        if len(self._started) >= limit:
+            metrics.GLOBAL_REJECTIONS.inc()
+            # A slot frees up once enough of the oldest tests leave the hour
+            index = len(self._started) - limit
+            retry_after = (
+                self._started[index] + WINDOW - now
+                if index < len(self._started)
+                else WINDOW
+            )
+            raise RateLimitedError("Hourly speedtest limit reached", retry_after)
+        self._started.append(now)
+
+    def _evict(self, now: float) -> None:
+        while self._clients:
+            client, bucket = next(iter(self._clients.items()))
+            if len(self._clients) <= self.max_clients and bucket.full_at() > now:
+                break
+            del self._clients[client]
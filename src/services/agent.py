@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+from src.models.speedresponse import SpeedMeasurement
+from src.repositories.coordinator import CoordinatorRepository
+from src.repositories.spool import SpoolRepository
+
+# Upper bound for the retry delay while the coordinator is unreachable
+MAX_RETRY_DELAY = 900.0
+
+logger = logging.getLogger(__name__)
+
+
+class AgentService:
+    def __init__(
+        self,
+        site: str,
+        coordinator: CoordinatorRepository,
+        spool: SpoolRepository,
+        batch_size: int = 100,
+        flush_interval: float = 30.0,
+        max_spooled: int = 10_000,
+    ):
+        self.site = site
+        self.coordinator = coordinator
+        self.spool = spool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_spooled = max_spooled
+        # Consecutive failed flushes, drives the retry backoff
+        self.failures = 0
+        self._pending: list[SpeedMeasurement] = []
+        self._spool_lock = asyncio.Lock()
+        self._batch_ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def start(self) -> None:
+        if self._task is None:
+            # Results spooled before a restart are sent first
+            self._pending = await asyncio.to_thread(self.spool.load)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def record(self, measurement: SpeedMeasurement) -> None:
+        async with self._spool_lock:
+            self._pending.append(measurement)
+            if len(self._pending) > self.max_spooled:
+                # The oldest results go first when the coordinator stays down
+                del self._pending[: len(self._pending) - self.max_spooled]
+                await asyncio.to_thread(self.spool.replace, list(self._pending))
+            else:
+                await asyncio.to_thread(self.spool.append, measurement)
+        if len(self._pending) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def flush(self) -> None:
+        while self._pending:
+            batch = self._pending[: self.batch_size]
+            await self.coordinator.push(self.site, batch)
+            sent = {id(measurement) for measurement in batch}
+            async with self._spool_lock:
+                self._pending = [m for m in self._pending if id(m) not in sent]
+                await asyncio.to_thread(self.spool.replace, list(self._pending))
+
+    async def _run(self) -> None:
+        while True:
+            if self.failures:
+                await asyncio.sleep(self.retry_delay())
+            else:
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), timeout=self.flush_interval
+                    )
+                except TimeoutError:
+                    pass
+            self._batch_ready.clear()
+            try:
+                await self.flush()
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                logger.warning(
+                    "Pushing %d results to the coordinator failed: %s",
+                    len(self._pending),
+                    e,
+                )
+
+    def retry_delay(self) -> float:
+        return min(self.flush_interval * 2 ** (self.failures - 1), MAX_RETRY_DELAY)
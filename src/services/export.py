@@ -0,0 +1,130 @@
+import csv
+import io
+from collections.abc import Iterable, Iterator
+from datetime import UTC, datetime
+from typing import Literal
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - only needed for arrow and parquet
+    pyarrow = None
+
+ExportFormat = Literal["csv", "arrow", "parquet"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportUnavailableError(Exception):
+    pass
+
+
+def export_chunks(
+    batches: Iterable[list[tuple]], columns: tuple[str, ...], format: ExportFormat
+) -> Iterator[bytes]:
+    # Checked before the first chunk, while an error status can still be sent
+    if format == "csv":
+        return _csv_chunks(batches, columns)
+    if pyarrow is None:
+        raise ExportUnavailableError(
+            f"{format} exports need pyarrow, install netspeed[export]"
+        )
+    return _arrow_chunks(batches, columns, format)
+
+
+def _csv_chunks(
+    batches: Iterable[list[tuple]], columns: tuple[str, ...]
+) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    yield _drain(buffer)
+    timestamp = columns.index("timestamp") if "timestamp" in columns else None
+    for rows in batches:
+        if timestamp is not None:
+            rows = [_with_iso_timestamp(row, timestamp) for row in rows]
+        writer.writerows(rows)
+        yield _drain(buffer)
+
+
+def _with_iso_timestamp(row: tuple, index: int) -> tuple:
+    iso = datetime.fromtimestamp(row[index], UTC).isoformat()
+    return (*row[:index], iso, *row[index + 1 :])
+
+
+def _drain(buffer: io.StringIO) -> bytes:
+    data = buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file that hands written bytes back as chunks. It keeps
+    # counting the position, which the parquet footer's offsets rely on.
+    def __init__(self):
+        self.chunks: list[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _schema(columns: tuple[str, ...]) -> "pyarrow.Schema":
+    types = {
+        "timestamp": pyarrow.timestamp("us", tz="UTC"),
+        "download_speed": pyarrow.float64(),
+        "upload_speed": pyarrow.float64(),
+        "ping": pyarrow.float64(),
+        "server_name": pyarrow.string(),
+        "server_location": pyarrow.string(),
+    }
+    return pyarrow.schema([(column, types[column]) for column in columns])
+
+
+def _record_batch(rows: list[tuple], schema: "pyarrow.Schema") -> "pyarrow.RecordBatch":
+    arrays = []
+    for field, values in zip(schema, zip(*rows, strict=True), strict=True):
+        if field.name == "timestamp":
+            values = [round(ts * 1_000_000) for ts in values]
+        arrays.append(pyarrow.array(values, field.type))
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _arrow_chunks(
+    batches: Iterable[list[tuple]], columns: tuple[str, ...], format: ExportFormat
+) -> Iterator[bytes]:
+    schema = _schema(columns)
+    sink = _ChunkSink()
+    # Arrow streams get one record batch and parquet files one row group per
+    # batch read from the database, each sent as soon as it is written
+    if format == "arrow":
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    else:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    with writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(rows, schema))
+            if chunk := sink.take():
+                yield chunk
+    # The end of stream marker or parquet footer, and the schema if no batch
+    # was written
+    yield sink.take()
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import defaultdict
+from collections.abc import Callable, Sequence
+from contextlib import nullcontext
+from datetime import UTC, datetime
+
+from src.models.fleet import DEFAULT_LINK, FleetTarget, FleetTargetStatus
+from src.repositories.base import SpeedtestRepository
+from src.repositories.shared import SharedResultStore
+from src.services.get_speed import to_measurement
+from src.services.link_lock import LinkLock
+
+logger = logging.getLogger(__name__)
+
+FLEET_ROLE = "fleet"
+
+
+class FleetService:
+    def __init__(
+        self,
+        targets: Sequence[FleetTarget],
+        repository_factory: Callable[[FleetTarget], SpeedtestRepository],
+        concurrency: int = 1,
+        timeout: float = 120.0,
+        interval: float = 3600.0,
+        jitter: float = 0.0,
+        link_lock: LinkLock | None = None,
+        shared: SharedResultStore | None = None,
+    ):
+        self.targets = list(targets)
+        self.repositories = {
+            target.name: repository_factory(target) for target in self.targets
+        }
+        self.timeout = timeout
+        self.interval = interval
+        self.jitter = jitter
+        # Global budget of concurrent tests; asyncio.Semaphore wakes waiters
+        # in FIFO order, so every target gets its turn
+        self._budget = asyncio.Semaphore(concurrency)
+        self._links: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        # Shared with SpeedService, which measures on the default link too
+        self.link_lock = link_lock
+        # Every worker process starts the fleet; with a shared store only the
+        # one holding the fleet role measures and publishes the statuses
+        self.shared = shared
+        self._leading = False
+        self._statuses = {
+            target.name: FleetTargetStatus(name=target.name, link=target.link)
+            for target in self.targets
+        }
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            # Each target runs on its own loop, so a slow or hanging target
+            # only delays itself and the targets sharing its link
+            self._tasks = [
+                asyncio.create_task(self._run_forever(target))
+                for target in self.targets
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def statuses(self) -> list[FleetTargetStatus]:
+        if self.shared is not None and not self._leading:
+            body = self.shared.get(FLEET_ROLE)
+            if body is not None:
+                return [FleetTargetStatus.model_validate(s) for s in json.loads(body)]
+        return list(self._statuses.values())
+
+    async def run_target(self, target: FleetTarget) -> FleetTargetStatus:
+        status = self._statuses[target.name]
+        # The link is taken before a budget slot, so waiting for a busy link
+        # does not hold a slot another link could use
+        shared_link = (
+            self.link_lock.hold()
+            if target.link == DEFAULT_LINK and self.link_lock is not None
+            else nullcontext()
+        )
+        async with self._links[target.link], shared_link, self._budget:
+            status.status = "running"
+            try:
+                results = await asyncio.wait_for(
+                    self.repositories[target.name].get_speedtest_results(),
+                    timeout=self.timeout,
+                )
+                status.result = to_measurement(results)
+                status.status = "succeeded"
+                status.error = None
+            except TimeoutError:
+                status.status = "failed"
+                status.error = "Speedtest timed out"
+            except Exception as e:
+                status.status = "failed"
+                status.error = str(e)
+            status.last_run = datetime.now(UTC)
+        if status.status == "failed":
+            logger.warning("Fleet target %s failed: %s", target.name, status.error)
+        if self.shared is not None:
+            self.shared.put(
+                FLEET_ROLE,
+                json.dumps(
+                    [s.model_dump(mode="json") for s in self._statuses.values()]
+                ).encode(),
+            )
+        return status
+
+    async def _run_forever(self, target: FleetTarget) -> None:
+        while True:
+            started = time.monotonic()
+            if self.shared is None or self.shared.claim(FLEET_ROLE):
+                self._leading = True
+                await self.run_target(target)
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(0.0, self.next_delay() - elapsed))
+
+    def next_delay(self) -> float:
+        return max(0.0, self.interval + random.uniform(-self.jitter, self.jitter))
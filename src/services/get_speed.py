@@ -1,22 +1,278 @@
-from src.models.speedresponse import SpeedResponse
-from src.repositories.requester import RequestRepository
+import asyncio
+import logging
+import statistics
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+from datetime import UTC, datetime
+from typing import Protocol
+
+from src import metrics
+from src.models.progress import SpeedProgress
+from src.models.speedresponse import BatchSpeedResponse, MetricSpread, SpeedMeasurement
+from src.repositories.base import SpeedtestRepository, StreamingSpeedtestRepository
+from src.repositories.history import METRICS
+from src.services.admission import AdmissionController, Priority, RateLimitedError
+from src.services.link_lock import LinkLock
+from src.services.result_cache import ResultCache
+from src.services.single_flight import SingleFlight
+
+SPEEDTEST_KEY = "speedtest"
+
+# Seconds between keep-alive progress events while no other progress arrives
+HEARTBEAT_INTERVAL = 5.0
+
+logger = logging.getLogger(__name__)
+
+# Strong references to background refreshes so they are not garbage collected
+_background_tasks: set[asyncio.Task] = set()
+
+
+class MeasurementSink(Protocol):
+    async def record(self, measurement: SpeedMeasurement) -> None: ...
 
 
 class SpeedService:
-    def __init__(self, request_repository: RequestRepository):
+    def __init__(
+        self,
+        request_repository: SpeedtestRepository,
+        single_flight: SingleFlight | None = None,
+        result_cache: ResultCache | None = None,
+        sinks: Sequence[MeasurementSink] = (),
+        admission: AdmissionController | None = None,
+        link_lock: LinkLock | None = None,
+    ):
         self.request_repository = request_repository
+        self.single_flight = single_flight or SingleFlight()
+        self.result_cache = result_cache
+        self.sinks = sinks
+        self.admission = admission
+        self.link_lock = link_lock
 
-    async def get_speedtest_results(self) -> SpeedResponse:
-        results = await self.request_repository.get_speedtest_results()
+    async def get_speedtest_results(
+        self, max_age: float | None = None, client: str | None = None
+    ) -> SpeedMeasurement:
+        if self.result_cache is not None:
+            cached = self.result_cache.get(
+                self.result_cache.ttl if max_age is None else max_age
+            )
+            if cached is not None:
+                return cached
+
+            # Without an explicit freshness requirement an expired result is
+            # served immediately while a new one is measured in the background
+            stale = self.result_cache.get_stale() if max_age is None else None
+            if stale is not None:
+                self._refresh_in_background()
+                return stale
 
-        # Convert from bits per second to megabits per second (Mbps)
-        download_mbps = round(results["download"] / 1_000_000, 2)
-        upload_mbps = round(results["upload"] / 1_000_000, 2)
+        # Only requests that wait for a speedtest count against their client
+        if self.admission is not None and client is not None:
+            self.admission.admit_client(client)
+        return await self.measure()
 
-        return SpeedResponse(
-            download_speed=download_mbps,
-            upload_speed=upload_mbps,
-            ping=results["ping"],
-            server_name=results["server"]["name"],
-            server_location=results["server"]["country"],
+    async def measure(self, priority: Priority = "user") -> SpeedMeasurement:
+        # Callers arriving while a speedtest is running share its result
+        return await self.single_flight.do(
+            SPEEDTEST_KEY, lambda: self._run_speedtest(priority)
         )
+
+    async def run_batch(
+        self, runs: int, client: str | None = None
+    ) -> BatchSpeedResponse:
+        # Back to back, so each run has the link to itself; the engines keep
+        # the selected server (and the library engine its session) between
+        # runs, so only the first one pays for selection
+        if self.admission is not None and client is not None:
+            self.admission.admit_client(client)
+        measurements = []
+        failure = None
+        for _ in range(runs):
+            try:
+                # Not coalesced with other callers nor taken from another
+                # worker: the spread needs runs that are really independent
+                measurements.append(
+                    await self._exclusive(self._measure_once, "user", reuse=False)
+                )
+            except RateLimitedError:
+                raise
+            except Exception as e:
+                failure = e
+                logger.warning("Speedtest of a batch failed: %s", e)
+        if not measurements:
+            raise failure
+        spreads = {
+            metric: spread([getattr(m, metric) for m in measurements])
+            for metric in METRICS
+        }
+        return BatchSpeedResponse(
+            **{metric: spreads[metric].median for metric in METRICS},
+            **{
+                f"{metric.removesuffix('_speed')}_spread": spreads[metric]
+                for metric in METRICS
+            },
+            server_name=measurements[-1].server_name,
+            server_location=measurements[-1].server_location,
+            runs=measurements,
+            failed=runs - len(measurements),
+        )
+
+    async def stream_speedtest_results(self) -> AsyncIterator[SpeedProgress]:
+        progress: asyncio.Queue[SpeedProgress] = asyncio.Queue()
+
+        async def stream() -> SpeedMeasurement:
+            async for event in self.request_repository.stream_speedtest_results():
+                if event["event"] == "result":
+                    return await self._record(event["results"])
+                progress.put_nowait(_to_progress(event))
+            raise Exception("Speedtest ended without a result")
+
+        async def run() -> SpeedMeasurement:
+            if not isinstance(self.request_repository, StreamingSpeedtestRepository):
+                return await self._run_speedtest("user")
+            return await self._exclusive(stream, "user")
+
+        # Joining the single-flight means a stream either drives the shared
+        # measurement or, if one is already running, waits for it with
+        # heartbeats; /speed callers coalesce onto a streamed run as well
+        flight = asyncio.ensure_future(self.single_flight.do(SPEEDTEST_KEY, run))
+        started = time.monotonic()
+        try:
+            while not flight.done():
+                next_event = asyncio.ensure_future(progress.get())
+                await asyncio.wait(
+                    {flight, next_event},
+                    timeout=HEARTBEAT_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if next_event.done():
+                    yield next_event.result()
+                    continue
+                next_event.cancel()
+                if not flight.done():
+                    yield SpeedProgress(
+                        event="progress", elapsed=time.monotonic() - started
+                    )
+            while not progress.empty():
+                yield progress.get_nowait()
+            yield SpeedProgress(event="result", result=flight.result())
+        finally:
+            # Only stops this caller waiting; the shared measurement carries on
+            flight.cancel()
+
+    def _refresh_in_background(self) -> None:
+        # Stale hits while a speedtest runs are refreshed by that one
+        if self.single_flight.running(SPEEDTEST_KEY):
+            return
+        task = self.single_flight.start(
+            SPEEDTEST_KEY, lambda: self._run_speedtest("user")
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_finish_background_refresh)
+
+    async def _run_speedtest(self, priority: Priority) -> SpeedMeasurement:
+        return await self._exclusive(self._measure_once, priority)
+
+    async def _measure_once(self) -> SpeedMeasurement:
+        results = await self.request_repository.get_speedtest_results()
+        return await self._record(results)
+
+    async def _exclusive(
+        self,
+        run: Callable[[], Awaitable[SpeedMeasurement]],
+        priority: Priority,
+        reuse: bool = True,
+    ) -> SpeedMeasurement:
+        # Single-flight only coalesces speedtests; the link lock also keeps
+        # fleet tests on the same uplink, batch runs and, with a shared
+        # store, other workers out. A result a batch run or another worker
+        # measured while we waited is taken instead of measuring again.
+        if self.link_lock is None:
+            self._admit(priority)
+            return await run()
+        requested = datetime.now(UTC)
+        async with self.link_lock.hold():
+            if reuse and self.result_cache is not None:
+                latest = self.result_cache.latest
+                if latest is not None and latest.timestamp >= requested:
+                    return latest
+            self._admit(priority)
+            return await run()
+
+    def _admit(self, priority: Priority) -> None:
+        # Counted when a speedtest really starts, not per coalesced caller
+        if self.admission is not None:
+            self.admission.admit_measurement(priority)
+
+    async def _record(self, results: dict) -> SpeedMeasurement:
+        measurement = to_measurement(results)
+        metrics.LAST_DOWNLOAD.set(measurement.download_speed)
+        metrics.LAST_UPLOAD.set(measurement.upload_speed)
+        metrics.LAST_PING.set(measurement.ping)
+        metrics.LAST_TIMESTAMP.set(measurement.timestamp.timestamp())
+        if self.result_cache is not None:
+            self.result_cache.store(measurement)
+        for sink in self.sinks:
+            # A failing sink must not cost the caller their measurement
+            try:
+                await sink.record(measurement)
+            except Exception as e:
+                logger.warning("Failed to record measurement in %r: %s", sink, e)
+        return measurement
+
+
+def to_measurement(results: dict) -> SpeedMeasurement:
+    started = time.perf_counter()
+    # Convert from bits per second to megabits per second (Mbps)
+    download_mbps = round(results["download"] / 1_000_000, 2)
+    upload_mbps = round(results["upload"] / 1_000_000, 2)
+
+    measurement = SpeedMeasurement(
+        download_speed=download_mbps,
+        upload_speed=upload_mbps,
+        ping=results["ping"],
+        jitter=results.get("jitter"),
+        server_name=results["server"]["name"],
+        server_location=results["server"]["country"],
+        download_margin=_round_margin(results.get("download_margin")),
+        upload_margin=_round_margin(results.get("upload_margin")),
+        timestamp=datetime.now(UTC),
+    )
+    metrics.VALIDATE_SECONDS.observe(time.perf_counter() - started)
+    return measurement
+
+
+def spread(values: list[float]) -> MetricSpread:
+    # Tukey's fences: values beyond 1.5 IQR of the quartiles are outliers
+    q1, _, q3 = _quartiles(values)
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    outliers = [i for i, value in enumerate(values) if not low <= value <= high]
+    q1, median, q3 = _quartiles(
+        [value for i, value in enumerate(values) if i not in outliers]
+    )
+    return MetricSpread(median=median, q1=q1, q3=q3, iqr=q3 - q1, outliers=outliers)
+
+
+def _quartiles(values: list[float]) -> list[float]:
+    if len(values) == 1:
+        return values * 3
+    return statistics.quantiles(values, n=4, method="inclusive")
+
+
+def _round_margin(margin: float | None) -> float | None:
+    return None if margin is None else round(margin, 4)
+
+
+def _to_progress(event: dict) -> SpeedProgress:
+    bits_per_second = event.get("bits_per_second")
+    return SpeedProgress(
+        event=event["event"],
+        phase=event.get("phase"),
+        speed=None if bits_per_second is None else round(bits_per_second / 1e6, 2),
+        elapsed=event.get("elapsed"),
+    )
+
+
+def _finish_background_refresh(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Background speedtest refresh failed: %s", task.exception())
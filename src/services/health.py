@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import math
+from datetime import datetime
+
+from src.models.health import HealthEvent, HealthResponse, HealthState, MetricHealth
+from src.models.speedresponse import SpeedMeasurement
+from src.repositories.history import METRICS
+from src.repositories.webhook import WebhookRepository
+
+logger = logging.getLogger(__name__)
+
+# Whether a metric degrades by rising (+1) or by falling (-1)
+DEGRADING = {"download_speed": -1, "upload_speed": -1, "ping": 1}
+
+
+class _Detector:
+    # EWMA baseline of one metric with a one-sided CUSUM of how far values
+    # lie beyond slack deviations in the degrading direction: outliers fade
+    # out, a sustained shift crosses the threshold. The baseline only moves
+    # while the CUSUM is zero, so it follows drift but not the shift itself.
+    def __init__(
+        self,
+        direction: int,
+        alpha: float,
+        slack: float,
+        threshold: float,
+        warmup: int,
+        min_deviation: float,
+    ):
+        self.direction = direction
+        self.alpha = alpha
+        self.slack = slack
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_deviation = min_deviation
+        self.samples = 0
+        self.value: float | None = None
+        self.mean = 0.0
+        self.variance = 0.0
+        self.cusum = 0.0
+        self.state: HealthState = "learning"
+        self.since: datetime | None = None
+
+    @property
+    def deviation(self) -> float:
+        # Floored relative to the baseline, so a very steady link does not
+        # alarm on noise a fraction of a percent wide
+        return max(math.sqrt(self.variance), self.min_deviation * abs(self.mean), 1e-9)
+
+    def add(self, value: float, timestamp: datetime) -> None:
+        self.samples += 1
+        self.value = value
+        if self.samples > self.warmup:
+            shift = self.direction * (value - self.mean) / self.deviation
+            self.cusum = max(0.0, self.cusum + shift - self.slack)
+            if self.state != "degraded" and self.cusum > self.threshold:
+                self._enter("degraded", timestamp)
+            elif self.state == "degraded":
+                # Capped so recovery takes threshold / slack good values
+                # however long the degradation lasted
+                self.cusum = min(self.cusum, self.threshold)
+                if self.cusum == 0:
+                    self._enter("ok", timestamp)
+            elif self.state == "learning":
+                self._enter("ok", timestamp)
+        if self.cusum == 0:
+            # A plain mean of the first 1 / alpha values, then exponentially
+            # weighted
+            weight = max(self.alpha, 1 / self.samples)
+            delta = value - self.mean
+            self.mean += weight * delta
+            self.variance = (1 - weight) * (self.variance + weight * delta * delta)
+
+    def snapshot(self) -> MetricHealth:
+        learned = self.samples > self.warmup
+        return MetricHealth(
+            state=self.state,
+            samples=self.samples,
+            value=self.value,
+            baseline=self.mean if learned else None,
+            deviation=self.deviation if learned else None,
+            cusum=self.cusum,
+            since=self.since,
+        )
+
+    def _enter(self, state: HealthState, timestamp: datetime) -> None:
+        self.state = state
+        self.since = timestamp
+
+
+class HealthMonitor:
+    def __init__(
+        self,
+        alpha: float = 0.1,
+        slack: float = 0.5,
+        threshold: float = 5.0,
+        warmup: int = 10,
+        min_deviation: float = 0.05,
+        webhook: WebhookRepository | None = None,
+        cooldown: float = 3600.0,
+    ):
+        self.threshold = threshold
+        self.detectors = {
+            metric: _Detector(
+                DEGRADING[metric], alpha, slack, threshold, warmup, min_deviation
+            )
+            for metric in METRICS
+        }
+        self.webhook = webhook
+        # Minimum seconds between notifications about one metric; a state
+        # that flapped back within it is never reported
+        self.cooldown = cooldown
+        self._notified: dict[str, tuple[HealthState, float]] = dict.fromkeys(
+            METRICS, ("ok", -math.inf)
+        )
+        self._deliveries: set[asyncio.Task] = set()
+
+    async def record(self, measurement: SpeedMeasurement) -> None:
+        for metric, detector in self.detectors.items():
+            detector.add(getattr(measurement, metric), measurement.timestamp)
+            self._notify(metric, detector, measurement.timestamp)
+
+    def snapshot(self) -> HealthResponse:
+        states = {detector.state for detector in self.detectors.values()}
+        state = next(s for s in ("degraded", "learning", "ok") if s in states)
+        return HealthResponse(
+            state=state,
+            threshold=self.threshold,
+            **{
+                metric: detector.snapshot()
+                for metric, detector in self.detectors.items()
+            },
+        )
+
+    async def aclose(self) -> None:
+        # Lets notifications already on their way arrive
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self.webhook is not None:
+            await self.webhook.aclose()
+
+    def _notify(self, metric: str, detector: _Detector, timestamp: datetime) -> None:
+        notified, notified_at = self._notified[metric]
+        now = timestamp.timestamp()
+        if (
+            self.webhook is None
+            or detector.state in ("learning", notified)
+            or now - notified_at < self.cooldown
+        ):
+            return
+        self._notified[metric] = (detector.state, now)
+        event = HealthEvent(
+            event="degraded" if detector.state == "degraded" else "recovered",
+            metric=metric,
+            value=detector.value,
+            baseline=detector.mean,
+            deviation=detector.deviation,
+            cusum=detector.cusum,
+            timestamp=timestamp,
+        )
+        # Sent in the background so a slow receiver never holds up a result
+        task = asyncio.create_task(self._deliver(event))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, event: HealthEvent) -> None:
+        try:
+            await self.webhook.send(event)
+        except Exception as e:
+            logger.warning("Failed to deliver %s webhook: %s", event.event, e)
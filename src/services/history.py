@@ -0,0 +1,73 @@
+import asyncio
+import math
+from collections.abc import Iterator
+from datetime import UTC, datetime
+
+from src.models.history import HistoryBucket, HistoryResponse, MetricSummary
+from src.models.speedresponse import SpeedMeasurement
+from src.repositories.history import METRICS, HistoryRepository
+from src.services.export import ExportFormat, export_chunks
+from src.sketch import DDSketch
+
+
+class HistoryService:
+    def __init__(self, history_repository: HistoryRepository):
+        self.history_repository = history_repository
+
+    async def record(self, measurement: SpeedMeasurement) -> None:
+        await asyncio.to_thread(self.history_repository.append, measurement)
+
+    async def get_history(
+        self, start: datetime, end: datetime, step: int
+    ) -> HistoryResponse:
+        buckets = await asyncio.to_thread(
+            self.history_repository.query, start.timestamp(), end.timestamp(), step
+        )
+        return to_history_response(start, end, step, buckets)
+
+    def export(
+        self,
+        start: datetime | None,
+        end: datetime | None,
+        columns: tuple[str, ...],
+        format: ExportFormat,
+    ) -> Iterator[bytes]:
+        # Raw rows go straight from SQLite to the writer, one batch at a time
+        rows = self.history_repository.iter_rows(
+            start.timestamp() if start else -math.inf,
+            end.timestamp() if end else math.inf,
+            columns,
+        )
+        return export_chunks(rows, columns, format)
+
+
+def to_history_response(
+    start: datetime,
+    end: datetime,
+    step: int,
+    buckets: list[tuple[int, dict[str, DDSketch]]],
+) -> HistoryResponse:
+    return HistoryResponse(
+        start=start,
+        end=end,
+        step=step,
+        buckets=[
+            HistoryBucket(
+                start=datetime.fromtimestamp(bucket, UTC),
+                count=sketches[METRICS[0]].count,
+                **{metric: summarize_sketch(sketches[metric]) for metric in METRICS},
+            )
+            for bucket, sketches in buckets
+        ],
+    )
+
+
+def summarize_sketch(sketch: DDSketch) -> MetricSummary:
+    return MetricSummary(
+        min=sketch.min,
+        avg=sketch.avg,
+        max=sketch.max,
+        p50=sketch.quantile(0.5),
+        p95=sketch.quantile(0.95),
+        p99=sketch.quantile(0.99),
+    )
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import re
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+
+from src.models.job import SpeedJob
+from src.models.speedresponse import SpeedMeasurement
+from src.repositories.shared import SharedResultStore
+
+logger = logging.getLogger(__name__)
+
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class JobManager:
+    def __init__(
+        self, max_retained: int = 256, shared: SharedResultStore | None = None
+    ):
+        self.max_retained = max_retained
+        # Jobs run in the worker process that accepted them; with a shared
+        # store each state is published, so any worker can answer a poll
+        self.shared = shared
+        # Holds at most one job per key, since an active key is deduplicated
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: asyncio.Task | None = None
+        # Every known job, least recently used first
+        self._jobs: OrderedDict[str, SpeedJob] = OrderedDict()
+        # Queued or running job per key, for deduplication
+        self._active: dict[str, SpeedJob] = {}
+
+    def start(self) -> None:
+        if self._worker is None:
+            # A fresh queue binds to the loop the worker runs on
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._work())
+
+    async def stop(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def submit(
+        self, key: str, run: Callable[[], Awaitable[SpeedMeasurement]]
+    ) -> SpeedJob:
+        active = self._active.get(key)
+        if active is not None:
+            return active
+
+        job = SpeedJob(id=uuid.uuid4().hex, status="queued", created_at=_now())
+        self._queue.put_nowait((key, job, run))
+        self._active[key] = job
+        self._jobs[job.id] = job
+        self._publish(job)
+        self._evict()
+        return job
+
+    def get(self, job_id: str) -> SpeedJob | None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            self._jobs.move_to_end(job_id)
+            return job
+        if self.shared is None or not JOB_ID.fullmatch(job_id):
+            return None
+        body = self.shared.get(f"job.{job_id}")
+        return None if body is None else SpeedJob.model_validate_json(body)
+
+    async def _work(self) -> None:
+        while True:
+            key, job, run = await self._queue.get()
+            job.status = "running"
+            job.started_at = _now()
+            self._publish(job)
+            try:
+                job.result = await run()
+                job.status = "succeeded"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+                logger.warning("Speedtest job %s failed: %s", job.id, e)
+            finally:
+                job.finished_at = _now()
+                del self._active[key]
+                self._publish(job)
+
+    def _publish(self, job: SpeedJob) -> None:
+        if self.shared is not None:
+            self.shared.put(f"job.{job.id}", job.model_dump_json().encode())
+
+    def _evict(self) -> None:
+        # Only finished jobs are evicted; there is at most one queued or
+        # running job per key
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_retained:
+                break
+            if self._jobs[job_id].finished_at is not None:
+                del self._jobs[job_id]
+                if self.shared is not None:
+                    self.shared.delete(f"job.{job_id}")
+
+
+def _now() -> datetime:
+    return datetime.now(UTC)
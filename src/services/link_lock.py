@@ -0,0 +1,23 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from src.repositories.shared import SharedResultStore
+
+
+class LinkLock:
+    # Held while a test loads the default uplink: by SpeedService around every
+    # speedtest and by fleet targets without a namespace or source address.
+    # With a shared store it also excludes the other worker processes.
+    def __init__(self, shared: SharedResultStore | None = None):
+        self.shared = shared
+        self._lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def hold(self) -> AsyncIterator[None]:
+        async with self._lock:
+            if self.shared is None:
+                yield
+                return
+            async with self.shared.lock():
+                yield
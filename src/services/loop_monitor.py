@@ -0,0 +1,34 @@
+import asyncio
+
+from src import metrics
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        # Anything holding the loop delays this wake-up by as long as it
+        # blocks every other request
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            metrics.LOOP_LAG_SECONDS.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
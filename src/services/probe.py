@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+from datetime import UTC, datetime
+
+from src import metrics
+from src.models.speedresponse import LatencyResponse
+from src.repositories.probe import ProbeError, ProbeRepository
+from src.running_stats import RollingMean
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyProbe:
+    def __init__(
+        self, repository: ProbeRepository, interval: float = 5.0, window: int = 60
+    ):
+        self.repository = repository
+        self.interval = interval
+        self.window = window
+        self.latency = RollingMean(window)
+        # Differences between consecutive answered probes
+        self.jitter = RollingMean(window)
+        # 1.0 for each lost probe and 0.0 for each answered one
+        self.loss = RollingMean(window)
+        self.sent = 0
+        self.lost = 0
+        self.last_probe: datetime | None = None
+        self._previous: float | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await self.run_once()
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(0.0, self.interval - elapsed))
+
+    async def run_once(self) -> None:
+        self.sent += 1
+        metrics.PROBES.inc()
+        try:
+            rtt = await self.repository.probe()
+        except ProbeError as e:
+            self.lost += 1
+            metrics.PROBES_LOST.inc()
+            self.loss.add(1.0)
+            logger.debug("Latency probe to %s lost: %s", self.repository.target, e)
+        else:
+            self.loss.add(0.0)
+            self.latency.add(rtt)
+            if self._previous is not None:
+                self.jitter.add(abs(rtt - self._previous))
+            self._previous = rtt
+        self.last_probe = datetime.now(UTC)
+        metrics.PROBE_LATENCY.set(_or_nan(self.latency.mean))
+        metrics.PROBE_JITTER.set(_or_nan(self.jitter.mean))
+        metrics.PROBE_LOSS.set(_or_nan(self.loss.mean))
+
+    def snapshot(self) -> LatencyResponse:
+        return LatencyResponse(
+            target=self.repository.target,
+            method=self.repository.method,
+            ping=_round(self.latency.mean),
+            jitter=_round(self.jitter.mean),
+            packet_loss=_round(self.loss.mean),
+            window=self.window,
+            sent=self.sent,
+            lost=self.lost,
+            timestamp=self.last_probe,
+        )
+
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(value, 3)
+
+
+def _or_nan(value: float | None) -> float:
+    return float("nan") if value is None else value
@@ -0,0 +1,99 @@
+import hashlib
+import time
+from email.utils import formatdate
+from typing import NamedTuple
+
+from src.models.speedresponse import SpeedMeasurement
+from src.repositories.shared import SharedResultStore
+
+
+class EncodedResult(NamedTuple):
+    body: bytes
+    etag: str
+    # Unix time of the measurement and the same as an HTTP date
+    modified: float
+    last_modified: str
+
+
+class ResultCache:
+    def __init__(
+        self,
+        ttl: float,
+        stale_ttl: float = 0.0,
+        shared: SharedResultStore | None = None,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # With several worker processes, results are published to and picked
+        # up from a store they all map
+        self.shared = shared
+        self._latest: SpeedMeasurement | None = None
+        self._encoded: EncodedResult | None = None
+        self._stored_at = 0.0
+        self._sequence = 0
+
+    @property
+    def latest(self) -> SpeedMeasurement | None:
+        self._sync()
+        return self._latest
+
+    @property
+    def encoded(self) -> EncodedResult | None:
+        self._sync()
+        return self._encoded
+
+    def store(self, measurement: SpeedMeasurement) -> None:
+        self._latest = measurement
+        # Encoded once per result, so every request for it, conditional or
+        # not, only compares validators and sends the same bytes
+        self._encoded = encode_result(measurement)
+        self._stored_at = time.monotonic()
+        if self.shared is not None:
+            self._sequence = self.shared.publish(self._encoded.body)
+
+    def age(self) -> float:
+        self._sync()
+        return time.monotonic() - self._stored_at
+
+    def get(self, max_age: float) -> SpeedMeasurement | None:
+        if self.latest is not None and self.age() < max_age:
+            return self.latest
+        return None
+
+    def get_stale(self) -> SpeedMeasurement | None:
+        return self.get(self.ttl + self.stale_ttl)
+
+    def encode(self, measurement: SpeedMeasurement) -> EncodedResult:
+        if measurement is self.latest and self._encoded is not None:
+            return self._encoded
+        return encode_result(measurement)
+
+    def _sync(self) -> None:
+        # Adopts a result another worker published. Its bytes are served as
+        # they are, so every worker sends the same body and ETag.
+        if self.shared is None:
+            return
+        published = self.shared.read(self._sequence)
+        if published is None:
+            return
+        self._sequence, body = published
+        measurement = SpeedMeasurement.model_validate_json(body)
+        self._latest = measurement
+        self._encoded = encode_result(measurement, body)
+        # Aged by when it was measured, not when this worker noticed it
+        measured_ago = time.time() - measurement.timestamp.timestamp()
+        self._stored_at = time.monotonic() - max(0.0, measured_ago)
+
+
+def encode_result(
+    measurement: SpeedMeasurement, body: bytes | None = None
+) -> EncodedResult:
+    if body is None:
+        body = measurement.__pydantic_serializer__.to_json(measurement)
+    modified = measurement.timestamp.timestamp()
+    return EncodedResult(
+        body=body,
+        etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        modified=modified,
+        last_modified=formatdate(modified, usegmt=True),
+    )
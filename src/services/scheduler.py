@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Callable
+
+from src.repositories.shared import SharedResultStore
+from src.services.get_speed import SpeedService
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ROLE = "scheduler"
+
+
+class SpeedtestScheduler:
+    def __init__(
+        self,
+        service_factory: Callable[[], SpeedService],
+        interval: float,
+        jitter: float = 0.0,
+        shared: SharedResultStore | None = None,
+    ):
+        self.service_factory = service_factory
+        self.interval = interval
+        self.jitter = jitter
+        # Every worker process starts a scheduler; with a shared store only
+        # the one holding the scheduler role measures
+        self.shared = shared
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self) -> None:
+        while True:
+            started = time.monotonic()
+            await self.run_once()
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(max(0.0, self.next_delay() - elapsed))
+
+    async def run_once(self) -> None:
+        if self.shared is not None and not self.shared.claim(SCHEDULER_ROLE):
+            self.skipped += 1
+            return
+        self.runs += 1
+        try:
+            # Goes through the shared single-flight, so a scheduled run never
+            # overlaps another scheduled or on-demand speedtest
+            await self.service_factory().measure(priority="scheduled")
+        except Exception as e:
+            self.failures += 1
+            logger.warning("Scheduled speedtest failed: %s", e)
+
+    def next_delay(self) -> float:
+        return max(0.0, self.interval + random.uniform(-self.jitter, self.jitter))
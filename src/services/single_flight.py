@@ -0,0 +1,41 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def running(self, key: str) -> bool:
+        task = self._calls.get(key)
+        return task is not None and task.get_loop() is asyncio.get_running_loop()
+
+    def start[T](self, key: str, fn: Callable[[], Awaitable[T]]) -> asyncio.Task[T]:
+        # Registers the call right away, so callers arriving before it first
+        # runs join it too; the caller does not wait for it
+        task = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda done: self._forget(key, done))
+        self._calls[key] = task
+        self.executions += 1
+        return task
+
+    async def do[T](self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        if self.running(key):
+            task = self._calls[key]
+            self.coalesced += 1
+        else:
+            task = self.start(key, fn)
+
+        # Shield the shared call so one caller going away (e.g. a client
+        # disconnect) does not cancel the measurement for everyone else
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
@@ -0,0 +1,41 @@
+import asyncio
+from datetime import UTC, datetime
+
+from src.models.history import HistoryResponse
+from src.models.site import SiteBatch, SiteSummary
+from src.repositories.sites import SiteRepository
+from src.services.history import to_history_response
+
+
+class SiteService:
+    def __init__(self, site_repository: SiteRepository):
+        self.site_repository = site_repository
+
+    async def ingest(self, batch: SiteBatch) -> int:
+        return await asyncio.to_thread(
+            self.site_repository.append_batch, batch.site, batch.measurements
+        )
+
+    async def get_sites(self) -> list[SiteSummary]:
+        summaries = await asyncio.to_thread(self.site_repository.summaries)
+        return [
+            SiteSummary(
+                site=site,
+                count=count,
+                first_seen=datetime.fromtimestamp(first_ts, UTC),
+                latest=latest,
+            )
+            for site, count, first_ts, latest in summaries
+        ]
+
+    async def get_history(
+        self, start: datetime, end: datetime, step: int, site: str | None = None
+    ) -> HistoryResponse:
+        buckets = await asyncio.to_thread(
+            self.site_repository.query,
+            start.timestamp(),
+            end.timestamp(),
+            step,
+            site,
+        )
+        return to_history_response(start, end, step, buckets)
@@ -0,0 +1,77 @@
+import time
+from datetime import UTC, datetime
+
+from src.models.speedresponse import SpeedMeasurement
+from src.models.stats import StatsResponse
+from src.repositories.history import METRICS
+from src.services.history import summarize_sketch
+from src.sketch import DDSketch
+
+# (bucket seconds, buckets kept): minutes for two hours, hours for three days
+# and days for a year. Every measurement goes into one bucket of each tier,
+# so memory is bounded by the number of buckets, not by uptime.
+TIERS = ((60, 120), (3600, 72), (86400, 366))
+
+MAX_WINDOW = max(resolution * size for resolution, size in TIERS)
+
+
+class _Tier:
+    def __init__(self, resolution: int, size: int):
+        self.resolution = resolution
+        self.size = size
+        # Ring of (bucket start, sketches per metric); a slot is reused once
+        # its bucket has fallen out of the tier
+        self.slots: list[tuple[int, dict[str, DDSketch]] | None] = [None] * size
+
+    def add(self, ts: float, values: dict[str, float]) -> None:
+        bucket = int(ts // self.resolution) * self.resolution
+        index = (bucket // self.resolution) % self.size
+        slot = self.slots[index]
+        if slot is None or slot[0] != bucket:
+            if slot is not None and slot[0] > bucket:
+                # Older than anything this tier still covers
+                return
+            slot = (bucket, {metric: DDSketch() for metric in METRICS})
+            self.slots[index] = slot
+        for metric, value in values.items():
+            slot[1][metric].add(value)
+
+    def merged(self, start: float, end: float) -> dict[str, DDSketch]:
+        sketches = {metric: DDSketch() for metric in METRICS}
+        for slot in self.slots:
+            if slot is not None and start <= slot[0] <= end:
+                for metric in METRICS:
+                    sketches[metric].merge(slot[1][metric])
+        return sketches
+
+
+class SpeedStats:
+    def __init__(self):
+        self.tiers = [_Tier(resolution, size) for resolution, size in TIERS]
+
+    async def record(self, measurement: SpeedMeasurement) -> None:
+        values = {metric: getattr(measurement, metric) for metric in METRICS}
+        for tier in self.tiers:
+            tier.add(measurement.timestamp.timestamp(), values)
+
+    def get_stats(self, window: int, now: float | None = None) -> StatsResponse:
+        # Served from the finest tier that spans the window; the window's
+        # start is rounded out to that tier's bucket boundary
+        end = time.time() if now is None else now
+        start = end - window
+        tier = next(
+            tier for tier in self.tiers if tier.resolution * tier.size >= window
+        )
+        sketches = tier.merged(int(start // tier.resolution) * tier.resolution, end)
+        count = sketches[METRICS[0]].count
+        return StatsResponse(
+            window=window,
+            start=datetime.fromtimestamp(start, UTC),
+            end=datetime.fromtimestamp(end, UTC),
+            resolution=tier.resolution,
+            count=count,
+            **{
+                metric: summarize_sketch(sketches[metric]) if count else None
+                for metric in METRICS
+            },
+        )
@@ -0,0 +1,131 @@
+import os
+from typing import Literal
+
+from pydantic import BaseModel, Field, Json
+
+from src.executor import ExecutorKind
+from src.models.fleet import FleetTarget
+from src.repositories.probe import ProbeKind
+from src.repositories.transfer import TransferKind
+
+ENV_PREFIX = "NETSPEED_"
+
+
+class Settings(BaseModel):
+    # Seconds a measurement is served as fresh from the cache
+    cache_ttl: float = 60.0
+    # Extra seconds an expired measurement is still served while refreshing
+    cache_stale_ttl: float = 600.0
+    # Speedtests a client may wait for per hour, with bursts of up to
+    # rate_limit_client_burst; 0 disables the per-client limit
+    rate_limit_client_per_hour: float = 0.0
+    rate_limit_client_burst: int = 1
+    # Speedtests started per sliding hour across all clients, of which
+    # rate_limit_reserved are kept for the scheduler; 0 disables the cap
+    rate_limit_global_per_hour: int = 0
+    rate_limit_reserved: int = 0
+    # Clients tracked at once, least recently seen forgotten first
+    rate_limit_max_clients: int = 10_000
+    # Seconds between background speedtests, 0 disables the scheduler
+    scheduler_interval: float = 0.0
+    # Random +/- seconds added to each interval so probes do not align
+    scheduler_jitter: float = 0.0
+    # File shared by every worker process holding the latest result and a
+    # measurement lock, "" keeps both per process; put it on /dev/shm
+    shared_state_path: str = ""
+    # SQLite database for measurement history, ":memory:" keeps it in-process
+    history_path: str = ":memory:"
+    # Finished jobs kept for GET /speed/jobs/{id}, least recently used dropped
+    job_retention: int = 256
+    # JSON file caching the server catalogue and chosen server, "" keeps it
+    # in memory only
+    server_cache_path: str = ""
+    # Seconds before the catalogue is re-fetched and the server re-selected
+    server_cache_ttl: float = 86400.0
+    # "cli" shells out to speedtest-cli, "library" runs the speedtest module
+    # in-process with a reused session, "native" measures in-process
+    engine: Literal["cli", "library", "native"] = "cli"
+    # Accept result batches from agents on POST /speed/sites/ingest
+    coordinator: bool = False
+    # SQLite database for results pushed by agents
+    sites_path: str = ":memory:"
+    # Bearer token agents must send, "" accepts any agent
+    coordinator_token: str = ""
+    # Coordinator base URL; when set, results are also pushed there
+    coordinator_url: str = ""
+    # Site name sent with pushed results, the hostname when empty
+    site: str = ""
+    # Results per push, and seconds between pushes of a partial batch
+    agent_batch_size: int = 100
+    agent_flush_interval: float = 30.0
+    # JSONL file holding unsent results across restarts, "" keeps them in
+    # memory only; at most agent_max_spooled are kept
+    agent_spool_path: str = ""
+    agent_max_spooled: int = 10_000
+    # Where measurement and output parsing run: "inline" on the event loop,
+    # or in a "thread" or "process" pool of executor_workers workers
+    executor: ExecutorKind = "inline"
+    executor_workers: int = Field(1, gt=0)
+    # Target of the latency probe, host:port for "tcp" and "udp" probes or a
+    # URL for "http" ones; the probe is off when empty
+    probe_target: str = ""
+    probe_method: ProbeKind = "tcp"
+    # Seconds between probes and before one counts as lost
+    probe_interval: float = 5.0
+    probe_timeout: float = 1.0
+    # Probes that ping, jitter and packet loss are computed over
+    probe_window: int = 60
+    # Degradation detection: weight of each new result in the baseline,
+    # deviations a result may differ from it before it counts as a shift,
+    # and accumulated deviations that mark a metric as degraded
+    health_alpha: float = 0.1
+    health_slack: float = 0.5
+    health_threshold: float = 5.0
+    # Results before a baseline is trusted, and the smallest deviation
+    # relative to the baseline
+    health_warmup: int = 10
+    health_min_deviation: float = 0.05
+    # URL receiving a JSON POST when a metric degrades or recovers, and the
+    # minimum seconds between two notifications about one metric
+    health_webhook_url: str = ""
+    health_webhook_cooldown: float = 3600.0
+    # Seconds between event loop lag samples, 0 disables the monitor
+    loop_monitor_interval: float = 0.1
+    # speedtest-cli executable used by the cli engine
+    speedtest_cli_path: str = "/usr/bin/speedtest-cli"
+    # Upload URL of the server the native engine measures against
+    native_server_url: str = ""
+    native_server_name: str = ""
+    native_server_location: str = ""
+    # Parallel HTTP streams per direction
+    native_streams: int = Field(4, gt=0)
+    # Seconds discarded at the start of each direction, then seconds measured
+    native_warmup: float = Field(2.0, ge=0)
+    native_duration: float = Field(10.0, gt=0)
+    # How the native engine moves transfer bodies: "httpx" through its HTTP
+    # client, "socket" through raw sockets with reused buffers (plain http://
+    # servers only)
+    native_transfer: TransferKind = "httpx"
+    # Stop each direction early once its throughput is known within +/-
+    # native_tolerance (relative, at 95% confidence); duration is the limit
+    native_adaptive: bool = False
+    native_tolerance: float = Field(0.05, gt=0)
+    # JSON list of fleet targets, e.g. [{"name": "wan1", "source_address":
+    # "192.0.2.10", "server_id": "28935"}]; fleet mode is off when empty
+    fleet_targets: Json[list[FleetTarget]] = []
+    # Fleet tests running at once across all links
+    fleet_concurrency: int = Field(1, gt=0)
+    # Seconds between tests of each target, with random +/- jitter
+    fleet_interval: float = 3600.0
+    fleet_jitter: float = 0.0
+    # Seconds before a fleet test is abandoned and its process killed
+    fleet_timeout: float = 120.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        values = {}
+        for name in cls.model_fields:
+            env_name = ENV_PREFIX + name.upper()
+            if env_name in os.environ:
+                values[name] = os.environ[env_name]
+        return cls(**values)
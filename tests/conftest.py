@@ -1,13 +1,72 @@
+from datetime import UTC, datetime
 from unittest.mock import Mock
 
 import pytest
 from fastapi.testclient import TestClient
 
+from benchmarks.standin import SpeedtestStandin, UdpEchoStandin, WebhookReceiver
+from src.dependencies import (
+    get_admission_controller,
+    get_agent_service,
+    get_executor,
+    get_fleet_service,
+    get_health_monitor,
+    get_history_repository,
+    get_job_manager,
+    get_latency_probe,
+    get_library_repository,
+    get_link_lock,
+    get_native_repository,
+    get_result_cache,
+    get_server_catalog,
+    get_settings,
+    get_shared_store,
+    get_single_flight,
+    get_site_repository,
+    get_speed_stats,
+)
 from src.main import app
+from src.models.speedresponse import SpeedMeasurement
 from src.repositories.requester import RequestRepository
 from src.services.get_speed import SpeedService
 
 
+@pytest.fixture
+def anyio_backend():
+    """Run async tests on asyncio, the event loop the app is served on"""
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+    """Drop process-wide singletons so tests do not leak state into each other"""
+    providers = (
+        get_settings,
+        get_admission_controller,
+        get_executor,
+        get_fleet_service,
+        get_health_monitor,
+        get_server_catalog,
+        get_history_repository,
+        get_site_repository,
+        get_agent_service,
+        get_job_manager,
+        get_latency_probe,
+        get_library_repository,
+        get_link_lock,
+        get_native_repository,
+        get_single_flight,
+        get_result_cache,
+        get_shared_store,
+        get_speed_stats,
+    )
+    for provider in providers:
+        provider.cache_clear()
+    yield
+    for provider in providers:
+        provider.cache_clear()
+
+
 @pytest.fixture
 def test_client():
     """FastAPI test client fixture"""
@@ -63,3 +122,44 @@ def mock_request_repository():
 def speed_service(mock_request_repository):
     """SpeedService with mocked repository"""
     return SpeedService(mock_request_repository)
+
+
+@pytest.fixture
+def make_measurement():
+    """Factory for SpeedMeasurement instances at a given unix timestamp"""
+
+    def make(ts, download_speed=100.0, upload_speed=50.0, ping=10.0):
+        return SpeedMeasurement(
+            download_speed=download_speed,
+            upload_speed=upload_speed,
+            ping=ping,
+            server_name="Riga",
+            server_location="Latvia",
+            timestamp=datetime.fromtimestamp(ts, UTC),
+        )
+
+    return make
+
+
+@pytest.fixture
+async def speedtest_server():
+    """Local stand-in speedtest server, started for the duration of a test"""
+    server = await SpeedtestStandin().start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+async def echo_server():
+    """Local UDP echo server, started for the duration of a test"""
+    server = await UdpEchoStandin().start()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+async def webhook_receiver():
+    """Local webhook receiver, started for the duration of a test"""
+    receiver = await WebhookReceiver().start()
+    yield receiver
+    await receiver.close()
@@ -1,6 +1,27 @@
-from src.dependencies import get_request_repository, get_speed_service
+import pytest
+from pydantic import ValidationError
+
+from src.dependencies import (
+    build_speed_service,
+    get_fleet_service,
+    get_library_repository,
+    get_native_repository,
+    get_request_repository,
+    get_result_cache,
+    get_settings,
+    get_shared_store,
+    get_single_flight,
+    get_speed_service,
+)
+from src.repositories.library import LibrarySpeedRepository
+from src.repositories.native import NativeSpeedRepository
 from src.repositories.requester import RequestRepository
+from src.repositories.shared import SharedResultStore
+from src.services.agent import AgentService
 from src.services.get_speed import SpeedService
+from src.services.result_cache import ResultCache
+from src.services.single_flight import SingleFlight
+from src.settings import Settings
 
 
 class TestDependencies:
@@ -68,3 +89,141 @@ class TestDependencies:
         assert hasattr(service, "get_speedtest_results")
         assert hasattr(service, "request_repository")
         assert callable(service.get_speedtest_results)
+
+    def test_get_single_flight_is_shared(self):
+        """Test that all requests share one SingleFlight instance"""
+        single_flight = get_single_flight()
+
+        assert isinstance(single_flight, SingleFlight)
+        assert get_single_flight() is single_flight
+
+    def test_speed_services_share_single_flight(self):
+        """Test that services built per request coalesce through one instance"""
+        single_flight = get_single_flight()
+
+        service1 = get_speed_service(get_request_repository(), single_flight)
+        service2 = get_speed_service(get_request_repository(), single_flight)
+
+        assert service1.single_flight is service2.single_flight
+
+    def test_get_settings_defaults(self):
+        """Test that settings fall back to defaults without environment"""
+        settings = get_settings()
+
+        assert isinstance(settings, Settings)
+        assert settings.cache_ttl == 60.0
+
+    def test_get_settings_from_environment(self, monkeypatch):
+        """Test that settings are read from NETSPEED_ environment variables"""
+        monkeypatch.setenv("NETSPEED_CACHE_TTL", "5")
+        monkeypatch.setenv("NETSPEED_CACHE_STALE_TTL", "30")
+
+        settings = Settings.from_env()
+
+        assert settings.cache_ttl == 5.0
+        assert settings.cache_stale_ttl == 30.0
+
+    def test_settings_reject_empty_native_window(self, monkeypatch):
+        """Test that a native duration or stream count of 0 is refused at startup"""
+        monkeypatch.setenv("NETSPEED_NATIVE_DURATION", "0")
+        with pytest.raises(ValidationError):
+            Settings.from_env()
+
+        monkeypatch.setenv("NETSPEED_NATIVE_DURATION", "1")
+        monkeypatch.setenv("NETSPEED_NATIVE_STREAMS", "0")
+        with pytest.raises(ValidationError):
+            Settings.from_env()
+
+    def test_get_result_cache_uses_settings(self, monkeypatch):
+        """Test that the shared result cache is configured from settings"""
+        monkeypatch.setenv("NETSPEED_CACHE_TTL", "15")
+
+        cache = get_result_cache()
+
+        assert isinstance(cache, ResultCache)
+        assert cache.ttl == 15.0
+        assert get_result_cache() is cache
+
+    def test_native_engine_selected_from_settings(self, monkeypatch):
+        """Test that NETSPEED_ENGINE=native selects the in-process engine"""
+        monkeypatch.setenv("NETSPEED_ENGINE", "native")
+        monkeypatch.setenv("NETSPEED_NATIVE_SERVER_URL", "http://host/upload.php")
+        monkeypatch.setenv("NETSPEED_NATIVE_STREAMS", "8")
+        monkeypatch.setenv("NETSPEED_NATIVE_TRANSFER", "socket")
+        monkeypatch.setenv("NETSPEED_NATIVE_ADAPTIVE", "true")
+
+        repo = get_request_repository()
+
+        assert isinstance(repo, NativeSpeedRepository)
+        assert repo.server_url == "http://host/upload.php"
+        assert repo.streams == 8
+        assert repo.transfer == "socket"
+        assert repo.adaptive is True
+        # Shared so the HTTP connection pool survives between requests
+        assert get_request_repository() is repo
+        assert get_native_repository() is repo
+
+    def test_library_engine_selected_from_settings(self, monkeypatch):
+        """Test that NETSPEED_ENGINE=library keeps one session and a cli fallback"""
+        monkeypatch.setenv("NETSPEED_ENGINE", "library")
+        monkeypatch.setenv("NETSPEED_SPEEDTEST_CLI_PATH", "/opt/bin/speedtest-cli")
+
+        repo = get_request_repository()
+
+        assert isinstance(repo, LibrarySpeedRepository)
+        assert isinstance(repo.fallback, RequestRepository)
+        assert repo.fallback.cli_path == "/opt/bin/speedtest-cli"
+        assert get_request_repository() is repo
+        assert get_library_repository() is repo
+
+    def test_speedtest_cli_path_from_settings(self, monkeypatch):
+        """Test that the speedtest-cli executable can be configured"""
+        monkeypatch.setenv("NETSPEED_SPEEDTEST_CLI_PATH", "/opt/bin/speedtest-cli")
+
+        repo = get_request_repository()
+
+        assert repo.cli_path == "/opt/bin/speedtest-cli"
+
+    def test_fleet_targets_from_settings(self, monkeypatch):
+        """Test that fleet targets are parsed from NETSPEED_FLEET_TARGETS"""
+        monkeypatch.setenv(
+            "NETSPEED_FLEET_TARGETS",
+            '[{"name": "wan1", "source_address": "192.0.2.10", "server_id": "1"},'
+            ' {"name": "wan2", "netns": "wan2"}]',
+        )
+
+        fleet = get_fleet_service()
+
+        assert [target.link for target in fleet.targets] == ["192.0.2.10", "wan2"]
+        assert fleet.repositories["wan1"].server_id == "1"
+        assert fleet.repositories["wan2"].netns == "wan2"
+        assert get_fleet_service() is fleet
+
+    def test_agent_sink_added_with_coordinator_url(self, monkeypatch):
+        """Test that results are also pushed when a coordinator is configured"""
+        monkeypatch.setenv("NETSPEED_COORDINATOR_URL", "http://coordinator:8000")
+        monkeypatch.setenv("NETSPEED_SITE", "riga")
+
+        sinks = build_speed_service().sinks
+
+        assert isinstance(sinks[-1], AgentService)
+        assert sinks[-1].site == "riga"
+        assert sinks[-1].coordinator.url == "http://coordinator:8000/speed/sites/ingest"
+
+    def test_no_agent_sink_by_default(self):
+        """Test that standalone instances push nowhere"""
+        sinks = build_speed_service().sinks
+
+        assert not any(isinstance(sink, AgentService) for sink in sinks)
+
+    def test_shared_store_from_settings(self, monkeypatch, tmp_path):
+        """Test that the result cache publishes to the configured shared file"""
+        assert get_result_cache().shared is None
+        for provider in (get_result_cache, get_shared_store, get_settings):
+            provider.cache_clear()
+        monkeypatch.setenv("NETSPEED_SHARED_STATE_PATH", str(tmp_path / "shared"))
+
+        cache = get_result_cache()
+
+        assert isinstance(cache.shared, SharedResultStore)
+        assert cache.shared is get_shared_store()
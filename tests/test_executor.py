@@ -0,0 +1,40 @@
+import os
+import threading
+
+import pytest
+
+from src.executor import MeasurementExecutor, create_executor
+
+
+def worker_identity() -> tuple[int, int]:
+    return os.getpid(), threading.get_ident()
+
+
+class TestMeasurementExecutor:
+    """Test cases for the measurement executors"""
+
+    def test_inline_has_no_executor(self):
+        """Test that inline work runs on the event loop without a pool"""
+        assert create_executor("inline") is None
+
+    @pytest.mark.anyio
+    async def test_thread_executor_runs_off_the_loop(self):
+        """Test that the thread executor runs work on another thread"""
+        executor = create_executor("thread", workers=2)
+
+        pid, thread = await executor.run(worker_identity)
+        executor.shutdown()
+
+        assert isinstance(executor, MeasurementExecutor)
+        assert pid == os.getpid()
+        assert thread != threading.get_ident()
+
+    @pytest.mark.anyio
+    async def test_process_executor_runs_in_worker_process(self):
+        """Test that the process executor runs work in a separate process"""
+        executor = create_executor("process")
+
+        pid, _ = await executor.run(worker_identity)
+        executor.shutdown()
+
+        assert pid != os.getpid()
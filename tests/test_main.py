@@ -1,3 +1,7 @@
+import json
+import time
+from unittest.mock import Mock, patch
+
 from fastapi import status
 from fastapi.testclient import TestClient
 
@@ -29,6 +33,7 @@ class TestMainApp:
         # Should have at least our two main routes
         assert "/" in route_paths
         assert "/speed" in route_paths
+        assert "/speed/latest" in route_paths
 
     def test_app_openapi_schema(self, test_client):
         """Test that OpenAPI schema is available"""
@@ -76,3 +81,45 @@ class TestMainApp:
         response = test_client.get("/")
         assert "content-type" in response.headers
         assert "application/json" in response.headers["content-type"]
+
+    def test_lifespan_without_scheduler(self):
+        """Test that no background speedtest runs when the scheduler is off"""
+        with TestClient(app) as client:
+            response = client.get("/speed/latest")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_lifespan_starts_scheduler(
+        self, mock_wait_for, mock_create_subprocess, monkeypatch
+    ):
+        """Test that the lifespan runs scheduled speedtests when configured"""
+        monkeypatch.setenv("NETSPEED_SCHEDULER_INTERVAL", "3600")
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+
+        with TestClient(app) as client:
+            response = client.get("/speed/latest")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["server_name"] == "Stockholm"
+
+    def test_lifespan_exports_loop_lag(self):
+        """Test that the lifespan samples event loop lag into the metrics"""
+        with TestClient(app) as client:
+            time.sleep(0.25)
+            response = client.get("/metrics")
+
+        count = next(
+            line
+            for line in response.text.splitlines()
+            if line.startswith("netspeed_event_loop_lag_seconds_count ")
+        )
+        assert int(count.split()[1]) > 0
@@ -0,0 +1,76 @@
+import math
+
+from src.metrics import (
+    CallbackMetric,
+    Counter,
+    Gauge,
+    Histogram,
+    LabeledCounter,
+    Registry,
+)
+
+
+class TestMetrics:
+    """Test cases for the Prometheus text exposition metrics"""
+
+    def test_counter_and_gauge(self):
+        """Test that counters accumulate and gauges keep the last value"""
+        registry = Registry()
+        counter = Counter("runs_total", "Runs", registry)
+        gauge = Gauge("speed", "Speed", registry)
+        counter.inc()
+        counter.inc(2)
+        gauge.set(5)
+        gauge.set(7.5)
+
+        text = registry.render()
+
+        assert "# TYPE runs_total counter\nruns_total 3.0\n" in text
+        assert "# TYPE speed gauge\nspeed 7.5\n" in text
+
+    def test_unset_gauge_renders_nan(self):
+        """Test that a gauge without a value is exposed as NaN"""
+        registry = Registry()
+        gauge = Gauge("speed", "Speed", registry)
+
+        assert math.isnan(gauge.value)
+        assert "speed NaN" in registry.render()
+
+    def test_labeled_counter_children_are_reused(self):
+        """Test that binding a label twice returns the same child"""
+        registry = Registry()
+        failures = LabeledCounter("failures_total", "Failures", "reason", registry)
+        timeout = failures.labels("timeout")
+        timeout.inc()
+        failures.labels("timeout").inc()
+        failures.labels("exit_code").inc()
+
+        text = registry.render()
+
+        assert failures.labels("timeout") is timeout
+        assert 'failures_total{reason="timeout"} 2.0' in text
+        assert 'failures_total{reason="exit_code"} 1.0' in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test that histogram buckets, sum and count are exposed"""
+        registry = Registry()
+        histogram = Histogram("seconds", "Seconds", (0.1, 1.0), registry)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value)
+
+        lines = registry.render().splitlines()
+
+        assert 'seconds_bucket{le="0.1"} 2' in lines
+        assert 'seconds_bucket{le="1.0"} 3' in lines
+        assert 'seconds_bucket{le="+Inf"} 4' in lines
+        assert "seconds_sum 3.65" in lines
+        assert "seconds_count 4" in lines
+
+    def test_callback_metric_read_when_rendered(self):
+        """Test that callback metrics read their value at render time"""
+        registry = Registry()
+        values = [1]
+        CallbackMetric("in_flight", "In flight", "gauge", lambda: values[-1], registry)
+        values.append(4)
+
+        assert "in_flight 4.0" in registry.render()
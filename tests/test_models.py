@@ -1,7 +1,9 @@
+from datetime import UTC, datetime
+
 import pytest
 from pydantic import ValidationError
 
-from src.models.speedresponse import SpeedResponse
+from src.models.speedresponse import SpeedMeasurement, SpeedResponse
 
 
 class TestSpeedResponse:
@@ -37,8 +39,11 @@ class TestSpeedResponse:
             "download_speed": 100.5,
             "upload_speed": 50.25,
             "ping": 10.0,
+            "jitter": None,
             "server_name": "Test Server",
             "server_location": "Test Location",
+            "download_margin": None,
+            "upload_margin": None,
         }
 
         assert response.model_dump() == expected_dict
@@ -92,3 +97,33 @@ class TestSpeedResponse:
         assert response.ping == 0.0
         assert response.server_name == ""
         assert response.server_location == ""
+
+
+class TestSpeedMeasurement:
+    """Test cases for SpeedMeasurement model"""
+
+    def test_measurement_is_speed_response(self):
+        """Test that a measurement extends SpeedResponse with a timestamp"""
+        timestamp = datetime(2025, 7, 15, 17, 49, 51, tzinfo=UTC)
+        measurement = SpeedMeasurement(
+            download_speed=99.48,
+            upload_speed=78.65,
+            ping=18.482,
+            server_name="Riga",
+            server_location="Latvia",
+            timestamp=timestamp,
+        )
+
+        assert isinstance(measurement, SpeedResponse)
+        assert measurement.model_dump()["timestamp"] == timestamp
+
+    def test_measurement_requires_timestamp(self):
+        """Test that SpeedMeasurement requires a timestamp"""
+        with pytest.raises(ValidationError):
+            SpeedMeasurement(
+                download_speed=99.48,
+                upload_speed=78.65,
+                ping=18.482,
+                server_name="Riga",
+                server_location="Latvia",
+            )
@@ -1,11 +1,29 @@
 import asyncio
+import gzip
 import json
+import socket
 import subprocess
-from unittest.mock import Mock, patch
+import time
+from unittest.mock import AsyncMock, Mock, patch
 
+import httpx
 import pytest
 
-from src.repositories.requester import RequestRepository
+from benchmarks.bench_pipeline import FAKE_CLI
+from benchmarks.fake_speedtest_cli import OUTPUT
+from src import metrics
+from src.executor import create_executor
+from src.repositories.coordinator import CoordinatorRepository
+from src.repositories.history import HistoryRepository
+from src.repositories.library import LibrarySpeedRepository
+from src.repositories.native import NativeSpeedRepository
+from src.repositories.probe import ProbeError, ProbeRepository
+from src.repositories.requester import OUTPUT_FIELDS, RequestRepository
+from src.repositories.servers import ServerCatalogRepository
+from src.repositories.shared import SharedResultStore
+from src.repositories.sites import SiteRepository
+from src.repositories.spool import SpoolRepository
+from src.repositories.transfer import RawHttpConnection, TransferError
 
 
 class TestRequestRepository:
@@ -44,7 +62,10 @@ class TestRequestRepository:
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
-        assert result == mock_speedtest_output
+        # Only the fields SpeedService uses are kept
+        assert result == {
+            field: mock_speedtest_output[field] for field in OUTPUT_FIELDS
+        }
 
     @pytest.mark.anyio
     @patch("src.repositories.requester.asyncio.create_subprocess_exec")
@@ -76,6 +97,25 @@ class TestRequestRepository:
         with pytest.raises(Exception, match="Speedtest failed with exit code 1"):
             await repo.get_speedtest_results()
 
+    @pytest.mark.anyio
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    async def test_speedtest_non_zero_exit(self, mock_wait_for, mock_create_subprocess):
+        """Test that a failed speedtest-cli run reports its exit code and stderr"""
+        mock_process = Mock(returncode=1)
+        mock_create_subprocess.return_value = mock_process
+        mock_wait_for.return_value = (b"", b"Cannot retrieve speedtest configuration\n")
+        failures = metrics.EXIT_CODE_FAILURES.value
+
+        repo = RequestRepository()
+
+        with pytest.raises(
+            Exception,
+            match="exit code 1: Cannot retrieve speedtest configuration",
+        ):
+            await repo.get_speedtest_results()
+        assert metrics.EXIT_CODE_FAILURES.value == failures + 1
+
     @pytest.mark.anyio
     @patch("src.repositories.requester.asyncio.create_subprocess_exec")
     @patch("src.repositories.requester.asyncio.wait_for")
@@ -130,3 +170,1036 @@ class TestRequestRepository:
         mock_wait_for.assert_called_once()
         call_args = mock_wait_for.call_args
         assert call_args[1]["timeout"] == 30
+
+    @pytest.mark.anyio
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    async def test_fleet_target_arguments(
+        self, mock_wait_for, mock_create_subprocess, mock_speedtest_output
+    ):
+        """Test that source address, server and namespace reach the command line"""
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(mock_speedtest_output).encode(), b"")
+
+        repo = RequestRepository(
+            server_id="1234", source_address="192.0.2.10", netns="wan2"
+        )
+        await repo.get_speedtest_results()
+
+        assert mock_create_subprocess.call_args.args == (
+            "ip",
+            "netns",
+            "exec",
+            "wan2",
+            "/usr/bin/speedtest-cli",
+            "--json",
+            "--source",
+            "192.0.2.10",
+            "--server",
+            "1234",
+        )
+
+    @pytest.mark.anyio
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    async def test_timed_out_process_is_killed(
+        self, mock_wait_for, mock_create_subprocess
+    ):
+        """Test that a speedtest-cli process still running after a timeout is killed"""
+        mock_process = Mock(returncode=None)
+        mock_create_subprocess.return_value = mock_process
+        mock_wait_for.side_effect = TimeoutError()
+
+        repo = RequestRepository()
+
+        with pytest.raises(Exception, match="Speedtest timed out"):
+            await repo.get_speedtest_results()
+        mock_process.kill.assert_called_once()
+
+    @pytest.mark.anyio
+    async def test_parses_output_in_executor(self):
+        """Test that speedtest-cli output can be parsed off the event loop"""
+        executor = create_executor("thread")
+        repo = RequestRepository(cli_path=FAKE_CLI, executor=executor)
+
+        result = await repo.get_speedtest_results()
+        executor.shutdown()
+
+        assert result == {field: OUTPUT[field] for field in OUTPUT_FIELDS}
+
+    @pytest.mark.anyio
+    async def test_runs_configured_executable(self):
+        """Test a real subprocess run against the benchmark's fake speedtest-cli"""
+        repo = RequestRepository(cli_path=FAKE_CLI)
+
+        result = await repo.get_speedtest_results()
+
+        assert result == {field: OUTPUT[field] for field in OUTPUT_FIELDS}
+        assert "client" not in result
+
+
+def _fake_speedtest_module() -> Mock:
+    module = Mock()
+    session = module.Speedtest.return_value
+    session.config = {"client": {"ip": "192.0.2.10"}}
+    session.best = OUTPUT["server"]
+    module.SpeedtestResults.return_value.dict.return_value = OUTPUT
+    return module
+
+
+class TestLibrarySpeedRepository:
+    """Test cases for LibrarySpeedRepository"""
+
+    @pytest.mark.anyio
+    async def test_session_reused_between_tests(self):
+        """Test that configuration and server are fetched once, not per test"""
+        module = _fake_speedtest_module()
+        catalog = ServerCatalogRepository()
+        repo = LibrarySpeedRepository(Mock(), server_catalog=catalog)
+
+        with patch("src.repositories.library.speedtest", module):
+            await repo.warm_up()
+            first = await repo.get_speedtest_results()
+            second = await repo.get_speedtest_results()
+
+        session = module.Speedtest.return_value
+        module.Speedtest.assert_called_once()
+        session.get_best_server.assert_any_call()
+        # Each test measures latency to the kept server again
+        session.get_best_server.assert_called_with([OUTPUT["server"]])
+        assert session.download.call_count == 2
+        assert first == second == {field: OUTPUT[field] for field in OUTPUT_FIELDS}
+        assert catalog.best_server()["id"] == OUTPUT["server"]["id"]
+
+    @pytest.mark.anyio
+    async def test_pinned_server_selected(self):
+        """Test that a cached server is used instead of picking the closest"""
+        module = _fake_speedtest_module()
+        catalog = ServerCatalogRepository()
+        catalog.remember_best_server({"id": "4242"})
+        repo = LibrarySpeedRepository(Mock(), server_catalog=catalog)
+
+        with patch("src.repositories.library.speedtest", module):
+            await repo.get_speedtest_results()
+
+        module.Speedtest.return_value.get_servers.assert_called_once_with(["4242"])
+
+    @pytest.mark.anyio
+    async def test_falls_back_to_cli_on_failure(self):
+        """Test that a failed in-process test is rerun with speedtest-cli"""
+        module = _fake_speedtest_module()
+        module.Speedtest.return_value.download.side_effect = OSError("reset")
+        fallback = Mock()
+        fallback.get_speedtest_results = AsyncMock(return_value=OUTPUT)
+        repo = LibrarySpeedRepository(fallback)
+        fallbacks = metrics.LIBRARY_FALLBACKS.value
+
+        with patch("src.repositories.library.speedtest", module):
+            result = await repo.get_speedtest_results()
+            module.Speedtest.return_value.download.side_effect = None
+            await repo.get_speedtest_results()
+
+        assert result == OUTPUT
+        fallback.get_speedtest_results.assert_awaited_once()
+        assert metrics.LIBRARY_FALLBACKS.value == fallbacks + 1
+        # The failed session is replaced rather than reused
+        assert module.Speedtest.call_count == 2
+
+    @pytest.mark.anyio
+    async def test_without_speedtest_module(self):
+        """Test that every test runs speedtest-cli when the module is missing"""
+        fallback = Mock()
+        fallback.get_speedtest_results = AsyncMock(return_value=OUTPUT)
+        repo = LibrarySpeedRepository(fallback)
+
+        with patch("src.repositories.library.speedtest", None):
+            await repo.warm_up()
+            result = await repo.get_speedtest_results()
+
+        assert result == OUTPUT
+
+    @pytest.mark.anyio
+    async def test_timeout_stops_transfers(self):
+        """Test that a timed-out test signals speedtest's threads to stop"""
+        module = _fake_speedtest_module()
+        session = module.Speedtest.return_value
+        stopped = []
+
+        def download():
+            stopped.append(session._shutdown_event.wait(5))
+
+        session.download.side_effect = download
+        repo = LibrarySpeedRepository(Mock(), timeout=0.05)
+
+        with patch("src.repositories.library.speedtest", module):
+            with pytest.raises(Exception, match="Speedtest timed out"):
+                await repo.get_speedtest_results()
+            # The next test waits for the abandoned one and starts afresh
+            session.download.side_effect = None
+            await repo.get_speedtest_results()
+
+        assert stopped == [True]
+        assert module.Speedtest.call_count == 2
+
+
+class TestHistoryRepository:
+    """Test cases for HistoryRepository"""
+
+    def test_empty_history(self):
+        """Test that querying an empty store returns no buckets"""
+        repo = HistoryRepository()
+        assert repo.query(0, 86400, 3600) == []
+
+    def test_append_and_query_buckets(self, make_measurement):
+        """Test that measurements are grouped into step-aligned buckets"""
+        repo = HistoryRepository()
+        repo.append(make_measurement(0, download_speed=100.0))
+        repo.append(make_measurement(1800, download_speed=200.0))
+        repo.append(make_measurement(3600, download_speed=50.0))
+
+        buckets = repo.query(0, 7200, 3600)
+
+        assert [start for start, _ in buckets] == [0, 3600]
+        first = buckets[0][1]["download_speed"]
+        assert first.count == 2
+        assert first.min == 100.0
+        assert first.max == 200.0
+        assert first.avg == 150.0
+
+    def test_range_excludes_outside_buckets(self, make_measurement):
+        """Test that measurements outside the range are not returned"""
+        repo = HistoryRepository()
+        repo.append(make_measurement(0))
+        repo.append(make_measurement(86400 * 2))
+
+        buckets = repo.query(86400, 86400 * 2, 3600)
+
+        assert buckets == []
+
+    def test_raw_and_rollup_queries_agree(self, make_measurement):
+        """Test that rollups give the same aggregates as the raw rows"""
+        repo = HistoryRepository()
+        for i in range(200):
+            repo.append(make_measurement(i * 97, download_speed=10.0 + i))
+
+        # 90 seconds is not a rollup resolution so it reads the raw rows
+        raw = repo.query(0, 200 * 97, 90)
+        rolled = repo.query(0, 200 * 97, 3600)
+
+        assert sum(b["ping"].count for _, b in raw) == 200
+        assert sum(b["ping"].count for _, b in rolled) == 200
+        assert max(b["download_speed"].max for _, b in rolled) == 209.0
+
+    def test_rollups_used_for_coarse_steps(self, make_measurement):
+        """Test that a daily step is answered from the daily rollup"""
+        repo = HistoryRepository()
+        repo.append(make_measurement(100))
+        repo.append(make_measurement(86400 + 100))
+        repo._connection.execute("DELETE FROM measurements")
+
+        buckets = repo.query(0, 86400 * 2, 86400)
+
+        assert [start for start, _ in buckets] == [0, 86400]
+
+    def test_iter_rows_pages_through_equal_timestamps(self, make_measurement):
+        """Test that batches continue after rows sharing one timestamp"""
+        repo = HistoryRepository()
+        for i in range(10):
+            repo.append(make_measurement(i // 4 * 60, download_speed=float(i)))
+
+        batches = list(repo.iter_rows(columns=("download_speed",), batch_size=3))
+
+        assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+        assert [row for batch in batches for row in batch] == [
+            (float(i),) for i in range(10)
+        ]
+
+    def test_iter_rows_filters_and_projects(self, make_measurement):
+        """Test that the time range and columns are applied in the query"""
+        repo = HistoryRepository()
+        for i in range(5):
+            repo.append(make_measurement(i * 60, ping=float(i)))
+
+        rows = [
+            row
+            for batch in repo.iter_rows(60, 240, ("timestamp", "ping"))
+            for row in batch
+        ]
+
+        assert rows == [(60.0, 1.0), (120.0, 2.0), (180.0, 3.0)]
+
+    def test_iter_rows_rejects_unknown_columns(self):
+        """Test that only exportable columns can be projected"""
+        repo = HistoryRepository()
+
+        with pytest.raises(ValueError, match="rowid"):
+            next(repo.iter_rows(columns=("ping", "rowid")))
+
+    def test_history_persists_on_disk(self, tmp_path, make_measurement):
+        """Test that a file-backed store survives reopening"""
+        path = str(tmp_path / "history.db")
+        HistoryRepository(path).append(make_measurement(0))
+
+        buckets = HistoryRepository(path).query(0, 3600, 3600)
+
+        assert buckets[0][1]["ping"].count == 1
+
+
+class TestNativeSpeedRepository:
+    """Test cases for NativeSpeedRepository against a local stand-in server"""
+
+    def make_repository(self, url, **kwargs):
+        options = {
+            "server_name": "Local",
+            "server_location": "Loopback",
+            "streams": 2,
+            "warmup": 0.05,
+            "duration": 0.1,
+            "latency_samples": 2,
+            "download_size": 100,
+            "upload_size": 128 * 1024,
+        }
+        options.update(kwargs)
+        return NativeSpeedRepository(url, **options)
+
+    @pytest.mark.anyio
+    async def test_measures_against_standin(self, speedtest_server):
+        """Test a full measurement returns speedtest-cli shaped results"""
+        repo = self.make_repository(speedtest_server.url)
+
+        result = await repo.get_speedtest_results()
+        await repo.aclose()
+
+        assert result["download"] > 0
+        assert result["upload"] > 0
+        assert result["ping"] > 0
+        assert result["jitter"] >= 0
+        assert result["server"]["name"] == "Local"
+        assert result["server"]["country"] == "Loopback"
+        assert result["bytes_received"] > 0
+        assert speedtest_server.bytes_received >= result["bytes_sent"]
+
+    @pytest.mark.anyio
+    async def test_empty_window_reports_zero(self, speedtest_server):
+        """Test that a phase without warm-up or duration reports 0 instead of failing"""
+        repo = self.make_repository(speedtest_server.url, warmup=0, duration=0)
+
+        try:
+            result = await repo.get_speedtest_results()
+        finally:
+            await repo.aclose()
+
+        assert result["download"] == 0
+        assert result["upload"] == 0
+
+    @pytest.mark.anyio
+    async def test_uses_parallel_streams(self, speedtest_server):
+        """Test that each direction runs the configured number of streams"""
+        repo = self.make_repository(speedtest_server.url, streams=3)
+        transfers = []
+        original = repo._download
+
+        async def tracking_download(server_url, counter):
+            transfers.append(asyncio.current_task())
+            await original(server_url, counter)
+
+        repo._download = tracking_download
+        await repo.get_speedtest_results()
+        await repo.aclose()
+
+        assert len(set(transfers)) == 3
+
+    @pytest.mark.anyio
+    async def test_server_error_is_raised(self, speedtest_server):
+        """Test that an HTTP error from the server fails the measurement"""
+        bad_url = speedtest_server.url.replace("/speedtest/", "/missing/")
+        repo = self.make_repository(bad_url)
+
+        with pytest.raises(Exception, match="Speedtest request failed"):
+            await repo.get_speedtest_results()
+        await repo.aclose()
+
+    @pytest.mark.anyio
+    async def test_missing_server_url(self):
+        """Test that measuring without a configured server fails clearly"""
+        repo = self.make_repository("")
+
+        with pytest.raises(Exception, match="No speedtest server configured"):
+            await repo.get_speedtest_results()
+        await repo.aclose()
+
+    @pytest.mark.anyio
+    async def test_timeout(self, speedtest_server):
+        """Test that the overall timeout bounds the measurement"""
+        repo = self.make_repository(speedtest_server.url, duration=5, timeout=0.2)
+
+        with pytest.raises(Exception, match="Speedtest timed out"):
+            await repo.get_speedtest_results()
+        await repo.aclose()
+
+    @pytest.mark.anyio
+    async def test_stream_emits_phases_and_progress(self, speedtest_server):
+        """Test that streaming yields phases, throughput samples and a result"""
+        repo = self.make_repository(
+            speedtest_server.url, warmup=0.02, duration=0.1, sample_interval=0.02
+        )
+
+        events = [event async for event in repo.stream_speedtest_results()]
+        await repo.aclose()
+
+        phases = [e["phase"] for e in events if e["event"] == "phase"]
+        assert phases == ["server_selection", "latency", "download", "upload"]
+        samples = [e for e in events if e["event"] == "progress"]
+        assert {e["phase"] for e in samples} == {"download", "upload"}
+        assert all(e["bits_per_second"] >= 0 for e in samples)
+        assert events[-1]["event"] == "result"
+        assert events[-1]["results"]["download"] > 0
+
+    @pytest.mark.anyio
+    @pytest.mark.parametrize("kind", ["thread", "process"])
+    async def test_measures_in_executor(self, speedtest_server, kind):
+        """Test that transfers run on an executor worker's own event loop"""
+        executor = create_executor(kind)
+        repo = self.make_repository(speedtest_server.url, executor=executor)
+
+        try:
+            first = await repo.get_speedtest_results()
+            second = await repo.get_speedtest_results()
+        finally:
+            executor.shutdown()
+            await repo.aclose()
+
+        assert first["download"] > 0
+        assert second["server"]["name"] == "Local"
+        # Latency is measured once per run, the transfers many times
+        assert speedtest_server.requests > 4
+
+    @pytest.mark.anyio
+    @pytest.mark.parametrize("kind", ["thread", "process"])
+    async def test_streams_from_executor(self, speedtest_server, kind):
+        """Test that a stream's transfers run on the executor with progress sent back"""
+        executor = create_executor(kind)
+        repo = self.make_repository(
+            speedtest_server.url, executor=executor, sample_interval=0.02
+        )
+        repo._download = repo._upload = Mock(side_effect=AssertionError("on loop"))
+
+        try:
+            events = [event async for event in repo.stream_speedtest_results()]
+        finally:
+            executor.shutdown()
+            await repo.aclose()
+
+        phases = [e["phase"] for e in events if e["event"] == "phase"]
+        assert phases == ["server_selection", "latency", "download", "upload"]
+        assert {e["phase"] for e in events if e["event"] == "progress"} == {
+            "download",
+            "upload",
+        }
+        assert events[-1]["event"] == "result"
+        assert events[-1]["results"]["download"] > 0
+
+    @pytest.mark.anyio
+    async def test_measures_with_socket_transfers(self, speedtest_server):
+        """Test that raw socket transfers count the bytes the server moved"""
+        repo = self.make_repository(
+            speedtest_server.url, transfer="socket", download_size=200
+        )
+
+        result = await repo.get_speedtest_results()
+        await repo.aclose()
+
+        assert result["download"] > 0
+        assert result["upload"] > 0
+        assert 0 < result["bytes_received"] <= speedtest_server.bytes_sent
+        assert 0 < result["bytes_sent"] <= speedtest_server.bytes_received
+        assert repo._idle_connections == []
+
+    @pytest.mark.anyio
+    async def test_adaptive_mode_stops_when_converged(self, speedtest_server):
+        """Test that an adaptive phase ends once its throughput is stable"""
+        repo = self.make_repository(
+            speedtest_server.url,
+            duration=30,
+            sample_interval=0.02,
+            adaptive=True,
+            tolerance=1.0,
+        )
+
+        started = time.monotonic()
+        events = [event async for event in repo.stream_speedtest_results()]
+        await repo.aclose()
+
+        assert time.monotonic() - started < 5
+        completed = [e for e in events if e["event"] == "phase_complete"]
+        assert [e["phase"] for e in completed] == ["download", "upload"]
+        for event in completed:
+            assert 0 < event["margin"] <= 1.0
+        result = events[-1]["results"]
+        assert result["download_margin"] == completed[0]["margin"]
+        assert result["upload_margin"] == completed[1]["margin"]
+
+
+class TestRawHttpConnection:
+    """Test cases for RawHttpConnection against a local stand-in server"""
+
+    def download_url(self, server, size=100):
+        return server.url.replace("upload.php", f"random{size}x{size}.jpg")
+
+    @pytest.mark.anyio
+    async def test_get_counts_body_and_reuses_connection(self, speedtest_server):
+        """Test that bodies are counted and the connection is kept alive"""
+        connection = RawHttpConnection(speedtest_server.url, buffer_size=4096)
+        received = []
+
+        await connection.get(self.download_url(speedtest_server), received.append)
+        first_socket = connection._sock
+        await connection.get(self.download_url(speedtest_server), received.append)
+        connection.close()
+
+        assert sum(received) == 2 * 100 * 100 * 2
+        assert connection._sock is None
+        assert first_socket.fileno() == -1
+        assert speedtest_server.requests == 2
+
+    @pytest.mark.anyio
+    async def test_post_sends_body(self, speedtest_server):
+        """Test that the whole body is sent in chunks and counted"""
+        connection = RawHttpConnection(speedtest_server.url)
+        body = memoryview(bytes(300_000))
+        sent = []
+
+        await connection.post(speedtest_server.url, body, sent.append, 128 * 1024)
+        connection.close()
+
+        assert sent == [128 * 1024, 128 * 1024, 300_000 - 256 * 1024]
+        assert speedtest_server.bytes_received == 300_000
+
+    @pytest.mark.anyio
+    async def test_error_status_raises(self, speedtest_server):
+        """Test that an HTTP error status fails the transfer"""
+        connection = RawHttpConnection(speedtest_server.url)
+        missing = speedtest_server.url.replace("upload.php", "missing")
+
+        with pytest.raises(TransferError, match="404"):
+            await connection.get(missing, lambda count: None)
+        assert connection._sock is None
+
+    @pytest.mark.anyio
+    async def test_closed_connection_raises(self):
+        """Test that a server closing mid-response fails the transfer"""
+
+        async def truncate(reader, writer):
+            await reader.readline()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\nshort")
+            writer.close()
+
+        server = await asyncio.start_server(truncate, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        connection = RawHttpConnection(f"http://127.0.0.1:{port}/")
+
+        try:
+            with pytest.raises(TransferError, match="closed before the response"):
+                await connection.get(f"http://127.0.0.1:{port}/", lambda count: None)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    def test_rejects_https(self):
+        """Test that only plain HTTP servers can use socket transfers"""
+        with pytest.raises(TransferError, match="Unsupported URL"):
+            RawHttpConnection("https://example.com/speedtest/upload.php")
+
+
+class TestProbeRepository:
+    """Test cases for the TCP, HTTP and UDP latency probes"""
+
+    @pytest.mark.anyio
+    async def test_tcp_probe(self, speedtest_server):
+        """Test that a TCP probe times the connection handshake"""
+        repo = ProbeRepository(f"127.0.0.1:{speedtest_server.port}", "tcp")
+
+        rtt = await repo.probe()
+        await repo.aclose()
+
+        assert 0 < rtt < 1000
+
+    @pytest.mark.anyio
+    async def test_http_probe(self, speedtest_server):
+        """Test that an HTTP probe times a HEAD request"""
+        url = speedtest_server.url.replace("upload.php", "latency.txt")
+        repo = ProbeRepository(url, "http")
+
+        first = await repo.probe()
+        second = await repo.probe()
+        await repo.aclose()
+
+        assert first > 0 and second > 0
+        assert speedtest_server.requests == 2
+        assert speedtest_server.bytes_sent == 0
+
+    @pytest.mark.anyio
+    async def test_udp_probe(self, echo_server):
+        """Test that a UDP probe waits for its datagram to come back"""
+        repo = ProbeRepository(echo_server.address, "udp")
+
+        rtts = [await repo.probe() for _ in range(3)]
+        await repo.aclose()
+
+        assert all(rtt > 0 for rtt in rtts)
+        assert echo_server.received == 3
+
+    @pytest.mark.anyio
+    async def test_udp_probe_lost(self, echo_server):
+        """Test that an unanswered datagram is a lost probe"""
+        repo = ProbeRepository(echo_server.address, "udp", timeout=0.05)
+        echo_server.drop = 1
+
+        with pytest.raises(ProbeError, match="timed out"):
+            await repo.probe()
+        rtt = await repo.probe()
+        await repo.aclose()
+
+        assert rtt > 0
+
+    @pytest.mark.anyio
+    async def test_refused_connection_is_lost(self):
+        """Test that a refused TCP connection is a lost probe"""
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        repo = ProbeRepository(f"127.0.0.1:{port}", "tcp")
+
+        with pytest.raises(ProbeError, match="Probe failed"):
+            await repo.probe()
+        await repo.aclose()
+
+    @pytest.mark.anyio
+    async def test_invalid_target(self):
+        """Test that a target without a port is rejected"""
+        repo = ProbeRepository("example.com", "udp")
+
+        with pytest.raises(ProbeError, match="host:port"):
+            await repo.probe()
+        await repo.aclose()
+
+
+CONFIG_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<settings>
+<client ip="84.50.246.185" lat="59.4381" lon="24.7369" isp="Telia Eesti" country="EE" />
+</settings>"""
+
+SERVERS_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<settings>
+<servers>
+<server url="http://riga.example:8080/speedtest/upload.php" lat="56.9496" lon="24.1040" name="Riga" country="Latvia" cc="LV" sponsor="RETN" id="28935" host="riga.example:8080" />
+<server url="http://tallinn.example:8080/speedtest/upload.php" lat="59.4370" lon="24.7536" name="Tallinn" country="Estonia" cc="EE" sponsor="Elisa" id="1234" host="tallinn.example:8080" />
+<server url="http://sydney.example:8080/speedtest/upload.php" lat="-33.8688" lon="151.2093" name="Sydney" country="Australia" cc="AU" sponsor="Telstra" id="999" host="sydney.example:8080" />
+</servers>
+</settings>"""
+
+
+class TestServerCatalogRepository:
+    """Test cases for ServerCatalogRepository"""
+
+    def make_client(self, requests):
+        def handler(request):
+            requests.append(request.url.path)
+            body = CONFIG_XML if "config" in request.url.path else SERVERS_XML
+            return httpx.Response(200, content=body)
+
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    @pytest.mark.anyio
+    async def test_nearest_servers_sorted_by_distance(self):
+        """Test that servers are ordered by distance from the client"""
+        catalog = ServerCatalogRepository(client=self.make_client([]))
+
+        servers = await catalog.nearest_servers(3)
+
+        assert [server["name"] for server in servers] == ["Tallinn", "Riga", "Sydney"]
+        assert servers[0]["d"] < 5
+        assert 250 < servers[1]["d"] < 310
+        assert catalog.client_config["isp"] == "Telia Eesti"
+
+    @pytest.mark.anyio
+    async def test_catalog_fetched_once_within_ttl(self):
+        """Test that the catalogue is not re-downloaded while fresh"""
+        requests = []
+        catalog = ServerCatalogRepository(client=self.make_client(requests))
+
+        await catalog.nearest_servers()
+        await catalog.nearest_servers()
+
+        assert len(requests) == 2  # one config and one server list download
+
+    @pytest.mark.anyio
+    async def test_catalog_refreshed_after_ttl(self):
+        """Test that an expired catalogue is downloaded again"""
+        requests = []
+        catalog = ServerCatalogRepository(ttl=0, client=self.make_client(requests))
+
+        await catalog.nearest_servers()
+        await catalog.nearest_servers()
+
+        assert len(requests) == 4
+
+    @pytest.mark.anyio
+    async def test_catalog_persisted_on_disk(self, tmp_path):
+        """Test that a cached catalogue is reused by a new instance"""
+        path = str(tmp_path / "servers.json")
+        await ServerCatalogRepository(path, client=self.make_client([])).refresh()
+        requests = []
+
+        reloaded = ServerCatalogRepository(path, client=self.make_client(requests))
+        servers = await reloaded.nearest_servers(1)
+
+        assert servers[0]["name"] == "Tallinn"
+        assert requests == []
+
+    def test_best_server_remembered(self, tmp_path):
+        """Test that the chosen server is remembered and persisted"""
+        path = str(tmp_path / "servers.json")
+        ServerCatalogRepository(path).remember_best_server(
+            {"id": "28935", "name": "Riga", "latency": 18.482}
+        )
+
+        best = ServerCatalogRepository(path).best_server()
+
+        assert best["id"] == "28935"
+        assert best["latency"] == 18.482
+
+    def test_best_server_expires(self):
+        """Test that the remembered server is dropped after the TTL"""
+        catalog = ServerCatalogRepository(ttl=0)
+        catalog.remember_best_server({"id": "28935"})
+
+        assert catalog.best_server() is None
+
+    def test_server_without_id_not_remembered(self):
+        """Test that results without a server id do not pin anything"""
+        catalog = ServerCatalogRepository()
+        catalog.remember_best_server({"name": "Riga"})
+
+        assert catalog.best_server() is None
+
+
+class TestServerPinning:
+    """Test cases for reusing the selected server between speedtests"""
+
+    @pytest.mark.anyio
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    async def test_cli_pins_remembered_server(
+        self, mock_wait_for, mock_create_subprocess, mock_speedtest_output
+    ):
+        """Test that the server chosen by the first run is passed to later runs"""
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(mock_speedtest_output).encode(), b"")
+        repo = RequestRepository(server_catalog=ServerCatalogRepository())
+
+        await repo.get_speedtest_results()
+        await repo.get_speedtest_results()
+
+        first, second = mock_create_subprocess.call_args_list
+        assert first.args == ("/usr/bin/speedtest-cli", "--json")
+        assert second.args == (
+            "/usr/bin/speedtest-cli",
+            "--json",
+            "--server",
+            "28935",
+        )
+
+    @pytest.mark.anyio
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    async def test_cli_reselects_after_pinned_server_fails(
+        self, mock_wait_for, mock_create_subprocess, mock_speedtest_output
+    ):
+        """Test that a failed run drops the pin so the next run selects again"""
+        process = Mock(returncode=1)
+        mock_create_subprocess.return_value = process
+        mock_wait_for.return_value = (b"", b"ERROR: server unreachable")
+        catalog = ServerCatalogRepository()
+        catalog.remember_best_server({"id": "4242"})
+        repo = RequestRepository(server_catalog=catalog)
+
+        with pytest.raises(Exception, match="exit code 1"):
+            await repo.get_speedtest_results()
+        assert catalog.best_server() is None
+        process.returncode = 0
+        mock_wait_for.return_value = (json.dumps(mock_speedtest_output).encode(), b"")
+        await repo.get_speedtest_results()
+
+        failed, retried = mock_create_subprocess.call_args_list
+        assert failed.args[-2:] == ("--server", "4242")
+        assert retried.args == ("/usr/bin/speedtest-cli", "--json")
+        assert catalog.best_server()["id"] == "28935"
+
+    @pytest.mark.anyio
+    async def test_library_reselects_after_pinned_server_fails(self):
+        """Test that the in-process engine drops a pin its test failed on"""
+        module = _fake_speedtest_module()
+        module.Speedtest.return_value.download.side_effect = OSError("reset")
+        catalog = ServerCatalogRepository()
+        catalog.remember_best_server({"id": "4242"})
+        fallback = Mock()
+        fallback.get_speedtest_results = AsyncMock(return_value=OUTPUT)
+        repo = LibrarySpeedRepository(fallback, server_catalog=catalog)
+
+        with patch("src.repositories.library.speedtest", module):
+            await repo.get_speedtest_results()
+            assert catalog.best_server() is None
+            module.Speedtest.return_value.download.side_effect = None
+            await repo.get_speedtest_results()
+
+        session = module.Speedtest.return_value
+        session.get_servers.assert_called_once_with(["4242"])
+        assert catalog.best_server()["id"] == OUTPUT["server"]["id"]
+
+    @pytest.mark.anyio
+    async def test_native_reselects_after_pinned_server_fails(self, speedtest_server):
+        """Test that the native engine picks a new server once the pinned one fails"""
+        broken = speedtest_server.url.replace("/speedtest/", "/gone/")
+        catalog = ServerCatalogRepository()
+        catalog._data.update(
+            fetched_at=float("inf"),
+            servers=[
+                {
+                    "id": "2",
+                    "name": "Local",
+                    "country": "Loopback",
+                    "url": speedtest_server.url,
+                }
+            ],
+        )
+        catalog.remember_best_server(
+            {"id": "1", "name": "Broken", "country": "Nowhere", "url": broken}
+        )
+        repo = NativeSpeedRepository(
+            "",
+            warmup=0.01,
+            duration=0.05,
+            download_size=100,
+            upload_size=64 * 1024,
+            server_catalog=catalog,
+        )
+
+        with pytest.raises(Exception, match="request failed"):
+            await repo.get_speedtest_results()
+        result = await repo.get_speedtest_results()
+        await repo.aclose()
+
+        assert result["server"]["name"] == "Local"
+        assert catalog.best_server()["id"] == "2"
+
+    @pytest.mark.anyio
+    async def test_native_selects_lowest_latency_server(self, speedtest_server):
+        """Test that the native engine picks a reachable nearby server"""
+        catalog = ServerCatalogRepository()
+        catalog._data.update(
+            fetched_at=float("inf"),
+            servers=[
+                {
+                    "id": "1",
+                    "name": "Broken",
+                    "country": "Nowhere",
+                    "url": speedtest_server.url.replace("/speedtest/", "/gone/"),
+                },
+                {
+                    "id": "2",
+                    "name": "Local",
+                    "country": "Loopback",
+                    "url": speedtest_server.url,
+                },
+            ],
+        )
+        repo = NativeSpeedRepository(
+            "",
+            warmup=0.01,
+            duration=0.05,
+            download_size=100,
+            upload_size=64 * 1024,
+            server_catalog=catalog,
+        )
+
+        result = await repo.get_speedtest_results()
+        await repo.aclose()
+
+        assert result["server"]["name"] == "Local"
+        assert catalog.best_server()["id"] == "2"
+
+
+class TestSiteRepository:
+    """Test cases for SiteRepository"""
+
+    def test_retried_batch_is_not_stored_twice(self, make_measurement):
+        """Test that measurements are keyed by site and timestamp"""
+        repo = SiteRepository()
+        batch = [make_measurement(0), make_measurement(60)]
+
+        assert repo.append_batch("riga", batch) == 2
+        assert repo.append_batch("riga", batch) == 0
+        assert repo.append_batch("tallinn", batch) == 2
+
+    def test_summaries_report_latest_per_site(self, make_measurement):
+        """Test that each site reports its count, first and latest result"""
+        repo = SiteRepository()
+        repo.append_batch("riga", [make_measurement(0), make_measurement(60, 80.0)])
+        repo.append_batch("tallinn", [make_measurement(30, 120.0)])
+
+        summaries = repo.summaries()
+
+        assert [(site, count, first) for site, count, first, _ in summaries] == [
+            ("riga", 2, 0.0),
+            ("tallinn", 1, 30.0),
+        ]
+        assert summaries[0][3].download_speed == 80.0
+
+    def test_query_per_site_and_merged(self, make_measurement):
+        """Test that history can be queried for one site or all sites"""
+        repo = SiteRepository()
+        repo.append_batch("riga", [make_measurement(0, 100.0)])
+        repo.append_batch("tallinn", [make_measurement(10, 200.0)])
+
+        merged = repo.query(0, 3600, 3600)
+        riga = repo.query(0, 3600, 3600, site="riga")
+
+        assert merged[0][1]["download_speed"].count == 2
+        assert riga[0][1]["download_speed"].count == 1
+        assert riga[0][1]["download_speed"].max == 100.0
+
+
+class TestSpoolRepository:
+    """Test cases for SpoolRepository"""
+
+    def test_append_load_and_replace(self, tmp_path, make_measurement):
+        """Test that spooled measurements survive a new repository instance"""
+        path = str(tmp_path / "spool.jsonl")
+        spool = SpoolRepository(path)
+        spool.append(make_measurement(0))
+        spool.append(make_measurement(60))
+
+        assert [m.timestamp.timestamp() for m in SpoolRepository(path).load()] == [
+            0,
+            60,
+        ]
+        spool.replace([make_measurement(60)])
+        assert len(SpoolRepository(path).load()) == 1
+
+    def test_truncated_line_is_dropped(self, tmp_path, make_measurement):
+        """Test that a line cut short by a crash does not lose the rest"""
+        path = tmp_path / "spool.jsonl"
+        spool = SpoolRepository(str(path))
+        spool.append(make_measurement(0))
+        with open(path, "a") as file:
+            file.write('{"download_speed": 1')
+
+        assert len(spool.load()) == 1
+
+    def test_memory_only_without_path(self, make_measurement):
+        """Test that an empty path keeps nothing on disk"""
+        spool = SpoolRepository()
+        spool.append(make_measurement(0))
+
+        assert spool.load() == []
+
+
+class TestSharedResultStore:
+    """Test cases for SharedResultStore"""
+
+    def test_publish_is_read_by_another_instance(self, tmp_path):
+        """Test that a body published through one mapping is seen by another"""
+        path = str(tmp_path / "shared")
+        writer = SharedResultStore(path)
+        reader = SharedResultStore(path)
+
+        assert reader.read() is None
+        sequence = writer.publish(b'{"ping": 10.0}')
+
+        assert reader.read() == (sequence, b'{"ping": 10.0}')
+        assert reader.read(sequence) is None
+        assert writer.publish(b"{}") > sequence
+
+    def test_oversized_body_is_rejected(self, tmp_path):
+        """Test that a body larger than the mapping raises instead of truncating"""
+        store = SharedResultStore(str(tmp_path / "shared"), size=32)
+
+        with pytest.raises(ValueError):
+            store.publish(b"x" * 32)
+
+    @pytest.mark.anyio
+    async def test_lock_excludes_other_instances(self, tmp_path):
+        """Test that only one store on a path holds the lock at a time"""
+        path = str(tmp_path / "shared")
+        first = SharedResultStore(path)
+        second = SharedResultStore(path)
+        order = []
+
+        async def hold(store, name):
+            async with store.lock(poll_interval=0.01):
+                order.append(f"{name} start")
+                await asyncio.sleep(0.05)
+                order.append(f"{name} end")
+
+        await asyncio.gather(hold(first, "first"), hold(second, "second"))
+
+        assert order == ["first start", "first end", "second start", "second end"]
+
+    def test_entries_are_seen_by_another_instance(self, tmp_path):
+        """Test that named entries are shared, replaced and deleted"""
+        path = str(tmp_path / "shared")
+        writer = SharedResultStore(path)
+        reader = SharedResultStore(path)
+
+        assert reader.get("fleet") is None
+        writer.put("fleet", b"[]")
+        writer.put("fleet", b"[{}]")
+
+        assert reader.get("fleet") == b"[{}]"
+        reader.delete("fleet")
+        reader.delete("fleet")
+        assert writer.get("fleet") is None
+
+
+class TestCoordinatorRepository:
+    """Test cases for CoordinatorRepository"""
+
+    @pytest.mark.anyio
+    async def test_push_sends_gzipped_batch(self, make_measurement):
+        """Test that batches are posted gzip compressed with the token"""
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"accepted": 1})
+
+        repo = CoordinatorRepository(
+            "http://coordinator:8000/",
+            token="secret",
+            client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+
+        accepted = await repo.push("riga", [make_measurement(0)])
+
+        request = requests[0]
+        assert accepted == 1
+        assert str(request.url) == "http://coordinator:8000/speed/sites/ingest"
+        assert request.headers["content-encoding"] == "gzip"
+        assert request.headers["authorization"] == "Bearer secret"
+        body = json.loads(gzip.decompress(request.content))
+        assert body["site"] == "riga"
+        assert len(body["measurements"]) == 1
+
+    @pytest.mark.anyio
+    async def test_push_raises_on_error_status(self, make_measurement):
+        """Test that a rejected batch raises so the agent keeps it"""
+        repo = CoordinatorRepository(
+            "http://coordinator:8000",
+            client=httpx.AsyncClient(
+                transport=httpx.MockTransport(lambda request: httpx.Response(503))
+            ),
+        )
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await repo.push("riga", [make_measurement(0)])
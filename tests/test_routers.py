@@ -1,7 +1,25 @@
+import asyncio
+import gzip
 import json
-from unittest.mock import Mock, patch
+import socket
+import threading
+import time
+from datetime import UTC, datetime
+from unittest.mock import AsyncMock, Mock, patch
 
+import httpx
+import pytest
 from fastapi import status
+from fastapi.testclient import TestClient
+
+from src.dependencies import (
+    get_admission_controller,
+    get_job_manager,
+    get_result_cache,
+)
+from src.main import app
+from src.models.job import SpeedJob
+from src.services.result_cache import ResultCache
 
 
 class TestRootRouter:
@@ -109,3 +127,810 @@ class TestSpeedRouter:
         """Test that speed endpoint only accepts GET requests"""
         response = test_client.post("/speed")
         assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+    def test_coalescing_stats_endpoint(self, test_client):
+        """Test that coalescing stats start at zero"""
+        response = test_client.get("/speed/coalescing")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"executions": 0, "coalesced": 0, "in_flight": 0}
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_coalescing_stats_count_executions(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that speed requests are reflected in coalescing stats"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+
+        test_client.get("/speed")
+        response = test_client.get("/speed/coalescing")
+
+        assert response.json()["executions"] == 1
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_speed_endpoint_serves_cached_result(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that a second call within the TTL reuses the first result"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+
+        first = test_client.get("/speed")
+        second = test_client.get("/speed")
+
+        assert first.json() == second.json()
+        assert "timestamp" in first.json()
+        mock_create_subprocess.assert_called_once()
+
+        test_client.get("/speed", params={"max_age": 0})
+        assert mock_create_subprocess.call_count == 2
+
+    def test_speed_endpoint_rejects_negative_max_age(self, test_client):
+        """Test that max_age must not be negative"""
+        response = test_client.get("/speed", params={"max_age": -1})
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_latest_endpoint_without_results(self, test_client):
+        """Test that latest returns 404 before any speed test finished"""
+        response = test_client.get("/speed/latest")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json()["detail"] == "No speed test results available yet"
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_latest_endpoint_returns_last_result(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that latest returns the last result without measuring"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+        measured = test_client.get("/speed").json()
+
+        response = test_client.get("/speed/latest")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == measured
+        mock_create_subprocess.assert_called_once()
+
+    @pytest.mark.anyio
+    async def test_latest_reads_cache_on_the_event_loop(self, make_measurement):
+        """Test that latest reads and syncs the cache on the loop's thread"""
+        cache = ResultCache(ttl=60)
+        cache.store(make_measurement(0))
+        synced_from = []
+        sync = cache._sync
+
+        def record_thread():
+            synced_from.append(threading.current_thread())
+            sync()
+
+        cache._sync = record_thread
+        app.dependency_overrides[get_result_cache] = lambda: cache
+        try:
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app), base_url="http://test"
+            ) as client:
+                response = await client.get("/speed/latest")
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == status.HTTP_200_OK
+        assert synced_from
+        assert set(synced_from) == {threading.current_thread()}
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_speed_conditional_requests(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that results carry validators and unchanged ones return 304"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+        first = test_client.get("/speed")
+        etag = first.headers["etag"]
+        last_modified = first.headers["last-modified"]
+
+        latest = test_client.get("/speed/latest")
+        matching = test_client.get("/speed", headers={"If-None-Match": etag})
+        weak = test_client.get(
+            "/speed/latest", headers={"If-None-Match": f'"other", W/{etag}'}
+        )
+        other = test_client.get("/speed/latest", headers={"If-None-Match": '"x"'})
+        since = test_client.get(
+            "/speed/latest", headers={"If-Modified-Since": last_modified}
+        )
+        before = test_client.get(
+            "/speed/latest",
+            headers={"If-Modified-Since": "Thu, 01 Jan 2015 00:00:00 GMT"},
+        )
+
+        assert first.headers["cache-control"] in ("max-age=60", "max-age=59")
+        assert latest.headers["etag"] == etag
+        assert latest.content == first.content
+        assert matching.status_code == status.HTTP_304_NOT_MODIFIED
+        assert matching.content == b""
+        assert matching.headers["etag"] == etag
+        assert weak.status_code == status.HTTP_304_NOT_MODIFIED
+        assert other.status_code == status.HTTP_200_OK
+        assert since.status_code == status.HTTP_304_NOT_MODIFIED
+        assert before.status_code == status.HTTP_200_OK
+        mock_create_subprocess.assert_called_once()
+
+    def test_history_endpoint_empty(self, test_client):
+        """Test that history is empty before any measurement"""
+        response = test_client.get("/speed/history")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["buckets"] == []
+        assert response.json()["step"] == 3600
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_history_endpoint_includes_measurements(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that measurements taken through /speed appear in history"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+        test_client.get("/speed")
+
+        response = test_client.get("/speed/history", params={"step": 60})
+
+        buckets = response.json()["buckets"]
+        assert len(buckets) == 1
+        assert buckets[0]["count"] == 1
+        assert buckets[0]["download_speed"]["avg"] == 50.0
+        assert buckets[0]["ping"]["max"] == 35.2
+
+    def test_history_endpoint_accepts_range(self, test_client):
+        """Test that from and to are accepted as ISO timestamps"""
+        response = test_client.get(
+            "/speed/history",
+            params={
+                "from": "2025-07-01T00:00:00Z",
+                "to": "2025-07-02T00:00:00Z",
+                "step": 86400,
+            },
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["start"] == "2025-07-01T00:00:00Z"
+
+    def test_history_endpoint_documents_model(self, test_client):
+        """Test that history responses keep their schema in the OpenAPI spec"""
+        spec = test_client.get("/openapi.json").json()
+
+        for path in ("/speed/history", "/speed/sites/history"):
+            content = spec["paths"][path]["get"]["responses"]["200"]["content"]
+            assert content["application/json"]["schema"] == {
+                "$ref": "#/components/schemas/HistoryResponse"
+            }
+
+    def test_history_endpoint_validation(self, test_client):
+        """Test that invalid ranges and steps are rejected"""
+        inverted = test_client.get(
+            "/speed/history",
+            params={"from": "2025-07-02T00:00:00Z", "to": "2025-07-01T00:00:00Z"},
+        )
+        too_many = test_client.get("/speed/history", params={"step": 1})
+        bad_step = test_client.get("/speed/history", params={"step": 0})
+
+        assert inverted.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert too_many.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert bad_step.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_export_csv(self, mock_wait_for, mock_create_subprocess, test_client):
+        """Test that history is exported as CSV with the selected columns"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+        test_client.get("/speed")
+
+        response = test_client.get(
+            "/speed/export", params={"columns": "download_speed,server_name"}
+        )
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/csv")
+        assert "history.csv" in response.headers["content-disposition"]
+        assert response.text == "download_speed,server_name\n50.0,Stockholm\n"
+
+    def test_export_formats(self, test_client):
+        """Test that Arrow and Parquet exports read back with the schema"""
+        pyarrow = pytest.importorskip("pyarrow")
+        ipc = pytest.importorskip("pyarrow.ipc")
+        parquet = pytest.importorskip("pyarrow.parquet")
+
+        arrow_response = test_client.get("/speed/export", params={"format": "arrow"})
+        parquet_response = test_client.get(
+            "/speed/export", params={"format": "parquet", "columns": "ping"}
+        )
+
+        table = ipc.open_stream(arrow_response.content).read_all()
+        assert table.num_rows == 0
+        assert table.schema.field("timestamp").type == pyarrow.timestamp("us", tz="UTC")
+        assert parquet.read_table(
+            pyarrow.BufferReader(parquet_response.content)
+        ).column_names == ["ping"]
+
+    def test_export_validation(self, test_client):
+        """Test that unknown formats, columns and inverted ranges are rejected"""
+        bad_format = test_client.get("/speed/export", params={"format": "xlsx"})
+        bad_column = test_client.get("/speed/export", params={"columns": "ping,ts"})
+        inverted = test_client.get(
+            "/speed/export",
+            params={"from": "2025-07-02T00:00:00Z", "to": "2025-07-01T00:00:00Z"},
+        )
+
+        assert bad_format.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert bad_column.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert inverted.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_stream_endpoint_sends_server_sent_events(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that /speed/stream ends with a result event"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+
+        response = test_client.get("/speed/stream")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.text.startswith("event: result\ndata: ")
+        data = json.loads(response.text.split("data: ", 1)[1])
+        assert data["result"]["download_speed"] == 50.0
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_stream_endpoint_reports_errors(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that a failing speed test ends the stream with an error event"""
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.side_effect = TimeoutError()
+
+        response = test_client.get("/speed/stream")
+
+        assert response.text.startswith("event: error\n")
+        assert "Speedtest timed out" in response.text
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_websocket_sends_result(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that the WebSocket variant sends progress as JSON messages"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+
+        with test_client.websocket_connect("/speed/ws") as websocket:
+            message = websocket.receive_json()
+
+        assert message["event"] == "result"
+        assert message["result"]["server_name"] == "Stockholm"
+
+    def test_fleet_endpoint_without_targets(self, test_client):
+        """Test that the fleet endpoint is empty when no targets are configured"""
+        response = test_client.get("/speed/fleet")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == []
+
+    def test_fleet_endpoint_lists_targets(self, test_client, monkeypatch):
+        """Test that configured fleet targets are listed before their first run"""
+        monkeypatch.setenv(
+            "NETSPEED_FLEET_TARGETS",
+            '[{"name": "wan1", "source_address": "192.0.2.10"}]',
+        )
+
+        response = test_client.get("/speed/fleet")
+
+        assert response.json() == [
+            {
+                "name": "wan1",
+                "link": "192.0.2.10",
+                "status": "pending",
+                "result": None,
+                "error": None,
+                "last_run": None,
+            }
+        ]
+
+    def test_latency_endpoint_disabled(self, test_client):
+        """Test that the latency endpoint is 404 without a probe target"""
+        response = test_client.get("/speed/latency")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_latency_endpoint_reports_probes(self, monkeypatch):
+        """Test that the lifespan probes the target and reports the result"""
+        with socket.socket() as listener:
+            listener.bind(("127.0.0.1", 0))
+            listener.listen()
+            target = f"127.0.0.1:{listener.getsockname()[1]}"
+            monkeypatch.setenv("NETSPEED_PROBE_TARGET", target)
+            monkeypatch.setenv("NETSPEED_PROBE_INTERVAL", "0.01")
+
+            with TestClient(app) as client:
+                for _ in range(100):
+                    latency = client.get("/speed/latency").json()
+                    if latency["sent"] >= 2:
+                        break
+                    time.sleep(0.01)
+
+        assert latency["target"] == target
+        assert latency["method"] == "tcp"
+        assert latency["ping"] > 0
+        assert latency["jitter"] >= 0
+        assert latency["packet_loss"] == 0.0
+
+    def test_stats_endpoint_empty(self, test_client):
+        """Test that stats are empty before any speed test"""
+        response = test_client.get("/speed/stats")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["window"] == 3600
+        assert response.json()["count"] == 0
+        assert response.json()["download_speed"] is None
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_stats_endpoint_includes_speed_tests(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that each speed test is added to the stats"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+
+        test_client.get("/speed")
+        response = test_client.get("/speed/stats?window=30d")
+
+        assert response.json()["window"] == 30 * 86400
+        assert response.json()["count"] == 1
+        assert response.json()["download_speed"]["p50"] == pytest.approx(50.0, rel=0.02)
+
+    def test_stats_endpoint_rejects_invalid_window(self, test_client):
+        """Test that malformed and too long windows are rejected"""
+        assert test_client.get("/speed/stats?window=1w").status_code == 422
+        assert test_client.get("/speed/stats?window=0").status_code == 422
+        assert test_client.get("/speed/stats?window=9999d").status_code == 422
+
+
+class TestSpeedBatchRouter:
+    """Test cases for the multi-run speed test endpoint"""
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_batch_runs_tests_in_turn(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that a batch returns medians, spreads and every run"""
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.side_effect = [
+            (
+                json.dumps(
+                    {
+                        "download": download,
+                        "upload": 25000000.0,
+                        "ping": 35.2,
+                        "server": {"name": "Stockholm", "country": "Sweden"},
+                    }
+                ).encode(),
+                b"",
+            )
+            for download in (50e6, 52e6, 48e6)
+        ]
+
+        response = test_client.post("/speed/batch?runs=3")
+
+        assert response.status_code == status.HTTP_200_OK
+        batch = response.json()
+        assert batch["download_speed"] == 50.0
+        assert batch["download_spread"]["iqr"] == 2.0
+        assert [run["download_speed"] for run in batch["runs"]] == [50, 52, 48]
+        assert batch["server_name"] == "Stockholm"
+        assert mock_create_subprocess.call_count == 3
+
+    def test_batch_size_limited(self, test_client):
+        """Test that too many runs are rejected before any test starts"""
+        response = test_client.post("/speed/batch?runs=11")
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+class TestHealthRouter:
+    """Test cases for the degradation detection endpoint"""
+
+    def test_health_learning_without_results(self, test_client):
+        """Test that the detector reports learning before any results"""
+        response = test_client.get("/speed/health")
+
+        assert response.status_code == status.HTTP_200_OK
+        health = response.json()
+        assert health["state"] == "learning"
+        assert health["download_speed"]["samples"] == 0
+        assert health["download_speed"]["baseline"] is None
+
+
+class TestAdmissionControl:
+    """Test cases for rate limiting of endpoints that run speed tests"""
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_client_over_its_rate_gets_429(
+        self, mock_wait_for, mock_create_subprocess, monkeypatch, test_client
+    ):
+        """Test that forced measurements beyond the burst answer 429"""
+        monkeypatch.setenv("NETSPEED_RATE_LIMIT_CLIENT_PER_HOUR", "6")
+        monkeypatch.setenv("NETSPEED_RATE_LIMIT_CLIENT_BURST", "2")
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+
+        assert test_client.get("/speed?max_age=0").status_code == 200
+        assert test_client.get("/speed?max_age=0").status_code == 200
+        # A cached result does not count against the client
+        assert test_client.get("/speed").status_code == 200
+        response = test_client.get("/speed?max_age=0")
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response.json()["detail"] == "Too many speedtests from this client"
+        assert 0 < int(response.headers["retry-after"]) <= 600
+        assert mock_create_subprocess.call_count == 2
+
+    def test_global_cap_gets_429(self, monkeypatch, test_client):
+        """Test that the hourly cap refuses tests with the time of the next slot"""
+        monkeypatch.setenv("NETSPEED_RATE_LIMIT_GLOBAL_PER_HOUR", "2")
+        monkeypatch.setenv("NETSPEED_RATE_LIMIT_RESERVED", "1")
+        get_admission_controller().admit_measurement()
+
+        response = test_client.get("/speed")
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response.json()["detail"] == "Hourly speedtest limit reached"
+        assert 3590 < int(response.headers["retry-after"]) <= 3600
+
+    def test_jobs_and_streams_limited_per_client(self, monkeypatch, test_client):
+        """Test that job submissions and streams share the client's bucket"""
+        monkeypatch.setenv("NETSPEED_RATE_LIMIT_CLIENT_PER_HOUR", "1")
+        job_manager = Mock()
+        job_manager.submit.return_value = SpeedJob(
+            id="1", status="queued", created_at=datetime.now(UTC)
+        )
+        app.dependency_overrides[get_job_manager] = lambda: job_manager
+        try:
+            assert test_client.post("/speed/jobs").status_code == 202
+            job_response = test_client.post("/speed/jobs")
+        finally:
+            app.dependency_overrides.clear()
+        stream_response = test_client.get("/speed/stream")
+
+        assert job_response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert stream_response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert "retry-after" in stream_response.headers
+        job_manager.submit.assert_called_once()
+
+
+class TestSpeedJobsRouter:
+    """Test cases for the asynchronous speed test job endpoints"""
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_job_lifecycle(self, mock_wait_for, mock_create_subprocess):
+        """Test that a job is accepted, run in the background and retrievable"""
+        speedtest_data = {
+            "download": 50000000.0,
+            "upload": 25000000.0,
+            "ping": 35.2,
+            "server": {"name": "Stockholm", "country": "Sweden"},
+        }
+        mock_create_subprocess.return_value = Mock()
+        mock_wait_for.return_value = (json.dumps(speedtest_data).encode(), b"")
+
+        with TestClient(app) as client:
+            response = client.post("/speed/jobs")
+            assert response.status_code == status.HTTP_202_ACCEPTED
+            job_id = response.json()["id"]
+            assert response.headers["location"] == f"/speed/jobs/{job_id}"
+
+            for _ in range(100):
+                job = client.get(f"/speed/jobs/{job_id}").json()
+                if job["status"] == "succeeded":
+                    break
+                time.sleep(0.01)
+
+        assert job["status"] == "succeeded"
+        assert job["result"]["server_name"] == "Stockholm"
+
+    @pytest.mark.anyio
+    async def test_job_submitted_on_the_event_loop(self, mock_speedtest_output):
+        """Test that a job posted while the worker waits is picked up"""
+        job_manager = get_job_manager()
+        job_manager.start()
+        submitted_from = []
+        submit = job_manager.submit
+
+        def record_thread(*args):
+            # The queue and job tables belong to the loop's thread
+            submitted_from.append(threading.current_thread())
+            return submit(*args)
+
+        job_manager.submit = record_thread
+        app.dependency_overrides[get_job_manager] = lambda: job_manager
+        transport = httpx.ASGITransport(app=app)
+        try:
+            with patch(
+                "src.repositories.requester.RequestRepository.get_speedtest_results",
+                AsyncMock(return_value=mock_speedtest_output),
+            ):
+                async with httpx.AsyncClient(
+                    transport=transport, base_url="http://test"
+                ) as client:
+                    # Lets the worker block on its empty queue first
+                    await asyncio.sleep(0.01)
+                    response = await client.post("/speed/jobs")
+                    assert response.status_code == status.HTTP_202_ACCEPTED
+                    job_id = response.json()["id"]
+                    for _ in range(200):
+                        job = (await client.get(f"/speed/jobs/{job_id}")).json()
+                        if job["status"] == "succeeded":
+                            break
+                        await asyncio.sleep(0.01)
+        finally:
+            app.dependency_overrides.clear()
+            await job_manager.stop()
+
+        assert submitted_from == [threading.current_thread()]
+        assert job["status"] == "succeeded"
+        assert job["result"]["server_name"] == "Riga"
+
+    def test_unknown_job(self, test_client):
+        """Test that an unknown job id returns 404"""
+        response = test_client.get("/speed/jobs/does-not-exist")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert response.json()["detail"] == "Job not found"
+
+    @pytest.mark.anyio
+    async def test_pending_job_returned_to_later_posts(self, mock_speedtest_output):
+        """Test that posting while a job is pending returns that job"""
+        job_manager = get_job_manager()
+        job_manager.start()
+        app.dependency_overrides[get_job_manager] = lambda: job_manager
+        release = asyncio.Event()
+
+        async def speedtest():
+            await release.wait()
+            return mock_speedtest_output
+
+        try:
+            with patch(
+                "src.repositories.requester.RequestRepository.get_speedtest_results",
+                side_effect=speedtest,
+            ):
+                async with httpx.AsyncClient(
+                    transport=httpx.ASGITransport(app=app), base_url="http://test"
+                ) as client:
+                    first = (await client.post("/speed/jobs")).json()
+                    second = await client.post("/speed/jobs")
+                    release.set()
+                    await asyncio.sleep(0.01)
+                    third = (await client.post("/speed/jobs")).json()
+        finally:
+            app.dependency_overrides.clear()
+            await job_manager.stop()
+
+        assert second.status_code == status.HTTP_202_ACCEPTED
+        assert second.json()["id"] == first["id"]
+        assert third["id"] != first["id"]
+
+
+class TestMetricsRouter:
+    """Test cases for the Prometheus metrics endpoint"""
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_metrics_after_speedtest(
+        self, mock_wait_for, mock_create_subprocess, test_client, mock_speedtest_output
+    ):
+        """Test that a speedtest updates the stage histograms and last-result gauges"""
+        mock_wait_for.return_value = (json.dumps(mock_speedtest_output).encode(), b"")
+        mock_create_subprocess.return_value = Mock()
+
+        test_client.get("/speed")
+        response = test_client.get("/metrics")
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/plain")
+        lines = response.text.splitlines()
+        assert "# TYPE netspeed_speedtest_run_seconds histogram" in lines
+        for stage in ("spawn", "run", "decode", "validate"):
+            assert any(
+                line.startswith(f"netspeed_speedtest_{stage}_seconds_count ")
+                and not line.endswith(" 0")
+                for line in lines
+            )
+        assert "netspeed_last_download_mbps 99.48" in lines
+        assert "netspeed_speedtest_executions_total 1.0" in lines
+        assert "netspeed_speedtest_in_flight 0.0" in lines
+
+    @patch("src.repositories.requester.asyncio.create_subprocess_exec")
+    @patch("src.repositories.requester.asyncio.wait_for")
+    def test_metrics_count_failures_by_reason(
+        self, mock_wait_for, mock_create_subprocess, test_client
+    ):
+        """Test that failed speedtests are counted by reason"""
+        mock_wait_for.side_effect = TimeoutError()
+        mock_create_subprocess.return_value = Mock()
+
+        before = test_client.get("/metrics").text
+        test_client.get("/speed")
+        after = test_client.get("/metrics").text
+
+        def timeouts(text):
+            prefix = 'netspeed_speedtest_failures_total{reason="timeout"} '
+            line = next(line for line in text.splitlines() if line.startswith(prefix))
+            return float(line.removeprefix(prefix))
+
+        assert timeouts(after) == timeouts(before) + 1
+
+
+class TestSitesRouter:
+    """Test cases for the coordinator endpoints"""
+
+    @staticmethod
+    def batch(site, *speeds):
+        return {
+            "site": site,
+            "measurements": [
+                {
+                    "download_speed": speed,
+                    "upload_speed": 50.0,
+                    "ping": 10.0,
+                    "server_name": "Riga",
+                    "server_location": "Latvia",
+                    "timestamp": f"2025-07-15T17:0{i}:00Z",
+                }
+                for i, speed in enumerate(speeds)
+            ],
+        }
+
+    def test_ingest_disabled_by_default(self, test_client):
+        """Test that instances only accept batches in coordinator mode"""
+        response = test_client.post(
+            "/speed/sites/ingest", json=self.batch("riga", 100.0, 200.0)
+        )
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_ingest_requires_token(self, test_client, monkeypatch):
+        """Test that a configured token is enforced"""
+        monkeypatch.setenv("NETSPEED_COORDINATOR", "true")
+        monkeypatch.setenv("NETSPEED_COORDINATOR_TOKEN", "secret")
+
+        response = test_client.post(
+            "/speed/sites/ingest",
+            json=self.batch("riga", 100.0),
+            headers={"Authorization": "Bearer wrong"},
+        )
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_gzip_batches_are_merged_across_sites(self, test_client, monkeypatch):
+        """Test ingesting gzip batches and querying them per site and merged"""
+        monkeypatch.setenv("NETSPEED_COORDINATOR", "true")
+        for batch in (self.batch("riga", 100.0, 120.0), self.batch("tallinn", 200.0)):
+            response = test_client.post(
+                "/speed/sites/ingest",
+                content=gzip.compress(json.dumps(batch).encode()),
+                headers={
+                    "Content-Type": "application/json",
+                    "Content-Encoding": "gzip",
+                },
+            )
+            assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"accepted": 1}
+
+        range_params = {"from": "2025-07-15T17:00:00Z", "to": "2025-07-15T18:00:00Z"}
+        merged = test_client.get("/speed/sites/history", params=range_params)
+        riga = test_client.get(
+            "/speed/sites/history", params={**range_params, "site": "riga"}
+        )
+        sites = test_client.get("/speed/sites")
+
+        assert merged.json()["buckets"][0]["count"] == 3
+        assert merged.json()["buckets"][0]["download_speed"]["max"] == 200.0
+        assert riga.json()["buckets"][0]["count"] == 2
+        assert [site["site"] for site in sites.json()] == ["riga", "tallinn"]
+
+    def test_ingest_rejects_bad_bodies(self, test_client, monkeypatch):
+        """Test that corrupt gzip and invalid batches are rejected"""
+        monkeypatch.setenv("NETSPEED_COORDINATOR", "true")
+
+        corrupt = test_client.post(
+            "/speed/sites/ingest",
+            content=b"not gzip",
+            headers={"Content-Encoding": "gzip"},
+        )
+        invalid = test_client.post("/speed/sites/ingest", json={"site": "riga"})
+
+        assert corrupt.status_code == status.HTTP_400_BAD_REQUEST
+        assert invalid.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_ingest_rejects_oversized_plain_body(self, test_client, monkeypatch):
+        """Test that an uncompressed push above the batch limit gets a 413"""
+        monkeypatch.setenv("NETSPEED_COORDINATOR", "true")
+        monkeypatch.setattr("src.routers.speed.MAX_BATCH_BYTES", 64)
+
+        response = test_client.post(
+            "/speed/sites/ingest", json=self.batch("riga", 100.0, 200.0)
+        )
+
+        assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
@@ -0,0 +1,78 @@
+import random
+import statistics
+
+import pytest
+
+from src.running_stats import RollingMean, RunningStats
+
+
+class TestRunningStats:
+    """Test cases for Welford's running mean and variance"""
+
+    def test_matches_statistics_module(self):
+        """Test that mean and variance match a two-pass computation"""
+        rng = random.Random(7)
+        values = [rng.gauss(940e6, 20e6) for _ in range(500)]
+        stats = RunningStats()
+        for value in values:
+            stats.add(value)
+
+        assert stats.count == 500
+        assert stats.mean == pytest.approx(statistics.fmean(values))
+        assert stats.variance == pytest.approx(statistics.variance(values))
+
+    def test_margin_needs_two_values(self):
+        """Test that no margin is given before the spread is known"""
+        stats = RunningStats()
+        assert stats.margin() is None
+        stats.add(100.0)
+        assert stats.margin() is None
+
+    def test_margin_is_relative_half_width(self):
+        """Test the 95% interval half-width relative to the mean"""
+        stats = RunningStats()
+        for value in (90.0, 110.0, 90.0, 110.0):
+            stats.add(value)
+
+        # stdev 11.547, standard error 5.774, times 1.96, over mean 100
+        assert stats.margin() == pytest.approx(0.11316, rel=1e-3)
+
+    def test_margin_shrinks_with_more_samples(self):
+        """Test that more samples of the same spread narrow the interval"""
+        few, many = RunningStats(), RunningStats()
+        for _ in range(2):
+            few.add(90.0)
+            few.add(110.0)
+        for _ in range(50):
+            many.add(90.0)
+            many.add(110.0)
+
+        assert many.margin() < few.margin()
+
+
+class TestRollingMean:
+    """Test cases for the windowed running mean"""
+
+    def test_empty_window(self):
+        """Test that an empty window has no mean"""
+        assert RollingMean(3).mean is None
+
+    def test_mean_of_last_values(self):
+        """Test that only the last size values are averaged"""
+        rolling = RollingMean(3)
+        for value in (10.0, 20.0, 30.0, 40.0, 50.0):
+            rolling.add(value)
+
+        assert rolling.count == 3
+        assert rolling.mean == pytest.approx(40.0)
+
+    def test_no_drift_over_long_runs(self):
+        """Test that the running sum stays exact over many updates"""
+        rng = random.Random(3)
+        rolling = RollingMean(10)
+        for _ in range(100_000):
+            rolling.add(rng.uniform(0, 1e9))
+        for value in range(10):
+            rolling.add(value * 0.1)
+
+        assert rolling.mean == pytest.approx(0.45, abs=1e-9)
@@ -1,7 +1,35 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import UTC, datetime
+from unittest.mock import AsyncMock, Mock
+
+import httpx
 import pytest
 
-from src.models.speedresponse import SpeedResponse
-from src.services.get_speed import SpeedService
+from src.main import app
+from src.models.fleet import FleetTarget
+from src.models.speedresponse import SpeedMeasurement, SpeedResponse
+from src.repositories.coordinator import CoordinatorRepository
+from src.repositories.history import HistoryRepository
+from src.repositories.probe import ProbeError, ProbeRepository
+from src.repositories.shared import SharedResultStore
+from src.repositories.spool import SpoolRepository
+from src.repositories.webhook import WebhookRepository
+from src.services.admission import AdmissionController, RateLimitedError
+from src.services.agent import AgentService
+from src.services.fleet import FleetService
+from src.services.get_speed import SpeedService, spread
+from src.services.health import HealthMonitor
+from src.services.history import HistoryService
+from src.services.jobs import JobManager
+from src.services.link_lock import LinkLock
+from src.services.loop_monitor import LoopLagMonitor
+from src.services.probe import LatencyProbe
+from src.services.result_cache import ResultCache
+from src.services.scheduler import SpeedtestScheduler
+from src.services.single_flight import SingleFlight
+from src.services.stats import TIERS, SpeedStats
 
 
 class TestSpeedService:
@@ -53,6 +81,24 @@ class TestSpeedService:
         assert result.server_name == "Stockholm"
         assert result.server_location == "Sweden"
 
+    @pytest.mark.anyio
+    async def test_get_speedtest_results_keeps_margins(
+        self, speed_service, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that jitter and throughput confidence margins are passed through"""
+        mock_request_repository.get_speedtest_results.return_value = {
+            **mock_speedtest_output,
+            "jitter": 1.25,
+            "download_margin": 0.031234,
+            "upload_margin": 0.0456789,
+        }
+
+        result = await speed_service.get_speedtest_results()
+
+        assert result.jitter == 1.25
+        assert result.download_margin == 0.0312
+        assert result.upload_margin == 0.0457
+
     @pytest.mark.anyio
     async def test_get_speedtest_results_missing_bandwidth_key(
         self, speed_service, mock_request_repository
@@ -115,3 +161,1440 @@ class TestSpeedService:
         assert result.download_speed == 0.0
         assert result.upload_speed == 0.0
         assert result.ping == 0.0
+
+
+class TestSingleFlight:
+    """Test cases for SingleFlight call coalescing"""
+
+    @pytest.mark.anyio
+    async def test_concurrent_calls_share_one_execution(self):
+        """Test that callers arriving while a call is running share its result"""
+        single_flight = SingleFlight()
+        release = asyncio.Event()
+        calls = 0
+
+        async def measure():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "result"
+
+        waiters = [
+            asyncio.create_task(single_flight.do("key", measure)) for _ in range(5)
+        ]
+        await asyncio.sleep(0)
+        assert single_flight.in_flight == 1
+        release.set()
+        results = await asyncio.gather(*waiters)
+
+        assert results == ["result"] * 5
+        assert calls == 1
+        assert single_flight.executions == 1
+        assert single_flight.coalesced == 4
+        assert single_flight.in_flight == 0
+
+    @pytest.mark.anyio
+    async def test_sequential_calls_execute_separately(self):
+        """Test that a finished call is not reused by later callers"""
+        single_flight = SingleFlight()
+
+        async def measure():
+            return "result"
+
+        await single_flight.do("key", measure)
+        await single_flight.do("key", measure)
+
+        assert single_flight.executions == 2
+        assert single_flight.coalesced == 0
+
+    @pytest.mark.anyio
+    async def test_different_keys_are_independent(self):
+        """Test that calls with different keys are not coalesced"""
+        single_flight = SingleFlight()
+
+        async def measure():
+            await asyncio.sleep(0)
+            return "result"
+
+        await asyncio.gather(
+            single_flight.do("a", measure), single_flight.do("b", measure)
+        )
+
+        assert single_flight.executions == 2
+        assert single_flight.coalesced == 0
+
+    @pytest.mark.anyio
+    async def test_exception_is_shared_and_cleared(self):
+        """Test that a failure reaches every waiter and is not cached"""
+        single_flight = SingleFlight()
+
+        async def measure():
+            await asyncio.sleep(0)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(
+            single_flight.do("key", measure),
+            single_flight.do("key", measure),
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert single_flight.in_flight == 0
+
+    @pytest.mark.anyio
+    async def test_cancelled_caller_does_not_cancel_shared_call(self):
+        """Test that one caller going away leaves the call running for others"""
+        single_flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def measure():
+            await release.wait()
+            return "result"
+
+        first = asyncio.create_task(single_flight.do("key", measure))
+        second = asyncio.create_task(single_flight.do("key", measure))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+
+        assert await second == "result"
+
+    @pytest.mark.anyio
+    async def test_speed_service_coalesces_concurrent_requests(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that concurrent service calls run the repository once"""
+
+        async def slow_speedtest():
+            await asyncio.sleep(0.01)
+            return mock_speedtest_output
+
+        mock_request_repository.get_speedtest_results.side_effect = slow_speedtest
+        single_flight = SingleFlight()
+        services = [
+            SpeedService(mock_request_repository, single_flight) for _ in range(3)
+        ]
+
+        results = await asyncio.gather(
+            *(service.get_speedtest_results() for service in services)
+        )
+
+        assert all(result == results[0] for result in results)
+        mock_request_repository.get_speedtest_results.assert_called_once()
+        assert single_flight.coalesced == 2
+
+
+class TestResultCaching:
+    """Test cases for SpeedService with a ResultCache"""
+
+    @pytest.mark.anyio
+    async def test_fresh_result_served_from_cache(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that a result younger than the TTL does not trigger a speedtest"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        service = SpeedService(
+            mock_request_repository, result_cache=ResultCache(ttl=60)
+        )
+
+        first = await service.get_speedtest_results()
+        second = await service.get_speedtest_results()
+
+        assert second is first
+        mock_request_repository.get_speedtest_results.assert_called_once()
+
+    @pytest.mark.anyio
+    async def test_max_age_zero_forces_measurement(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that max_age=0 always runs a new speedtest"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        service = SpeedService(
+            mock_request_repository, result_cache=ResultCache(ttl=60, stale_ttl=60)
+        )
+
+        await service.get_speedtest_results()
+        await service.get_speedtest_results(max_age=0)
+
+        assert mock_request_repository.get_speedtest_results.call_count == 2
+
+    @pytest.mark.anyio
+    async def test_stale_result_served_while_revalidating(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that an expired result is returned and refreshed in background"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        cache = ResultCache(ttl=0, stale_ttl=60)
+        service = SpeedService(mock_request_repository, result_cache=cache)
+        first = await service.get_speedtest_results()
+
+        stale = await service.get_speedtest_results()
+        assert stale is first
+        assert mock_request_repository.get_speedtest_results.call_count == 1
+
+        await asyncio.sleep(0.01)
+        assert mock_request_repository.get_speedtest_results.call_count == 2
+        assert cache.latest is not first
+
+    @pytest.mark.anyio
+    async def test_stale_hits_start_one_refresh(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that stale hits during a refresh do not queue more refreshes"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        single_flight = SingleFlight()
+        service = SpeedService(
+            mock_request_repository,
+            single_flight,
+            result_cache=ResultCache(ttl=0, stale_ttl=60),
+        )
+        first = await service.get_speedtest_results()
+
+        stale = [await service.get_speedtest_results() for _ in range(5)]
+        await asyncio.sleep(0.01)
+
+        assert stale == [first] * 5
+        assert mock_request_repository.get_speedtest_results.call_count == 2
+        assert single_flight.executions == 2
+        assert single_flight.coalesced == 0
+
+    @pytest.mark.anyio
+    async def test_expired_result_blocks_for_measurement(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that a result past the stale window is not served"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        service = SpeedService(
+            mock_request_repository, result_cache=ResultCache(ttl=0, stale_ttl=0)
+        )
+
+        first = await service.get_speedtest_results()
+        second = await service.get_speedtest_results()
+
+        assert second is not first
+        assert mock_request_repository.get_speedtest_results.call_count == 2
+
+    @pytest.mark.anyio
+    async def test_failed_refresh_keeps_stale_result(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that a failing background refresh leaves the cache intact"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        cache = ResultCache(ttl=0, stale_ttl=60)
+        service = SpeedService(mock_request_repository, result_cache=cache)
+        first = await service.get_speedtest_results()
+        mock_request_repository.get_speedtest_results.side_effect = Exception(
+            "Network error"
+        )
+
+        assert await service.get_speedtest_results() is first
+        await asyncio.sleep(0.01)
+        assert cache.latest is first
+
+    @pytest.mark.anyio
+    async def test_result_has_timestamp(
+        self, speed_service, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that measurements are stamped with the time they completed"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+
+        result = await speed_service.get_speedtest_results()
+
+        assert isinstance(result, SpeedMeasurement)
+        assert result.timestamp.tzinfo is not None
+
+    def test_result_encoded_once_when_stored(self, make_measurement):
+        """Test that the stored result's body and ETag are reused"""
+        cache = ResultCache(ttl=60)
+        measurement = make_measurement(1_752_601_791.5)
+        cache.store(measurement)
+
+        encoded = cache.encode(measurement)
+
+        assert encoded is cache.encoded
+        assert encoded.body == measurement.model_dump_json().encode()
+        assert encoded.last_modified == "Tue, 15 Jul 2025 17:49:51 GMT"
+        other = cache.encode(make_measurement(1_752_601_791.5, ping=11.0))
+        assert other is not encoded
+        assert other.etag != encoded.etag
+
+    @pytest.mark.anyio
+    async def test_result_shared_between_workers(
+        self, tmp_path, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that a result measured by one worker is served by another"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        path = str(tmp_path / "shared")
+        worker = SpeedService(
+            mock_request_repository,
+            result_cache=ResultCache(ttl=60, shared=SharedResultStore(path)),
+        )
+        other_cache = ResultCache(ttl=60, shared=SharedResultStore(path))
+        other_worker = SpeedService(mock_request_repository, result_cache=other_cache)
+
+        measured = await worker.get_speedtest_results()
+        served = await other_worker.get_speedtest_results()
+
+        assert served == measured
+        assert other_cache.encoded == worker.result_cache.encoded
+        mock_request_repository.get_speedtest_results.assert_called_once()
+
+    @pytest.mark.anyio
+    async def test_concurrent_workers_measure_once(
+        self, tmp_path, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that workers asking at once wait for a single measurement"""
+
+        async def slow_speedtest():
+            await asyncio.sleep(0.05)
+            return mock_speedtest_output
+
+        mock_request_repository.get_speedtest_results.side_effect = slow_speedtest
+        path = str(tmp_path / "shared")
+        stores = [SharedResultStore(path) for _ in range(3)]
+        workers = [
+            SpeedService(
+                mock_request_repository,
+                result_cache=ResultCache(ttl=60, shared=store),
+                link_lock=LinkLock(store),
+            )
+            for store in stores
+        ]
+
+        results = await asyncio.gather(*(w.measure() for w in workers))
+
+        assert results[1] == results[0] == results[2]
+        mock_request_repository.get_speedtest_results.assert_called_once()
+
+
+class TestAdmissionController:
+    """Test cases for AdmissionController"""
+
+    def test_client_bucket_refills(self):
+        """Test that a client gets its burst, then one test per refill period"""
+        now = [0.0]
+        admission = AdmissionController(
+            client_rate=6, client_burst=2, clock=lambda: now[0]
+        )
+        admission.admit_client("a")
+        admission.admit_client("a")
+
+        with pytest.raises(RateLimitedError) as refused:
+            admission.admit_client("a")
+        assert refused.value.retry_after == pytest.approx(600)
+        admission.admit_client("b")
+
+        now[0] = 600
+        admission.admit_client("a")
+
+    def test_idle_and_excess_clients_forgotten(self):
+        """Test that clients are dropped once refilled or over max_clients"""
+        now = [0.0]
+        admission = AdmissionController(
+            client_rate=60, client_burst=1, max_clients=2, clock=lambda: now[0]
+        )
+        for client in ("a", "b", "c"):
+            admission.admit_client(client)
+        assert admission.tracked_clients == 2
+
+        now[0] = 61
+        admission.admit_client("d")
+        assert admission.tracked_clients == 1
+        admission.admit_client("a")
+
+    def test_global_cap_keeps_reserve_for_scheduled_runs(self):
+        """Test that users stop short of the cap while scheduled runs reach it"""
+        now = [0.0]
+        admission = AdmissionController(
+            global_limit=2, reserved=1, clock=lambda: now[0]
+        )
+        admission.admit_measurement("user")
+        now[0] = 100
+
+        with pytest.raises(RateLimitedError) as refused:
+            admission.admit_measurement("user")
+        assert refused.value.retry_after == pytest.approx(3500)
+        admission.admit_measurement("scheduled")
+        with pytest.raises(RateLimitedError):
+            admission.admit_measurement("scheduled")
+
+        now[0] = 3700
+        admission.admit_measurement("user")
+
+    @pytest.mark.anyio
+    async def test_coalesced_callers_start_one_test(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that the global cap counts speedtests, not callers sharing one"""
+
+        async def slow_speedtest():
+            await asyncio.sleep(0.01)
+            return mock_speedtest_output
+
+        mock_request_repository.get_speedtest_results.side_effect = slow_speedtest
+        admission = AdmissionController(global_limit=1)
+        service = SpeedService(mock_request_repository, admission=admission)
+
+        await asyncio.gather(*(service.measure() for _ in range(3)))
+
+        with pytest.raises(RateLimitedError):
+            await service.measure()
+        mock_request_repository.get_speedtest_results.assert_called_once()
+
+
+class TestSpeedtestScheduler:
+    """Test cases for SpeedtestScheduler"""
+
+    @pytest.mark.anyio
+    async def test_run_once_stores_result(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that a scheduled run stores its result in the cache"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        cache = ResultCache(ttl=60)
+        scheduler = SpeedtestScheduler(
+            lambda: SpeedService(mock_request_repository, result_cache=cache),
+            interval=60,
+        )
+
+        await scheduler.run_once()
+
+        assert cache.latest is not None
+        assert cache.latest.server_name == "Riga"
+        assert scheduler.runs == 1
+        assert scheduler.failures == 0
+
+    @pytest.mark.anyio
+    async def test_one_worker_schedules(
+        self, tmp_path, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that workers sharing a store measure once per tick, not each"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        path = str(tmp_path / "shared")
+        stores = [SharedResultStore(path) for _ in range(2)]
+        schedulers = [
+            SpeedtestScheduler(
+                lambda store=store: SpeedService(
+                    mock_request_repository,
+                    result_cache=ResultCache(ttl=60, shared=store),
+                    link_lock=LinkLock(store),
+                ),
+                interval=60,
+                shared=store,
+            )
+            for store in stores
+        ]
+
+        for _ in range(2):
+            for scheduler in schedulers:
+                await scheduler.run_once()
+        assert [s.runs for s in schedulers] == [2, 0]
+        assert schedulers[1].skipped == 2
+
+        # The leader exiting hands the role to the next worker that ticks
+        stores[0].close()
+        await schedulers[1].run_once()
+
+        assert schedulers[1].runs == 1
+        assert mock_request_repository.get_speedtest_results.call_count == 3
+
+    @pytest.mark.anyio
+    async def test_run_once_swallows_failures(self, mock_request_repository):
+        """Test that a failing run is counted and does not stop the scheduler"""
+        mock_request_repository.get_speedtest_results.side_effect = Exception(
+            "Network error"
+        )
+        scheduler = SpeedtestScheduler(
+            lambda: SpeedService(mock_request_repository), interval=60
+        )
+
+        await scheduler.run_once()
+
+        assert scheduler.failures == 1
+
+    @pytest.mark.anyio
+    async def test_start_runs_on_interval_until_stopped(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that the scheduler keeps measuring until it is stopped"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        scheduler = SpeedtestScheduler(
+            lambda: SpeedService(mock_request_repository), interval=0.01
+        )
+
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+        runs = scheduler.runs
+        await asyncio.sleep(0.02)
+
+        assert runs >= 2
+        assert scheduler.runs == runs
+
+    def test_next_delay_within_jitter(self, mock_request_repository):
+        """Test that jitter keeps the delay within interval +/- jitter"""
+        scheduler = SpeedtestScheduler(
+            lambda: SpeedService(mock_request_repository), interval=10, jitter=2
+        )
+
+        delays = [scheduler.next_delay() for _ in range(100)]
+
+        assert all(8 <= delay <= 12 for delay in delays)
+
+    def test_next_delay_never_negative(self, mock_request_repository):
+        """Test that a jitter larger than the interval does not go negative"""
+        scheduler = SpeedtestScheduler(
+            lambda: SpeedService(mock_request_repository), interval=1, jitter=5
+        )
+
+        assert all(scheduler.next_delay() >= 0 for _ in range(100))
+
+
+class TestHistoryService:
+    """Test cases for HistoryService and measurement sinks"""
+
+    @pytest.mark.anyio
+    async def test_record_and_get_history(self, make_measurement):
+        """Test that recorded measurements are summarised per bucket"""
+        service = HistoryService(HistoryRepository())
+        await service.record(make_measurement(0, download_speed=100.0))
+        await service.record(make_measurement(60, download_speed=300.0))
+
+        history = await service.get_history(
+            datetime.fromtimestamp(0, UTC), datetime.fromtimestamp(3600, UTC), 3600
+        )
+
+        assert len(history.buckets) == 1
+        bucket = history.buckets[0]
+        assert bucket.count == 2
+        assert bucket.start == datetime.fromtimestamp(0, UTC)
+        assert bucket.download_speed.min == 100.0
+        assert bucket.download_speed.avg == 200.0
+        assert bucket.download_speed.max == 300.0
+        assert 100.0 <= bucket.download_speed.p50 <= 300.0
+
+    @pytest.mark.anyio
+    async def test_speed_service_records_to_sinks(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that every measurement is handed to the configured sinks"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        history_repository = HistoryRepository()
+        service = SpeedService(
+            mock_request_repository, sinks=[HistoryService(history_repository)]
+        )
+
+        result = await service.get_speedtest_results()
+
+        ts = result.timestamp.timestamp()
+        buckets = history_repository.query(ts - 60, ts + 60, 60)
+        assert buckets[0][1]["download_speed"].max == result.download_speed
+
+    @pytest.mark.anyio
+    async def test_failing_sink_does_not_fail_measurement(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that a sink error is logged rather than raised"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        sink = Mock()
+        sink.record = AsyncMock(side_effect=Exception("disk full"))
+        service = SpeedService(mock_request_repository, sinks=[sink])
+
+        result = await service.get_speedtest_results()
+
+        assert result.server_name == "Riga"
+        sink.record.assert_awaited_once_with(result)
+
+
+class TestSpeedStreaming:
+    """Test cases for SpeedService.stream_speedtest_results"""
+
+    @pytest.mark.anyio
+    async def test_stream_without_progress_ends_with_result(
+        self, speed_service, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that a non-streaming repository still yields the final result"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+
+        events = [event async for event in speed_service.stream_speedtest_results()]
+
+        assert [event.event for event in events] == ["result"]
+        assert events[0].result.server_name == "Riga"
+
+    @pytest.mark.anyio
+    async def test_stream_sends_heartbeats(
+        self, speed_service, mock_request_repository, mock_speedtest_output, monkeypatch
+    ):
+        """Test that keep-alive progress is sent while waiting for a result"""
+        monkeypatch.setattr("src.services.get_speed.HEARTBEAT_INTERVAL", 0.01)
+
+        async def slow_speedtest():
+            await asyncio.sleep(0.05)
+            return mock_speedtest_output
+
+        mock_request_repository.get_speedtest_results.side_effect = slow_speedtest
+
+        events = [event async for event in speed_service.stream_speedtest_results()]
+
+        heartbeats = [event for event in events if event.event == "progress"]
+        assert len(heartbeats) >= 2
+        assert all(event.elapsed > 0 for event in heartbeats)
+        assert events[-1].event == "result"
+
+    @pytest.mark.anyio
+    async def test_stream_converts_repository_progress(self, mock_speedtest_output):
+        """Test that streamed repository events are converted to Mbps"""
+
+        class StreamingRepository:
+            async def get_speedtest_results(self):
+                return mock_speedtest_output
+
+            async def stream_speedtest_results(self):
+                yield {"event": "phase", "phase": "download"}
+                yield {
+                    "event": "progress",
+                    "phase": "download",
+                    "bits_per_second": 12_345_678,
+                    "elapsed": 0.5,
+                }
+                yield {"event": "result", "results": mock_speedtest_output}
+
+        cache = ResultCache(ttl=60)
+        service = SpeedService(StreamingRepository(), result_cache=cache)
+
+        events = [event async for event in service.stream_speedtest_results()]
+
+        assert [event.event for event in events] == ["phase", "progress", "result"]
+        assert events[1].speed == 12.35
+        assert cache.latest is events[-1].result
+
+    @pytest.mark.anyio
+    async def test_concurrent_request_coalesces_onto_stream(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that /speed callers share a measurement started by a stream"""
+
+        async def slow_speedtest():
+            await asyncio.sleep(0.02)
+            return mock_speedtest_output
+
+        mock_request_repository.get_speedtest_results.side_effect = slow_speedtest
+        single_flight = SingleFlight()
+        service = SpeedService(mock_request_repository, single_flight)
+
+        async def consume():
+            return [event async for event in service.stream_speedtest_results()]
+
+        stream = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        result = await service.get_speedtest_results()
+        events = await stream
+
+        assert events[-1].result is result
+        mock_request_repository.get_speedtest_results.assert_called_once()
+
+    @pytest.mark.anyio
+    async def test_stream_raises_measurement_errors(
+        self, speed_service, mock_request_repository
+    ):
+        """Test that a failed measurement surfaces to the stream consumer"""
+        mock_request_repository.get_speedtest_results.side_effect = Exception(
+            "Network error"
+        )
+
+        with pytest.raises(Exception, match="Network error"):
+            async for _ in speed_service.stream_speedtest_results():
+                pass
+
+
+class TestJobManager:
+    """Test cases for JobManager"""
+
+    @pytest.mark.anyio
+    async def test_job_runs_and_succeeds(self, make_measurement):
+        """Test that a submitted job is run by the worker"""
+        manager = JobManager()
+        manager.start()
+        measurement = make_measurement(0)
+
+        async def run():
+            return measurement
+
+        job = manager.submit("speedtest", run)
+        assert job.status == "queued"
+        await asyncio.sleep(0.01)
+        await manager.stop()
+
+        assert manager.get(job.id).status == "succeeded"
+        assert manager.get(job.id).result == measurement
+        assert job.finished_at >= job.started_at >= job.created_at
+
+    @pytest.mark.anyio
+    async def test_job_polled_from_another_worker(self, tmp_path, make_measurement):
+        """Test that a job is seen by every worker sharing a store"""
+        path = str(tmp_path / "shared")
+        manager = JobManager(shared=SharedResultStore(path))
+        other = JobManager(shared=SharedResultStore(path))
+        manager.start()
+        release = asyncio.Event()
+        measurement = make_measurement(0)
+
+        async def run():
+            await release.wait()
+            return measurement
+
+        job = manager.submit("speedtest", run)
+        await asyncio.sleep(0)
+        assert other.get(job.id).status == "running"
+        release.set()
+        await asyncio.sleep(0.01)
+        await manager.stop()
+
+        polled = other.get(job.id)
+        assert polled.status == "succeeded"
+        assert polled.result == measurement
+        assert other.get("0" * 32) is None
+        assert other.get("../shared") is None
+
+    @pytest.mark.anyio
+    async def test_duplicate_submission_returns_active_job(self, make_measurement):
+        """Test that submitting while a job is running returns that job"""
+        manager = JobManager()
+        manager.start()
+        release = asyncio.Event()
+        runs = 0
+
+        async def run():
+            nonlocal runs
+            runs += 1
+            await release.wait()
+            return make_measurement(0)
+
+        first = manager.submit("speedtest", run)
+        await asyncio.sleep(0)
+        second = manager.submit("speedtest", run)
+        release.set()
+        await asyncio.sleep(0.01)
+        third = manager.submit("speedtest", run)
+        await asyncio.sleep(0.01)
+        await manager.stop()
+
+        assert second is first
+        assert third is not first
+        assert runs == 2
+
+    @pytest.mark.anyio
+    async def test_failed_job_records_error(self):
+        """Test that a failing job is marked failed with its error"""
+        manager = JobManager()
+        manager.start()
+
+        async def run():
+            raise Exception("Speedtest timed out")
+
+        job = manager.submit("speedtest", run)
+        await asyncio.sleep(0.01)
+        await manager.stop()
+
+        assert job.status == "failed"
+        assert job.error == "Speedtest timed out"
+
+    @pytest.mark.anyio
+    async def test_finished_jobs_are_evicted_lru(self, make_measurement):
+        """Test that only max_retained jobs are kept, least recently used first"""
+        manager = JobManager(max_retained=2)
+        manager.start()
+
+        async def run():
+            return make_measurement(0)
+
+        jobs = []
+        for key in ("a", "b", "c"):
+            jobs.append(manager.submit(key, run))
+            await asyncio.sleep(0.01)
+            if key == "b":
+                manager.get(jobs[0].id)
+        await manager.stop()
+
+        assert manager.get(jobs[0].id) is not None
+        assert manager.get(jobs[1].id) is None
+        assert manager.get(jobs[2].id) is not None
+
+
+class FakeLinkRepository:
+    """Repository that records how many tests run at once per link"""
+
+    def __init__(self, link, active, peaks, output, delay=0.02):
+        self.link = link
+        self.active = active
+        self.peaks = peaks
+        self.output = output
+        self.delay = delay
+
+    async def get_speedtest_results(self):
+        self.active[self.link] += 1
+        self.active["total"] += 1
+        for key in (self.link, "total"):
+            self.peaks[key] = max(self.peaks[key], self.active[key])
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active[self.link] -= 1
+            self.active["total"] -= 1
+        return self.output
+
+
+class TestFleetService:
+    """Test cases for FleetService"""
+
+    @staticmethod
+    def make_fleet(targets, output, concurrency, delays=None, timeout=120.0):
+        active, peaks = Counter(), Counter()
+        delays = delays or {}
+
+        def factory(target):
+            return FakeLinkRepository(
+                target.link, active, peaks, output, delays.get(target.name, 0.02)
+            )
+
+        fleet = FleetService(targets, factory, concurrency, timeout=timeout)
+        return fleet, peaks
+
+    @pytest.mark.anyio
+    async def test_targets_on_one_link_never_overlap(self, mock_speedtest_output):
+        """Test that targets sharing a link run one after another"""
+        targets = [
+            FleetTarget(name="a", source_address="192.0.2.1", server_id="1"),
+            FleetTarget(name="b", source_address="192.0.2.1", server_id="2"),
+            FleetTarget(name="c", source_address="192.0.2.2"),
+        ]
+        fleet, peaks = self.make_fleet(targets, mock_speedtest_output, 3)
+
+        await asyncio.gather(*(fleet.run_target(target) for target in targets))
+
+        assert peaks["192.0.2.1"] == 1
+        assert peaks["total"] == 2
+        assert [status.status for status in fleet.statuses()] == ["succeeded"] * 3
+
+    @pytest.mark.anyio
+    async def test_default_link_excludes_speed_service(self, mock_speedtest_output):
+        """Test that a target on the default link waits for /speed tests"""
+        active, peaks = Counter(), Counter()
+        link_lock = LinkLock()
+        target = FleetTarget(name="wan", server_id="1")
+        fleet = FleetService(
+            [target],
+            lambda target: FakeLinkRepository(
+                target.link, active, peaks, mock_speedtest_output
+            ),
+            link_lock=link_lock,
+        )
+        service = SpeedService(
+            FakeLinkRepository("default", active, peaks, mock_speedtest_output),
+            link_lock=link_lock,
+        )
+
+        await asyncio.gather(service.measure(), fleet.run_target(target))
+
+        assert peaks["default"] == 1
+        assert fleet.statuses()[0].status == "succeeded"
+
+    @pytest.mark.anyio
+    async def test_global_concurrency_budget(self, mock_speedtest_output):
+        """Test that no more than the budget of tests run across links"""
+        targets = [FleetTarget(name=str(i), netns=f"ns{i}") for i in range(4)]
+        fleet, peaks = self.make_fleet(targets, mock_speedtest_output, 2)
+
+        await asyncio.gather(*(fleet.run_target(target) for target in targets))
+
+        assert peaks["total"] == 2
+
+    @pytest.mark.anyio
+    async def test_hanging_target_does_not_block_others(self, mock_speedtest_output):
+        """Test that a timed-out target fails without holding up other links"""
+        targets = [
+            FleetTarget(name="slow", netns="a"),
+            FleetTarget(name="fast", netns="b"),
+        ]
+        fleet, _ = self.make_fleet(
+            targets, mock_speedtest_output, 2, delays={"slow": 10}, timeout=0.1
+        )
+
+        slow = asyncio.create_task(fleet.run_target(targets[0]))
+        fast = await fleet.run_target(targets[1])
+
+        assert fast.status == "succeeded"
+        assert not slow.done()
+        status = await slow
+        assert status.status == "failed"
+        assert status.error == "Speedtest timed out"
+
+    @pytest.mark.anyio
+    async def test_one_worker_runs_fleet(self, tmp_path, mock_speedtest_output):
+        """Test that workers sharing a store measure each target once"""
+        target = FleetTarget(name="wan", netns="a")
+        path = str(tmp_path / "shared")
+        stores = [SharedResultStore(path) for _ in range(2)]
+        repositories = [Mock() for _ in stores]
+        fleets = []
+        for store, repository in zip(stores, repositories, strict=True):
+            repository.get_speedtest_results = AsyncMock(
+                return_value=mock_speedtest_output
+            )
+            fleets.append(
+                FleetService(
+                    [target], lambda target, r=repository: r, interval=60, shared=store
+                )
+            )
+
+        for fleet in fleets:
+            fleet.start()
+        while fleets[0].statuses()[0].status != "succeeded":
+            await asyncio.sleep(0.01)
+        for fleet in fleets:
+            await fleet.stop()
+            fleet.shared.close()
+
+        assert repositories[0].get_speedtest_results.await_count == 1
+        assert repositories[1].get_speedtest_results.await_count == 0
+        # The other worker serves the statuses the leader published
+        assert fleets[1].statuses()[0].status == "succeeded"
+        assert fleets[1].statuses()[0].result.download_speed == 99.48
+
+    @pytest.mark.anyio
+    async def test_failure_keeps_last_result(self, mock_speedtest_output):
+        """Test that a failed run keeps the previous successful result"""
+        target = FleetTarget(name="wan")
+        repository = Mock()
+        repository.get_speedtest_results = AsyncMock(
+            side_effect=[mock_speedtest_output, Exception("Speedtest timed out")]
+        )
+        fleet = FleetService([target], lambda target: repository)
+
+        await fleet.run_target(target)
+        status = await fleet.run_target(target)
+
+        assert status.status == "failed"
+        assert status.error == "Speedtest timed out"
+        assert status.result.download_speed == 99.48
+        assert status.last_run is not None
+
+    @pytest.mark.anyio
+    async def test_start_runs_every_target(self, mock_speedtest_output):
+        """Test that started fleets measure each target on its own loop"""
+        targets = [FleetTarget(name="a", netns="a"), FleetTarget(name="b", netns="b")]
+        fleet, _ = self.make_fleet(targets, mock_speedtest_output, 2)
+
+        fleet.start()
+        await asyncio.sleep(0.05)
+        await fleet.stop()
+
+        assert all(status.result is not None for status in fleet.statuses())
+
+
+class TestAgentService:
+    """Test cases for AgentService"""
+
+    @staticmethod
+    def make_coordinator(pushed, fail=False):
+        coordinator = Mock(spec=CoordinatorRepository)
+
+        async def push(site, measurements):
+            if fail:
+                raise httpx.ConnectError("Connection refused")
+            pushed.append((site, list(measurements)))
+            return len(measurements)
+
+        coordinator.push = AsyncMock(side_effect=push)
+        return coordinator
+
+    @pytest.mark.anyio
+    async def test_flush_sends_batches_and_clears_spool(
+        self, tmp_path, make_measurement
+    ):
+        """Test that pending results are pushed in batches and unspooled"""
+        pushed = []
+        spool = SpoolRepository(str(tmp_path / "spool.jsonl"))
+        agent = AgentService("riga", self.make_coordinator(pushed), spool, batch_size=2)
+        for ts in (0, 60, 120):
+            await agent.record(make_measurement(ts))
+
+        assert len(spool.load()) == 3
+        await agent.flush()
+
+        assert [len(batch) for _, batch in pushed] == [2, 1]
+        assert pushed[0][0] == "riga"
+        assert agent.pending == 0
+        assert spool.load() == []
+
+    @pytest.mark.anyio
+    async def test_unreachable_coordinator_keeps_results(
+        self, tmp_path, make_measurement
+    ):
+        """Test that results stay spooled and retries back off while down"""
+        path = str(tmp_path / "spool.jsonl")
+        agent = AgentService(
+            "riga",
+            self.make_coordinator([], fail=True),
+            SpoolRepository(path),
+            batch_size=1,
+            flush_interval=0.01,
+        )
+        await agent.start()
+        await agent.record(make_measurement(0))
+        await asyncio.sleep(0.05)
+        await agent.stop()
+
+        assert agent.failures >= 1
+        assert agent.pending == 1
+        assert agent.retry_delay() == 0.01 * 2 ** (agent.failures - 1)
+
+        # A restarted agent picks the spooled result up again
+        pushed = []
+        restarted = AgentService(
+            "riga", self.make_coordinator(pushed), SpoolRepository(path)
+        )
+        await restarted.start()
+        await restarted.flush()
+        await restarted.stop()
+        assert len(pushed[0][1]) == 1
+
+    @pytest.mark.anyio
+    async def test_full_batch_is_pushed_without_waiting(self, make_measurement):
+        """Test that reaching the batch size triggers a push before the interval"""
+        pushed = []
+        agent = AgentService(
+            "riga",
+            self.make_coordinator(pushed),
+            SpoolRepository(),
+            batch_size=2,
+            flush_interval=60,
+        )
+        await agent.start()
+        await agent.record(make_measurement(0))
+        await agent.record(make_measurement(60))
+        await asyncio.sleep(0.01)
+        await agent.stop()
+
+        assert len(pushed) == 1
+
+    @pytest.mark.anyio
+    async def test_oldest_results_dropped_beyond_limit(self, make_measurement):
+        """Test that the spool keeps at most max_spooled results"""
+        agent = AgentService(
+            "riga", self.make_coordinator([]), SpoolRepository(), max_spooled=2
+        )
+        for ts in (0, 60, 120):
+            await agent.record(make_measurement(ts))
+
+        assert agent.pending == 2
+
+    @pytest.mark.anyio
+    async def test_agents_push_to_coordinator(self, monkeypatch, make_measurement):
+        """Test two agents pushing into a coordinator app end to end"""
+        monkeypatch.setenv("NETSPEED_COORDINATOR", "true")
+        monkeypatch.setenv("NETSPEED_COORDINATOR_TOKEN", "secret")
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+        for site, speed in (("riga", 100.0), ("tallinn", 200.0)):
+            coordinator = CoordinatorRepository(
+                "http://coordinator", token="secret", client=client
+            )
+            agent = AgentService(site, coordinator, SpoolRepository())
+            await agent.record(make_measurement(0, download_speed=speed))
+            await agent.record(make_measurement(60, download_speed=speed))
+            await agent.flush()
+            # Pushing the same results again stores nothing new
+            await coordinator.push(site, [make_measurement(0)])
+
+        response = await client.get("http://coordinator/speed/sites")
+        await client.aclose()
+
+        sites = response.json()
+        assert [(s["site"], s["count"]) for s in sites] == [
+            ("riga", 2),
+            ("tallinn", 2),
+        ]
+        assert sites[1]["latest"]["download_speed"] == 200.0
+
+
+class TestLoopLagMonitor:
+    """Test cases for LoopLagMonitor"""
+
+    @pytest.mark.anyio
+    async def test_blocking_call_shows_up_as_lag(self):
+        """Test that blocking the loop is measured as lag"""
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.03)
+        time.sleep(0.1)
+        await asyncio.sleep(0.03)
+        await monitor.stop()
+
+        assert monitor.max_lag >= 0.05
+
+    @pytest.mark.anyio
+    async def test_idle_loop_has_little_lag(self):
+        """Test that an idle loop reports lag well below a blocking call"""
+        monitor = LoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+        assert monitor.max_lag < 0.05
+
+
+class TestLatencyProbe:
+    """Test cases for LatencyProbe"""
+
+    def make_probe(self, results, window=60):
+        repository = Mock(spec=ProbeRepository)
+        repository.target = "192.0.2.1:443"
+        repository.method = "tcp"
+        repository.probe = AsyncMock(side_effect=results)
+        return LatencyProbe(repository, interval=0.01, window=window)
+
+    @pytest.mark.anyio
+    async def test_ping_jitter_and_loss(self):
+        """Test that round trips and losses are summarised"""
+        probe = self.make_probe([10.0, 14.0, ProbeError("lost"), 12.0])
+        for _ in range(4):
+            await probe.run_once()
+
+        latency = probe.snapshot()
+        assert latency.ping == 12.0
+        # |14 - 10| and |12 - 14|, the lost probe in between is skipped
+        assert latency.jitter == 3.0
+        assert latency.packet_loss == 0.25
+        assert (latency.sent, latency.lost) == (4, 1)
+        assert latency.target == "192.0.2.1:443"
+        assert latency.timestamp is not None
+
+    @pytest.mark.anyio
+    async def test_window_forgets_old_probes(self):
+        """Test that only the last window probes are counted"""
+        probe = self.make_probe([ProbeError("lost"), 10.0, 10.0, 10.0], window=3)
+        for _ in range(4):
+            await probe.run_once()
+
+        latency = probe.snapshot()
+        assert latency.packet_loss == 0.0
+        assert latency.jitter == 0.0
+        assert latency.lost == 1
+
+    def test_snapshot_before_first_probe(self):
+        """Test that nothing is reported before a probe has run"""
+        latency = self.make_probe([]).snapshot()
+
+        assert latency.ping is None
+        assert latency.packet_loss is None
+        assert latency.sent == 0
+
+    @pytest.mark.anyio
+    async def test_start_probes_on_interval_until_stopped(self):
+        """Test that the background task keeps probing until stopped"""
+        probe = self.make_probe([5.0] * 100)
+        probe.start()
+        await asyncio.sleep(0.05)
+        await probe.stop()
+        sent = probe.sent
+        await asyncio.sleep(0.03)
+
+        assert sent >= 2
+        assert probe.sent == sent
+
+
+class TestSpeedStats:
+    """Test cases for the time-bucketed sketch statistics"""
+
+    NOW = 1_752_600_000.0
+
+    @pytest.mark.anyio
+    async def test_quantiles_over_window(self, make_measurement):
+        """Test that quantiles cover the measurements inside the window"""
+        stats = SpeedStats()
+        for i in range(100):
+            await stats.record(
+                make_measurement(self.NOW - 30 * i, download_speed=float(i + 1))
+            )
+
+        result = stats.get_stats(3600, now=self.NOW)
+
+        assert result.count == 100
+        assert result.resolution == 60
+        assert result.download_speed.p50 == pytest.approx(50, rel=0.02)
+        assert result.download_speed.p99 == pytest.approx(99, rel=0.02)
+        assert result.download_speed.max == 100
+
+    @pytest.mark.anyio
+    async def test_window_excludes_older_measurements(self, make_measurement):
+        """Test that measurements before the window are not counted"""
+        stats = SpeedStats()
+        await stats.record(make_measurement(self.NOW - 7200, ping=100.0))
+        await stats.record(make_measurement(self.NOW - 60, ping=10.0))
+
+        hour = stats.get_stats(3600, now=self.NOW)
+        day = stats.get_stats(86400, now=self.NOW)
+
+        assert hour.count == 1
+        assert hour.ping.max == 10.0
+        assert day.count == 2
+        assert day.resolution == 3600
+
+    def test_empty_window(self):
+        """Test that a window without measurements has no summaries"""
+        result = SpeedStats().get_stats(3600, now=self.NOW)
+
+        assert result.count == 0
+        assert result.download_speed is None
+
+    @pytest.mark.anyio
+    async def test_memory_is_bounded(self, make_measurement):
+        """Test that old buckets are reused instead of accumulating"""
+        stats = SpeedStats()
+        # One measurement every 3 hours for three years
+        for i in range(3 * 365 * 8):
+            await stats.record(make_measurement(self.NOW - 10800 * i))
+
+        for tier, (_, size) in zip(stats.tiers, TIERS, strict=True):
+            assert len(tier.slots) == size
+        month = stats.get_stats(30 * 86400, now=self.NOW)
+        assert month.resolution == 86400
+        assert month.count == pytest.approx(30 * 8, abs=8)
+
+
+class TestHealthMonitor:
+    """Test cases for HealthMonitor"""
+
+    @staticmethod
+    async def feed(monitor, make_measurement, start, values, **fixed):
+        # One result a minute, alternating +/-2 around each value
+        for i, value in enumerate(values):
+            await monitor.record(
+                make_measurement(
+                    (start + i) * 60,
+                    **{"download_speed": value + (-2, 2)[i % 2], **fixed},
+                )
+            )
+
+    @pytest.mark.anyio
+    async def test_sustained_drop_degrades_and_recovers(self, make_measurement):
+        """Test that a download drop is detected within a few results"""
+        monitor = HealthMonitor(warmup=10)
+        await self.feed(monitor, make_measurement, 0, [100] * 10)
+        assert monitor.snapshot().state == "learning"
+
+        await self.feed(monitor, make_measurement, 10, [100] * 10)
+        health = monitor.snapshot()
+        assert health.state == "ok"
+        assert health.download_speed.baseline == pytest.approx(100, abs=2)
+
+        await self.feed(monitor, make_measurement, 20, [80] * 3)
+        health = monitor.snapshot()
+        assert health.state == "degraded"
+        assert health.download_speed.state == "degraded"
+        assert health.ping.state == "ok"
+        assert health.download_speed.since.timestamp() == 21 * 60
+
+        await self.feed(monitor, make_measurement, 23, [100] * 12)
+        assert monitor.snapshot().state == "ok"
+
+    @pytest.mark.anyio
+    async def test_single_outlier_and_improvement_ignored(self, make_measurement):
+        """Test that one bad result or a faster link do not count as degraded"""
+        monitor = HealthMonitor(warmup=10)
+        await self.feed(monitor, make_measurement, 0, [100] * 20)
+
+        await self.feed(monitor, make_measurement, 20, [60])
+        await self.feed(monitor, make_measurement, 21, [100] * 5 + [200] * 30)
+
+        health = monitor.snapshot()
+        assert health.state == "ok"
+        assert health.download_speed.baseline > 190
+
+    @pytest.mark.anyio
+    async def test_ping_degrades_upwards(self, make_measurement):
+        """Test that ping counts as degraded when it rises"""
+        monitor = HealthMonitor(warmup=5)
+        await self.feed(monitor, make_measurement, 0, [100] * 10, ping=10.0)
+        await self.feed(monitor, make_measurement, 10, [100] * 5, ping=5.0)
+        assert monitor.snapshot().ping.state == "ok"
+
+        await self.feed(monitor, make_measurement, 15, [100] * 5, ping=40.0)
+        assert monitor.snapshot().ping.state == "degraded"
+
+    @pytest.mark.anyio
+    async def test_webhook_debounced(self, make_measurement, webhook_receiver):
+        """Test that changes are posted at most once per cooldown per metric"""
+        monitor = HealthMonitor(
+            warmup=5, webhook=WebhookRepository(webhook_receiver.url), cooldown=3600
+        )
+        await self.feed(monitor, make_measurement, 0, [100] * 10)
+        await self.feed(monitor, make_measurement, 10, [50] * 3)
+
+        event = await asyncio.wait_for(webhook_receiver.received.get(), 5)
+        assert event["event"] == "degraded"
+        assert event["metric"] == "download_speed"
+        assert event["value"] == pytest.approx(48)
+
+        # Recovers and degrades again within the cooldown: nothing is sent
+        await self.feed(monitor, make_measurement, 13, [100] * 12 + [50] * 3)
+        # Recovered once the cooldown has passed
+        await self.feed(monitor, make_measurement, 120, [100] * 12)
+        await monitor.aclose()
+
+        event = await asyncio.wait_for(webhook_receiver.received.get(), 5)
+        assert event["event"] == "recovered"
+        assert webhook_receiver.received.empty()
+
+
+class TestSpeedBatch:
+    """Test cases for SpeedService.run_batch"""
+
+    @pytest.mark.anyio
+    async def test_batch_reports_median_without_outliers(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that runs are measured in turn and an outlier is left out"""
+        downloads = [100e6, 102e6, 98e6, 101e6, 20e6]
+        mock_request_repository.get_speedtest_results.side_effect = [
+            {**mock_speedtest_output, "download": download} for download in downloads
+        ]
+        cache = ResultCache(ttl=60)
+        service = SpeedService(mock_request_repository, result_cache=cache)
+
+        batch = await service.run_batch(5)
+
+        assert [run.download_speed for run in batch.runs] == [100, 102, 98, 101, 20]
+        assert batch.download_speed == 100.5
+        assert batch.download_spread.outliers == [4]
+        assert batch.download_spread.iqr == pytest.approx(1.75)
+        assert batch.upload_spread.iqr == 0
+        assert batch.server_name == "Riga"
+        assert batch.failed == 0
+        assert cache.latest is batch.runs[-1]
+
+    @pytest.mark.anyio
+    async def test_failed_run_counted_and_skipped(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that a failing run does not cost the batch its other runs"""
+        mock_request_repository.get_speedtest_results.side_effect = [
+            mock_speedtest_output,
+            Exception("Network error"),
+            mock_speedtest_output,
+        ]
+        service = SpeedService(mock_request_repository)
+
+        batch = await service.run_batch(3)
+
+        assert len(batch.runs) == 2
+        assert batch.failed == 1
+
+    @pytest.mark.anyio
+    async def test_rate_limit_stops_batch(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that the hourly cap ends a batch instead of counting as failures"""
+        mock_request_repository.get_speedtest_results.return_value = (
+            mock_speedtest_output
+        )
+        service = SpeedService(
+            mock_request_repository, admission=AdmissionController(global_limit=2)
+        )
+
+        with pytest.raises(RateLimitedError):
+            await service.run_batch(3)
+        assert mock_request_repository.get_speedtest_results.call_count == 2
+
+    @pytest.mark.anyio
+    async def test_batch_measures_each_run_during_speed(
+        self, mock_request_repository, mock_speedtest_output, tmp_path
+    ):
+        """Test that batch runs neither join nor reuse a concurrent speedtest"""
+
+        async def slow_speedtest():
+            await asyncio.sleep(0.05)
+            return mock_speedtest_output
+
+        mock_request_repository.get_speedtest_results.side_effect = slow_speedtest
+        store = SharedResultStore(str(tmp_path / "shared.json"))
+        service = SpeedService(
+            mock_request_repository,
+            result_cache=ResultCache(ttl=60, shared=store),
+            link_lock=LinkLock(store),
+        )
+
+        speed = asyncio.create_task(service.measure())
+        while not mock_request_repository.get_speedtest_results.called:
+            await asyncio.sleep(0)
+        batch = await service.run_batch(3)
+        measurement = await speed
+
+        assert mock_request_repository.get_speedtest_results.call_count == 4
+        assert all(run is not measurement for run in batch.runs)
+        assert len({id(run) for run in batch.runs}) == 3
+        store.close()
+
+    @pytest.mark.anyio
+    async def test_speed_after_batch_run_reuses_it(
+        self, mock_request_repository, mock_speedtest_output
+    ):
+        """Test that /speed waiting on a batch run takes its fresh result"""
+
+        async def slow_speedtest():
+            await asyncio.sleep(0.05)
+            return mock_speedtest_output
+
+        mock_request_repository.get_speedtest_results.side_effect = slow_speedtest
+        service = SpeedService(
+            mock_request_repository,
+            result_cache=ResultCache(ttl=60),
+            link_lock=LinkLock(),
+        )
+
+        batch = asyncio.create_task(service.run_batch(1))
+        while not mock_request_repository.get_speedtest_results.called:
+            await asyncio.sleep(0)
+        measurement = await service.measure()
+
+        assert measurement is (await batch).runs[0]
+        assert mock_request_repository.get_speedtest_results.call_count == 1
+
+    def test_spread_of_few_values(self):
+        """Test that one or two values give a spread without outliers"""
+        assert spread([5.0]).model_dump() == {
+            "median": 5.0,
+            "q1": 5.0,
+            "q3": 5.0,
+            "iqr": 0.0,
+            "outliers": [],
+        }
+        assert spread([1.0, 2.0]).median == 1.5
@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from src.sketch import DDSketch
+
+
+class TestDDSketch:
+    """Test cases for the DDSketch quantile sketch"""
+
+    def test_empty_sketch(self):
+        """Test that an empty sketch has no quantiles or average"""
+        sketch = DDSketch()
+
+        assert sketch.count == 0
+        assert sketch.quantile(0.5) is None
+        assert sketch.avg is None
+
+    def test_quantiles_within_relative_accuracy(self):
+        """Test that quantiles stay within the configured relative error"""
+        rng = random.Random(42)
+        values = sorted(rng.uniform(1, 1000) for _ in range(10_000))
+        sketch = DDSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        for q in (0.5, 0.95, 0.99):
+            expected = values[int(q * (len(values) - 1))]
+            assert sketch.quantile(q) == pytest.approx(expected, rel=0.02)
+
+    def test_exact_count_sum_min_max(self):
+        """Test that count, sum, min and max are tracked exactly"""
+        sketch = DDSketch()
+        for value in (3.0, 1.0, 2.0):
+            sketch.add(value)
+
+        assert sketch.count == 3
+        assert sketch.avg == 2.0
+        assert sketch.min == 1.0
+        assert sketch.max == 3.0
+
+    def test_zero_values(self):
+        """Test that zero speeds are counted in their own bin"""
+        sketch = DDSketch()
+        sketch.add(0.0)
+        sketch.add(0.0)
+        sketch.add(10.0)
+
+        assert sketch.quantile(0.0) == 0.0
+        assert sketch.quantile(1.0) == pytest.approx(10.0, rel=0.01)
+
+    def test_merge_matches_single_sketch(self):
+        """Test that merging two sketches equals adding all values to one"""
+        left, right, combined = DDSketch(), DDSketch(), DDSketch()
+        for value in range(1, 101):
+            (left if value % 2 else right).add(value)
+            combined.add(value)
+
+        left.merge(right)
+
+        assert left.bins == combined.bins
+        assert left.count == combined.count
+        assert left.quantile(0.9) == combined.quantile(0.9)
+
+    def test_bins_are_bounded(self):
+        """Test that the number of bins never exceeds max_bins"""
+        sketch = DDSketch(max_bins=16)
+        for value in range(1, 10_000):
+            sketch.add(value)
+
+        assert len(sketch.bins) <= 16
+        assert sketch.quantile(0.99) == pytest.approx(9900, rel=0.02)
+
+    def test_round_trip_serialization(self):
+        """Test that to_dict/from_dict preserve the sketch"""
+        sketch = DDSketch()
+        for value in (5.0, 50.0, 500.0):
+            sketch.add(value)
+
+        restored = DDSketch.from_dict(sketch.to_dict())
+
+        assert restored.bins == sketch.bins
+        assert restored.count == sketch.count
+        assert restored.min == sketch.min
+        assert restored.quantile(0.5) == sketch.quantile(0.5)